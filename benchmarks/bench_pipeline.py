@@ -0,0 +1,362 @@
+"""
+Synthetic-load benchmark of the whole pipeline on the local stand-ins
+
+Generates N locations x M days of Open-Meteo data (optionally with hourly
+variables, which make every response ~24x larger per variable) and times the
+ingestion Lambda, the transformation Glue job, the PROD publish and the
+metadata extractor against moto, DuckDB and the fake Open-Meteo API from
+local_pipeline/local_stack.py. Per stage it reports records/sec, peak RSS,
+AWS / Athena / Open-Meteo call counts and latency percentiles, and writes
+everything to a JSON file so runs on different commits can be compared.
+
+    python benchmarks/bench_pipeline.py --locations 50 --days 365
+    python benchmarks/bench_pipeline.py --locations 20 --days 90 --hourly temperature_2m,relative_humidity_2m
+    python benchmarks/bench_pipeline.py --compare benchmarks/results/<old>.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import runpy
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAMBDA_DIR = os.path.join(REPO_DIR, 'lambda')
+GLUE_DIR = os.path.join(REPO_DIR, 'glue_jobs')
+RESULTS_DIR = os.path.join(REPO_DIR, 'benchmarks', 'results')
+
+sys.path.insert(0, os.path.join(REPO_DIR, 'local_pipeline'))
+sys.path.insert(0, GLUE_DIR)
+sys.path.insert(0, LAMBDA_DIR)
+
+import boto3  # noqa: E402
+
+from job_args import job_arguments  # noqa: E402
+from local_stack import local_stack  # noqa: E402
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def synthetic_locations(count):
+    """
+    Deterministic grid of stations spread over the inhabited latitudes
+    """
+    columns = max(1, int(count ** 0.5))
+    locations = []
+    for i in range(count):
+        row, column = divmod(i, columns)
+        locations.append({
+            'name': f"synthetic_{i:05d}",
+            'latitude': round(-50.0 + (row * 7.3) % 110.0, 4),
+            'longitude': round(-170.0 + (column * 360.0 / columns) % 340.0, 4)
+        })
+    return locations
+
+
+def percentiles(values):
+    if not values:
+        return None
+    ordered = sorted(values)
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 3)
+
+    return {'count': len(ordered), 'p50': pick(0.50), 'p95': pick(0.95), 'p99': pick(0.99), 'max': round(ordered[-1], 3)}
+
+
+def current_rss():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except OSError:
+        return None
+
+
+class RssSampler:
+    """
+    Samples resident memory in the background while a stage runs
+    Falls back to the process high-water mark where /proc is not available
+    """
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            rss = current_rss()
+            if rss is None:
+                return
+            self.peak = max(self.peak, rss)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.start_rss = current_rss()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        if self.start_rss is None:
+            # ru_maxrss is in KiB on Linux, bytes on macOS
+            maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            self.peak = maxrss if sys.platform == 'darwin' else maxrss * 1024
+        return False
+
+
+class CallRecorder:
+    """
+    Counts and times every botocore API call made by clients created after install()
+    The local Athena stand-in is not a botocore client, so its queries are read
+    from the stand-in's execution log instead
+    """
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def install(self):
+        events = boto3._get_default_session().events
+        events.register('before-call', self._before)
+        events.register('after-call', self._after)
+
+    def _before(self, model, context, **kwargs):
+        context['bench_started'] = time.perf_counter()
+
+    def _after(self, model, context, **kwargs):
+        started = context.get('bench_started')
+        if started is None:
+            return
+        operation = f"{model.service_model.service_name}.{model.name}"
+        with self._lock:
+            self.latencies[operation].append((time.perf_counter() - started) * 1000)
+
+    def take(self):
+        with self._lock:
+            taken, self.latencies = self.latencies, defaultdict(list)
+        return taken
+
+
+class FetchTimer:
+    """
+    Wraps open_meteo_fetcher.fetch_location to keep the per-request latency
+    fetch_locations resolves the module global on each call, so swapping it is enough
+    """
+
+    def __init__(self):
+        import open_meteo_fetcher
+        self.module = open_meteo_fetcher
+        self.original = open_meteo_fetcher.fetch_location
+        self.latencies = []
+
+    def __enter__(self):
+        def timed(*args, **kwargs):
+            result = self.original(*args, **kwargs)
+            self.latencies.append(result['elapsed_seconds'] * 1000)
+            return result
+        self.module.fetch_location = timed
+        return self
+
+    def __exit__(self, *exc):
+        self.module.fetch_location = self.original
+        return False
+
+
+def run_glue_job(script, *args):
+    with job_arguments([script, *args]):
+        try:
+            runpy.run_path(os.path.join(GLUE_DIR, script), run_name='__main__')
+        except SystemExit as e:
+            if e.code not in (None, 0):
+                raise RuntimeError(f"{script} exited with {e.code}")
+
+
+def measure(name, action, stack, recorder, verbose=False):
+    """
+    Run one stage and collect its timings
+    action() returns (records, extra fields); records may be a callable, evaluated
+    after the clock stops so counting the output is not part of the stage
+    """
+    athena_before = set(stack.athena.executions)
+    api_before = stack.api_calls
+    recorder.take()
+    output = io.StringIO()
+    with RssSampler() as rss:
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(sys.stdout if verbose else output):
+            records, extra = action()
+        seconds = time.perf_counter() - started
+
+    queries = [execution['execution'] for qid, execution in stack.athena.executions.items() if qid not in athena_before]
+    failed = [q for q in queries if q['Status']['State'] != 'SUCCEEDED']
+    if failed:
+        raise RuntimeError(f"{name}: Athena query failed: {failed[0]['Status'].get('StateChangeReason')}")
+    aws_latencies = recorder.take()
+    if callable(records):
+        records = records()
+
+    stage = {
+        'wall_seconds': round(seconds, 3),
+        'records': records,
+        'records_per_second': round(records / seconds, 1) if seconds else None,
+        'peak_rss_mb': round(rss.peak / 2 ** 20, 1),
+        'rss_growth_mb': round((rss.peak - rss.start_rss) / 2 ** 20, 1) if rss.start_rss else None,
+        'api_calls': {
+            'open_meteo': stack.api_calls - api_before,
+            'athena_queries': len(queries),
+            'aws': {operation: len(values) for operation, values in sorted(aws_latencies.items())}
+        },
+        'latency_ms': {
+            'athena_query': percentiles([q['Statistics']['TotalExecutionTimeInMillis'] for q in queries]),
+            'aws': {operation: percentiles(values) for operation, values in sorted(aws_latencies.items())}
+        }
+    }
+    stage.update(extra)
+    return stage
+
+
+def count_rows(stack, table):
+    frame = stack.athena.read_sql_query(f"SELECT COUNT(*) AS n FROM {table}")
+    return int(frame['n'][0])
+
+
+def run_benchmark(args):
+    locations = synthetic_locations(args.locations)
+    start = date(2024, 1, 1)
+    end = start + timedelta(days=args.days - 1)
+    hourly = [v for v in args.hourly.split(',') if v] if args.hourly else []
+
+    recorder = CallRecorder()
+    stages = {}
+    with local_stack(LAMBDA_DIR) as stack:
+        stack.set_hourly_variables(hourly)
+        # before any stage creates its clients, so every client inherits the hooks
+        recorder.install()
+
+        def ingest():
+            handler = runpy.run_path(os.path.join(LAMBDA_DIR, 'historical_weather_data_lambda_put_record_batch.py'))
+            with FetchTimer() as timer:
+                summary = handler['lambda_handler'](
+                    {'start_date': start.isoformat(), 'end_date': end.isoformat(), 'locations': locations}, None
+                )
+            if summary.get('locations_failed'):
+                raise RuntimeError(f"ingest: {summary['locations_failed']} location(s) failed")
+            return summary['records_sent'], {
+                'bytes_sent': summary['bytes_sent'],
+                'batches': len(summary['batches']),
+                'latency_ms_open_meteo': percentiles(timer.latencies)
+            }
+
+        def transform():
+            stack.register_raw_table()
+            run_glue_job('create_parquet_weather_table_glue_job.py', '--mode', 'full')
+            return lambda: count_rows(stack, 'open_meteo_weather_data_parquet_tbl'), {}
+
+        def publish():
+            run_glue_job('publish_prod_parquet_weather_table.py', '--mode', 'full')
+            return lambda: count_rows(stack, 'open_meteo_weather_data_parquet_tbl_prod_latest'), {}
+
+        def metadata():
+            handler = runpy.run_path(os.path.join(LAMBDA_DIR, 'weather_data_metadata_extractor.py'))
+            response = handler['lambda_handler']({}, None)
+            body = json.loads(response['body'])
+            if response['statusCode'] != 200:
+                raise RuntimeError(f"metadata: {body.get('message')}")
+            # records here are the S3 objects inventoried
+            summary = body['metadata_summary']
+            return summary['objects_count'], {'total_size_bytes': summary['total_size_bytes']}
+
+        for name, action in (('ingest', ingest), ('transform', transform), ('publish', publish), ('metadata', metadata)):
+            stages[name] = measure(name, action, stack, recorder, args.verbose)
+            print(f"{name:>10}: {stages[name]['wall_seconds']:>8.2f}s  "
+                  f"{stages[name]['records']:>10,} records  "
+                  f"{stages[name]['records_per_second'] or 0:>12,.0f}/s  "
+                  f"peak RSS {stages[name]['peak_rss_mb']:>7.1f} MB")
+
+    return {
+        'benchmark': 'pipeline',
+        'commit': git_commit(),
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'params': {
+            'locations': args.locations,
+            'days': args.days,
+            'hourly_variables': hourly,
+            'start_date': start.isoformat(),
+            'end_date': end.isoformat()
+        },
+        'stages': stages
+    }
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=REPO_DIR,
+                               capture_output=True, text=True, check=True).stdout.strip()
+        return f"{commit}-dirty" if dirty else commit
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old, new):
+    """
+    Print the change of each stage's throughput, wall time and peak RSS against an older result
+    """
+    if old['params'] != new['params']:
+        print(f"note: parameters differ, old {old['params']} vs new {new['params']}")
+    print(f"{'stage':>10}  {'records/s':>22}  {'wall s':>18}  {'peak RSS MB':>18}   ({old.get('commit')} -> {new.get('commit')})")
+    for name, stage in new['stages'].items():
+        before = old['stages'].get(name)
+        if before is None:
+            print(f"{name:>10}  (not in the old result)")
+            continue
+        cells = []
+        for key in ('records_per_second', 'wall_seconds', 'peak_rss_mb'):
+            a, b = before.get(key) or 0, stage.get(key) or 0
+            change = f"{(b - a) / a * 100:+.0f}%" if a else 'n/a'
+            cells.append(f"{b:>11,.1f} {change:>6}")
+        print(f"{name:>10}  {cells[0]:>22}  {cells[1]:>18}  {cells[2]:>18}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--locations', type=int, default=20)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--hourly', default='', help="comma separated hourly variables added to every response")
+    parser.add_argument('--output', help="result JSON (default benchmarks/results/pipeline-<commit>-<time>.json)")
+    parser.add_argument('--compare', help="earlier result JSON to compare this run against")
+    parser.add_argument('--verbose', action='store_true', help="show the stages' own output")
+    args = parser.parse_args()
+
+    result = run_benchmark(args)
+
+    output = args.output
+    if output is None:
+        stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')
+        output = os.path.join(RESULTS_DIR, f"pipeline-{result['commit'] or 'nocommit'}-{stamp}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2)
+    print(f"results written to {output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(json.load(f), result)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Micro-benchmark: records/sec of the Firehose record encoding step
+
+Compares the original per-row str(dict) loop from the ingestion Lambda
+against lambda/record_encoder.py on a synthetic daily response.
+
+    python benchmarks/bench_record_encoding.py --days 3650 --repeat 20
+"""
+import argparse
+import datetime
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda'))
+
+from record_encoder import encode_response
+
+
+def legacy_build_records(r_dict):
+    # verbatim copy of the original loop, kept as the baseline
+    time_list = []
+    for val in r_dict['daily']['time']:
+        time_list.append(val)
+
+    temp_list = []
+    for temp in r_dict['daily']['temperature_2m_max']:
+        if temp == None:
+            temp = 0.0
+        temp_list.append(temp)
+
+    processed_dict = {}
+    records_to_push = []
+    for i in range(len(time_list)):
+        processed_dict['latitude'] = r_dict['latitude']
+        processed_dict['longitude'] = r_dict['longitude']
+        processed_dict['time'] = time_list[i]
+        processed_dict['temp'] = temp_list[i]
+        processed_dict['row_ts'] = str(datetime.datetime.now())
+        msg = str(processed_dict) + '\n'
+        records_to_push.append({'Data': msg})
+    return records_to_push
+
+
+def synthetic_response(days):
+    start = datetime.date(2000, 1, 1)
+    return {
+        'latitude': 40.710335,
+        'longitude': -73.99307,
+        'daily': {
+            'time': [(start + datetime.timedelta(days=i)).isoformat() for i in range(days)],
+            # sprinkle in nulls like the real API returns for missing days
+            'temperature_2m_max': [None if i % 97 == 0 else round(20 + (i % 60) * 0.7, 1) for i in range(days)]
+        }
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--days', type=int, default=3650)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    r_dict = synthetic_response(args.days)
+
+    # the new encoder must produce valid JSON carrying the same values
+    for record in encode_response(r_dict)[:5]:
+        json.loads(record['Data'])
+
+    results = {}
+    for name, fn in (('legacy_str_dict', legacy_build_records), ('ndjson_encoder', encode_response)):
+        best = min(timeit.repeat(lambda: fn(r_dict), number=1, repeat=args.repeat))
+        results[name] = args.days / best
+        print(f"{name:>16}: {results[name]:>12,.0f} records/sec  (best of {args.repeat}, {args.days} records)")
+
+    print(f"{'speedup':>16}: {results['ndjson_encoder'] / results['legacy_str_dict']:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
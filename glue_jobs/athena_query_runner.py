@@ -0,0 +1,185 @@
+import random
+import time
+
+import boto3
+
+# Shared Athena helper for the Glue jobs
+# Ship it next to the job scripts with --extra-py-files s3://.../athena_query_runner.py
+
+TERMINAL_STATES = ("FAILED", "SUCCEEDED", "CANCELLED")
+
+# batch_get_query_execution accepts at most 50 ids per call
+MAX_BATCH_GET = 50
+
+
+class AthenaQueryError(Exception):
+    """
+    Raised when a query ends in FAILED or CANCELLED
+    """
+
+    def __init__(self, result):
+        self.result = result
+        super().__init__(f"Query {result['state']}: {result['state_change_reason']}")
+
+
+def summarize_execution(execution):
+    """
+    Flatten a QueryExecution into the fields the jobs log and report
+    """
+    status = execution["Status"]
+    stats = execution.get("Statistics", {})
+    return {
+        "query_execution_id": execution["QueryExecutionId"],
+        "state": status["State"],
+        "state_change_reason": status.get("StateChangeReason", "Unknown error"),
+        "engine_ms": stats.get("EngineExecutionTimeInMillis", 0),
+        "queue_ms": stats.get("QueryQueueTimeInMillis", 0),
+        "planning_ms": stats.get("QueryPlanningTimeInMillis", 0),
+        "total_ms": stats.get("TotalExecutionTimeInMillis", 0),
+        "bytes_scanned": stats.get("DataScannedInBytes", 0),
+        "output_location": execution.get("ResultConfiguration", {}).get("OutputLocation")
+    }
+
+
+class AthenaQueryRunner:
+    """
+    Starts Athena queries and waits for them without spinning:
+    polling backs off exponentially with jitter, and many queries can be
+    in flight at once with a single batch_get_query_execution per poll
+    """
+
+    def __init__(self, database, output_location, client=None, workgroup=None,
+                 initial_delay=0.25, max_delay=5.0, timeout_seconds=None, metrics=None):
+        self.client = client or boto3.client("athena")
+        # optional instrumentation.Metrics: every finished query is recorded as "athena.query"
+        self.metrics = metrics
+        self.database = database
+        self.output_location = output_location
+        self.workgroup = workgroup
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.timeout_seconds = timeout_seconds
+
+    def start(self, query):
+        """
+        Submit a query and return its execution id
+        """
+        kwargs = {
+            "QueryString": query,
+            "QueryExecutionContext": {"Database": self.database},
+            "ResultConfiguration": {"OutputLocation": self.output_location}
+        }
+        if self.workgroup:
+            kwargs["WorkGroup"] = self.workgroup
+        return self.client.start_query_execution(**kwargs)["QueryExecutionId"]
+
+    def wait(self, execution_ids):
+        """
+        Poll until every execution reaches a terminal state
+        Returns {execution_id: summary}
+        """
+        return self._poll_until(list(execution_ids), wait_for_all=True)
+
+    def run(self, query, raise_on_failure=True):
+        """
+        Run one query to completion and return its summary
+        """
+        return self.run_many([query], raise_on_failure=raise_on_failure)[0]
+
+    def run_many(self, queries, max_concurrency=5, raise_on_failure=True):
+        """
+        Run independent queries with up to max_concurrency in flight
+        Summaries come back in the same order as the queries
+        """
+        results = [None] * len(queries)
+        in_flight = {}
+        next_index = 0
+
+        while next_index < len(queries) or in_flight:
+            while next_index < len(queries) and len(in_flight) < max_concurrency:
+                in_flight[self.start(queries[next_index])] = next_index
+                next_index += 1
+
+            # wait for at least one slot to free up before submitting more
+            done = self._poll_until(list(in_flight), wait_for_all=False)
+            for qid, summary in done.items():
+                index = in_flight.pop(qid)
+                summary["query"] = queries[index]
+                results[index] = summary
+
+        if raise_on_failure:
+            for summary in results:
+                if summary["state"] != "SUCCEEDED":
+                    raise AthenaQueryError(summary)
+        return results
+
+    def fetch_rows(self, summary):
+        """
+        Read a finished SELECT's result set as a list of dicts (all values are strings)
+        """
+        paginator = self.client.get_paginator("get_query_results")
+        header = None
+        rows = []
+        for page in paginator.paginate(QueryExecutionId=summary["query_execution_id"]):
+            for row in page["ResultSet"]["Rows"]:
+                values = [col.get("VarCharValue") for col in row["Data"]]
+                # the first row of a SELECT result is the column header
+                if header is None:
+                    header = values
+                    continue
+                rows.append(dict(zip(header, values)))
+        return rows
+
+    def _poll(self, execution_ids):
+        """
+        One polling round: {execution_id: summary} for the executions that have finished
+        """
+        done = {}
+        for i in range(0, len(execution_ids), MAX_BATCH_GET):
+            reply = self.client.batch_get_query_execution(QueryExecutionIds=execution_ids[i:i + MAX_BATCH_GET])
+            for execution in reply.get("QueryExecutions", []):
+                if execution["Status"]["State"] in TERMINAL_STATES:
+                    summary = summarize_execution(execution)
+                    done[execution["QueryExecutionId"]] = summary
+                    if self.metrics is not None:
+                        self.metrics.record("athena.query", summary["total_ms"], error=summary["state"] != "SUCCEEDED")
+                        self.metrics.count("athena_bytes_scanned", summary["bytes_scanned"])
+        return done
+
+    def _poll_until(self, execution_ids, wait_for_all):
+        started = time.monotonic()
+        attempt = 0
+        finished = {}
+        pending = execution_ids
+
+        while pending:
+            finished.update(self._poll(pending))
+            pending = [qid for qid in pending if qid not in finished]
+            if finished and not wait_for_all:
+                break
+            if not pending:
+                break
+
+            if self.timeout_seconds is not None and time.monotonic() - started > self.timeout_seconds:
+                for qid in pending:
+                    self.client.stop_query_execution(QueryExecutionId=qid)
+                raise TimeoutError(f"Athena queries still running after {self.timeout_seconds}s: {pending}")
+
+            time.sleep(self._delay(attempt))
+            attempt += 1
+
+        return finished
+
+    def _delay(self, attempt):
+        # exponential backoff with jitter, capped at max_delay
+        delay = min(self.max_delay, self.initial_delay * (2 ** attempt))
+        return random.uniform(delay / 2, delay)
+
+
+def format_stats(summary):
+    """
+    One log line of execution statistics
+    """
+    return (f"{summary['state']} in {summary['total_ms']} ms "
+            f"(engine {summary['engine_ms']} ms, queue {summary['queue_ms']} ms), "
+            f"{summary['bytes_scanned'] / (1024 * 1024):.2f} MiB scanned")
@@ -0,0 +1,313 @@
+import sys
+import gzip
+import tempfile
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from athena_query_runner import AthenaQueryRunner, format_stats
+from instrumentation import Metrics
+from job_args import get_job_arg
+from s3_objects import delete_keys
+from s3_uri import split_s3_uri
+
+# AWS Resource Configuration for Weather Data Pipeline
+BUCKET = 'open-meteo-weather-data-parquet-bucket-04142025'
+BUCKET_URL = f's3://{BUCKET}/'
+QUERY_RESULTS_BUCKET_URL = 's3://query-results-location-de-proj-04152025/'
+DATABASE_NAME = 'weather-database-04142025'
+
+# Raw Firehose output (crawled table) and the transformed Parquet table
+SOURCE_TABLE_NAME = 'weather_open_meteo_weather_data_parquet_bucket_04142025'
+TRANSFORMED_TABLE_NAME = 'open_meteo_weather_data_parquet_tbl'
+TRANSFORMED_PREFIX = 'transformed_data/'
+
+# Compacted Parquet partitions are staged here; a leading "_" keeps Athena and the other jobs away from it
+STAGING_PREFIX = f'{TRANSFORMED_PREFIX}_compaction/'
+
+# Everything else the pipeline keeps in BUCKET. When the raw table's location is the bucket
+# root these are skipped, so raw compaction only ever concatenates Firehose output
+SINK_PREFIX = 'sink_data/'
+STATE_PREFIX = '_pipeline_state/'
+NON_RAW_PREFIXES = (TRANSFORMED_PREFIX, STAGING_PREFIX, SINK_PREFIX, STATE_PREFIX)
+
+# --target raw: merge small Firehose objects within each raw prefix (YYYY/MM/DD/HH/)
+# --target parquet: merge small Parquet files within each yr_mo_partition of the transformed table
+# --target all (default): both
+TARGET = get_job_arg('target', 'all')
+TARGET_FILE_BYTES = int(float(get_job_arg('target-file-mb', '128')) * 1024 * 1024)
+# a prefix is only compacted when it holds at least this many files below the target size
+MIN_FILES = int(get_job_arg('min-files', '2'))
+WORKERS = int(get_job_arg('workers', '4'))
+# --measure false skips the before/after Athena scans
+MEASURE = get_job_arg('measure', 'true').lower() != 'false'
+
+# Parquet rows are buffered up to this size before a row group is written,
+# so many tiny source files still give the output sensibly sized row groups
+ROW_GROUP_BYTES = 64 * 1024 * 1024
+READ_BATCH_ROWS = 65536
+
+metrics = Metrics('compact_weather_files', get_job_arg('metrics-location'), {'target': TARGET})
+
+runner = AthenaQueryRunner(DATABASE_NAME, QUERY_RESULTS_BUCKET_URL, client=metrics.client('athena'), metrics=metrics)
+s3_client = metrics.client('s3')
+glue_client = metrics.client('glue')
+
+RUN_ID = uuid.uuid4().hex
+
+def is_hidden(relative_key):
+    # Athena skips any path component starting with "_" or "."
+    return any(part.startswith(('_', '.')) for part in relative_key.split('/'))
+
+def list_groups(bucket, prefix, exclude_prefixes=()):
+    """
+    {directory: [objects]} for every visible file under the prefix, grouped by the directory holding it
+    """
+    groups = {}
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get('Contents', []):
+            key = obj['Key']
+            if key.endswith('/') or is_hidden(key[len(prefix):]):
+                continue
+            if key.startswith(tuple(exclude_prefixes)):
+                continue
+            directory = key.rsplit('/', 1)[0] + '/' if '/' in key else ''
+            groups.setdefault(directory, []).append(obj)
+    return groups
+
+def plan_bins(objects):
+    """
+    Split the small files of one directory into bins of at most TARGET_FILE_BYTES
+    Returns (bins, files left as they are); nothing is binned below MIN_FILES small files
+    """
+    small = sorted((obj for obj in objects if obj['Size'] < TARGET_FILE_BYTES), key=lambda obj: obj['Key'])
+    large = [obj for obj in objects if obj['Size'] >= TARGET_FILE_BYTES]
+    if len(small) < MIN_FILES:
+        return [], objects
+
+    bins, current, size = [], [], 0
+    for obj in small:
+        if current and size + obj['Size'] > TARGET_FILE_BYTES:
+            bins.append(current)
+            current, size = [], 0
+        current.append(obj)
+        size += obj['Size']
+    bins.append(current)
+    # a bin of one file would only rewrite it
+    kept = large + [b[0] for b in bins if len(b) == 1]
+    return [b for b in bins if len(b) > 1], kept
+
+def measure(table):
+    """
+    Bytes scanned and engine time of a full scan, the cost every downstream query pays
+    """
+    summary = runner.run(f'SELECT COUNT(*) AS row_count FROM "{DATABASE_NAME}"."{table}"')
+    rows = runner.fetch_rows(summary)
+    summary['row_count'] = int(rows[0]['row_count']) if rows else None
+    return summary
+
+# raw Firehose objects
+
+def concatenate(bucket, objects, key):
+    """
+    Stream a bin of raw objects into one object; newline-delimited records concatenate as they are
+    Gzipped sources are decompressed and the output gzipped again
+    """
+    compressed = all(obj['Key'].endswith('.gz') for obj in objects)
+    with tempfile.TemporaryFile() as spool:
+        out = gzip.GzipFile(fileobj=spool, mode='wb') if compressed else spool
+        for obj in objects:
+            body = s3_client.get_object(Bucket=bucket, Key=obj['Key'])['Body']
+            source = gzip.GzipFile(fileobj=body, mode='rb') if obj['Key'].endswith('.gz') else body
+            last = b'\n'
+            for chunk in iter(lambda: source.read(1024 * 1024), b''):
+                out.write(chunk)
+                last = chunk[-1:]
+            # a file not ending in a newline would glue its last record to the next file's first
+            if last != b'\n':
+                out.write(b'\n')
+        if compressed:
+            out.close()
+        size = spool.tell()
+        spool.seek(0)
+        # upload_fileobj switches to a multipart upload for large files; the object appears only once complete
+        s3_client.upload_fileobj(spool, bucket, key)
+    return size
+
+def compact_raw_directory(bucket, directory, objects):
+    bins, _ = plan_bins(objects)
+    written = 0
+    for n, objects_in_bin in enumerate(bins):
+        suffix = '.gz' if all(obj['Key'].endswith('.gz') for obj in objects_in_bin) else ''
+        key = f"{directory}compacted-{RUN_ID}-{n:04d}{suffix}"
+        written += concatenate(bucket, objects_in_bin, key)
+        # the compacted object is complete before the originals go; a query in between sees the
+        # records twice, which the create job's keyed dedup removes
+        delete_keys(s3_client, bucket, [obj['Key'] for obj in objects_in_bin])
+    return {
+        'files_before': len(objects),
+        'files_after': len(objects) - sum(len(b) for b in bins) + len(bins),
+        'compacted': sum(len(b) for b in bins),
+        'written_bytes': written
+    }
+
+def compact_raw():
+    source = glue_client.get_table(DatabaseName=DATABASE_NAME, Name=SOURCE_TABLE_NAME)['Table']
+    bucket, prefix = split_s3_uri(source['StorageDescriptor']['Location'])
+    exclude = NON_RAW_PREFIXES if bucket == BUCKET else ()
+    groups = list_groups(bucket, prefix, exclude)
+    return compact_groups('raw', groups, lambda directory, objects: compact_raw_directory(bucket, directory, objects))
+
+# transformed Parquet partitions
+
+def merge_parquet(objects, key):
+    """
+    Stream a bin of Parquet files into one Snappy Parquet file
+    Each source is read a batch at a time; only one row group's worth of rows is held in memory
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = None
+    buffered, buffered_bytes = [], 0
+    with tempfile.TemporaryFile() as spool:
+        for obj in objects:
+            with tempfile.TemporaryFile() as source:
+                s3_client.download_fileobj(BUCKET, obj['Key'], source)
+                source.seek(0)
+                parquet_file = pq.ParquetFile(source)
+                if writer is None:
+                    schema = parquet_file.schema_arrow
+                    writer = pq.ParquetWriter(spool, schema, compression='snappy')
+                for batch in parquet_file.iter_batches(batch_size=READ_BATCH_ROWS):
+                    table = pa.Table.from_batches([batch]).select(schema.names).cast(schema)
+                    buffered.append(table)
+                    buffered_bytes += table.nbytes
+                    if buffered_bytes >= ROW_GROUP_BYTES:
+                        writer.write_table(pa.concat_tables(buffered))
+                        buffered, buffered_bytes = [], 0
+        if buffered:
+            writer.write_table(pa.concat_tables(buffered))
+        writer.close()
+        size = spool.tell()
+        spool.seek(0)
+        s3_client.upload_fileobj(spool, BUCKET, key)
+    return size
+
+def set_partition_location(partition, location):
+    runner.run(f"""
+    ALTER TABLE "{DATABASE_NAME}".{TRANSFORMED_TABLE_NAME}
+    PARTITION (yr_mo_partition='{partition}') SET LOCATION '{location}'
+    """)
+
+def compact_partition(directory, objects):
+    """
+    Swap a partition for its compacted copy without readers ever seeing half of it:
+    1. write the compacted files (and copies of the files kept) to a staging prefix
+    2. point the partition at the staging prefix - one catalog update
+    3. replace the files under the partition's own prefix with the staged ones
+    4. point the partition back at its own prefix and drop the staging copy
+    If the job dies after 2, the partition keeps reading the complete staged copy
+    """
+    bins, kept = plan_bins(objects)
+    if not bins:
+        return {'files_before': len(objects), 'files_after': len(objects), 'compacted': 0, 'written_bytes': 0}
+
+    partition_dir = directory[len(TRANSFORMED_PREFIX):]
+    partition = partition_dir.rstrip('/').split('=', 1)[1]
+    staging = f"{STAGING_PREFIX}{RUN_ID}/{partition_dir}"
+
+    written = 0
+    compacted = []
+    for n, objects_in_bin in enumerate(bins):
+        key = f"{staging}compacted-{RUN_ID}-{n:04d}.snappy.parquet"
+        written += merge_parquet(objects_in_bin, key)
+        compacted.append(key)
+    copies = []
+    for obj in kept:
+        key = f"{staging}{obj['Key'].rsplit('/', 1)[1]}"
+        s3_client.copy({'Bucket': BUCKET, 'Key': obj['Key']}, BUCKET, key)
+        copies.append(key)
+
+    set_partition_location(partition, f"{BUCKET_URL}{staging}")
+    # the kept files never left the partition's prefix; only the merged ones are swapped
+    delete_keys(s3_client, BUCKET, [obj['Key'] for objects_in_bin in bins for obj in objects_in_bin])
+    for key in compacted:
+        s3_client.copy({'Bucket': BUCKET, 'Key': key}, BUCKET, f"{directory}{key.rsplit('/', 1)[1]}")
+    set_partition_location(partition, f"{BUCKET_URL}{directory}")
+    delete_keys(s3_client, BUCKET, compacted + copies)
+
+    return {
+        'files_before': len(objects),
+        'files_after': len(kept) + len(compacted),
+        'compacted': sum(len(b) for b in bins),
+        'written_bytes': written
+    }
+
+def compact_parquet():
+    groups = {
+        directory: objects
+        for directory, objects in list_groups(BUCKET, TRANSFORMED_PREFIX).items()
+        if directory[len(TRANSFORMED_PREFIX):].startswith('yr_mo_partition=')
+    }
+    return compact_groups('parquet', groups, compact_partition)
+
+def compact_groups(target, groups, compact):
+    """
+    Compact every directory of a target side by side and total the results
+    """
+    files_before = sum(len(objects) for objects in groups.values())
+    bytes_before = sum(obj['Size'] for objects in groups.values() for obj in objects)
+    print(f"{target}: {files_before} file(s), {bytes_before} bytes in {len(groups)} prefix(es)")
+
+    with ThreadPoolExecutor(max_workers=WORKERS) as executor:
+        futures = {directory: executor.submit(compact, directory, objects) for directory, objects in groups.items()}
+        results = {directory: future.result() for directory, future in futures.items()}
+
+    for directory, result in sorted(results.items()):
+        if result['compacted']:
+            print(f"  {directory}: {result['files_before']} -> {result['files_after']} file(s)")
+    totals = {
+        'prefixes_compacted': sum(1 for result in results.values() if result['compacted']),
+        'files_before': files_before,
+        'files_after': sum(result['files_after'] for result in results.values()),
+        'bytes_before': bytes_before,
+        'bytes_written': sum(result['written_bytes'] for result in results.values())
+    }
+    for name, value in totals.items():
+        metrics.count(f"{target}_{name}", value)
+    return totals
+
+def report(target, table, compact):
+    before = measure(table) if MEASURE else None
+    with metrics.stage(f"compact_{target}"):
+        totals = compact()
+    print(f"{target}: {totals['files_before']} -> {totals['files_after']} file(s) "
+          f"in {totals['prefixes_compacted']} compacted prefix(es)")
+    if before is None:
+        return
+    after = measure(table)
+    print(f"{target} full scan before: {format_stats(before)}")
+    print(f"{target} full scan after:  {format_stats(after)}")
+    if before['row_count'] != after['row_count']:
+        # raw duplicates are tolerated downstream, but Parquet compaction must not change the table
+        print(f"Warning: {table} had {before['row_count']} row(s) before and {after['row_count']} after compaction")
+    metrics.count(f"{target}_scan_bytes_before", before['bytes_scanned'])
+    metrics.count(f"{target}_scan_bytes_after", after['bytes_scanned'])
+    metrics.count(f"{target}_scan_engine_ms_before", before['engine_ms'])
+    metrics.count(f"{target}_scan_engine_ms_after", after['engine_ms'])
+
+try:
+    if TARGET not in ('all', 'raw', 'parquet'):
+        sys.exit(f"Unknown --target {TARGET}: expected all, raw or parquet")
+    if TARGET in ('all', 'raw'):
+        report('raw', SOURCE_TABLE_NAME, compact_raw)
+    if TARGET in ('all', 'parquet'):
+        report('parquet', TRANSFORMED_TABLE_NAME, compact_parquet)
+
+except Exception as e:
+    error_message = f"Error compacting weather files: {str(e)}"
+    print(error_message)
+    sys.exit(error_message)
+finally:
+    metrics.flush()
@@ -1,5 +1,13 @@
 import sys
-import boto3
+import json
+from datetime import datetime, timezone
+
+from athena_query_runner import AthenaQueryRunner, format_stats
+from instrumentation import Metrics
+from job_args import get_job_arg
+from local_transform import LocalTransform, transformed_schema
+from optional_deps import pyarrow_available
+from s3_objects import delete_prefix
 
 # AWS Resource Configuration for Weather Data Pipeline
 # S3 Buckets
@@ -21,90 +29,372 @@ DATABASE_NAME = 'weather-database-04142025'
 SOURCE_TABLE_NAME = 'weather_open_meteo_weather_data_parquet_bucket_04142025'
 TRANSFORMED_TABLE_NAME = 'open_meteo_weather_data_parquet_tbl'
 PROD_TABLE_NAME = 'open_meteo_weather_data_parquet_tbl_PROD'
+# Rows the ingestion Lambda's Parquet sink wrote (OUTPUT_SINK=parquet), a second input next to the raw JSON
+SINK_TABLE_NAME = 'open_meteo_weather_data_sink_tbl'
 
-client = boto3.client('athena')
+# Transformed data location and where the incremental state is kept
+TRANSFORMED_PREFIX = 'transformed_data/'
+STATE_KEY = '_pipeline_state/create_parquet_weather_table.json'
+# Where the Parquet sink writes; never under TRANSFORMED_PREFIX, which every rebuild rewrites
+SINK_PREFIX = 'sink_data/'
 
-# First drop the existing table if it exists
-drop_query = f"""
-DROP TABLE IF EXISTS "{DATABASE_NAME}".{TRANSFORMED_TABLE_NAME}
-"""
+# --mode incremental (default): rebuild only the yr_mo_partition values with new raw data
+# --mode full: DROP + CTAS over the whole source, the original behaviour
+# incremental falls back to full when there is no previous run or the table is missing
+MODE = get_job_arg('mode', 'incremental')
 
-print(f"Dropping existing table if it exists: {drop_query}")
+# Athena allows at most 100 partitions to be written by one INSERT INTO
+MAX_PARTITIONS_PER_INSERT = 100
 
-try:
-    drop_query_start = client.start_query_execution(
-        QueryString = drop_query,
-        QueryExecutionContext = {
-            'Database': DATABASE_NAME
-        }, 
-        ResultConfiguration = { 'OutputLocation': QUERY_RESULTS_BUCKET_URL}
+# --transform-backend athena: CTAS / INSERT INTO, as before
+# --transform-backend local: transform in this process with Arrow (local_transform.py), Athena only runs DDL
+# --transform-backend auto (default): local when pyarrow is there and the raw data is at most
+# --local-transform-max-mb, Athena otherwise
+TRANSFORM_BACKEND = get_job_arg('transform-backend', 'auto')
+LOCAL_TRANSFORM_MAX_MB = float(get_job_arg('local-transform-max-mb', '256'))
+
+# Athena also caps the partitions added by one ALTER TABLE ADD PARTITION
+MAX_PARTITIONS_PER_ALTER = 100
+
+def transform_select(partitions=None):
+    """
+    The transformation, shared by the full CTAS and the per-partition INSERT INTO
+    Reads the raw JSON and the Parquet sink's rows (temp_F is the sink's copy of temp)
+    Every ingest stamps a new row_ts, so a full-row DISTINCT never collapses re-ingested
+    days; rows are deduplicated on (latitude, longitude, time) and the latest row_ts wins
+    With partitions, both inputs are filtered before the window, so only those partitions are ranked
+    """
+    raw_where = sink_where = ""
+    if partitions is not None:
+        values = ", ".join(f"'{p}'" for p in partitions)
+        raw_where = f"WHERE SUBSTRING(time,1,7) IN ({values})"
+        sink_where = f"WHERE yr_mo_partition IN ({values})"
+    return f"""
+    SELECT latitude, longitude, temp_F, temp_C, row_ts, time, yr_mo_partition
+    FROM (
+        SELECT
+            latitude,
+            longitude,
+            temp AS temp_F,
+            (temp - 32) * (5.0/9.0) AS temp_C,
+            row_ts,
+            time,
+            SUBSTRING(time,1,7) AS yr_mo_partition,
+            ROW_NUMBER() OVER (PARTITION BY latitude, longitude, time ORDER BY row_ts DESC, temp DESC) AS row_rank
+        FROM (
+            SELECT latitude, longitude, temp, row_ts, time
+            FROM "{DATABASE_NAME}"."{SOURCE_TABLE_NAME}"
+            {raw_where}
+            UNION ALL
+            SELECT latitude, longitude, temp_f AS temp, row_ts, time
+            FROM "{DATABASE_NAME}"."{SINK_TABLE_NAME}"
+            {sink_where}
+        )
     )
-    
-    # wait for drop query to finish
-    drop_response = client.get_query_execution(QueryExecutionId=drop_query_start["QueryExecutionId"])
-    resp = ["FAILED", "SUCCEEDED", "CANCELLED"]
-    
-    while drop_response["QueryExecution"]["Status"]["State"] not in resp:
-        drop_response = client.get_query_execution(QueryExecutionId=drop_query_start["QueryExecutionId"])
-    
-    print(f"Drop table status: {drop_response['QueryExecution']['Status']['State']}")
-except Exception as e:
-    print(f"Warning: Error dropping table: {str(e)}")
-    # Continue even if dropping fails
-
-# Now create the new table
-create_query = f"""
-CREATE TABLE "{DATABASE_NAME}".{TRANSFORMED_TABLE_NAME} WITH
-(external_location='{TRANSFORMED_BUCKET_URL}transformed_data/',
-format='PARQUET',
-write_compression='SNAPPY',
-partitioned_by = ARRAY['yr_mo_partition'])
-AS
-SELECT DISTINCT
-    latitude,
-    longitude,
-    temp AS temp_F,
-    (temp - 32) * (5.0/9.0) AS temp_C,
-    row_ts,
-    time,
-    SUBSTRING(time,1,7) AS yr_mo_partition
-FROM "{DATABASE_NAME}"."{SOURCE_TABLE_NAME}"
-"""
-
-print(f"Creating new table: {create_query}")
+    WHERE row_rank = 1
+    """
 
-try:
-    queryStart = client.start_query_execution(
-        QueryString = create_query,
-        QueryExecutionContext = {
-            'Database': DATABASE_NAME
-        }, 
-        ResultConfiguration = { 'OutputLocation': QUERY_RESULTS_BUCKET_URL}
+metrics = Metrics('create_parquet_weather_table', get_job_arg('metrics-location'),
+                  {'mode': MODE, 'transform_backend': TRANSFORM_BACKEND})
+
+runner = AthenaQueryRunner(DATABASE_NAME, QUERY_RESULTS_BUCKET_URL, client=metrics.client('athena'), metrics=metrics)
+s3_client = metrics.client('s3')
+glue_client = metrics.client('glue')
+
+def load_state():
+    """
+    Read the previous run's state, or None if this is the first run
+    """
+    try:
+        obj = s3_client.get_object(Bucket=TRANSFORMED_BUCKET, Key=STATE_KEY)
+    except s3_client.exceptions.NoSuchKey:
+        return None
+    return json.loads(obj['Body'].read())
+
+def save_state(run_started_at, mode, partitions):
+    s3_client.put_object(
+        Bucket=TRANSFORMED_BUCKET,
+        Key=STATE_KEY,
+        Body=json.dumps({
+            'last_run_started_at': run_started_at,
+            'mode': mode,
+            'partitions_rebuilt': partitions
+        }),
+        ContentType='application/json'
+    )
+
+def table_exists():
+    try:
+        glue_client.get_table(DatabaseName=DATABASE_NAME, Name=TRANSFORMED_TABLE_NAME)
+        return True
+    except glue_client.exceptions.EntityNotFoundException:
+        return False
+
+def ensure_sink_table():
+    """
+    Declare the Parquet sink's table if it is not there yet
+    Partition projection makes every month the sink writes readable without MSCK REPAIR TABLE
+    """
+    columns = ",\n        ".join(f"`{field.name}` {'double' if str(field.type) == 'double' else 'string'}"
+                                  for field in transformed_schema())
+    create_query = f"""
+    CREATE EXTERNAL TABLE IF NOT EXISTS "{DATABASE_NAME}".{SINK_TABLE_NAME} (
+        {columns}
+    )
+    PARTITIONED BY (`yr_mo_partition` string)
+    STORED AS PARQUET
+    LOCATION '{TRANSFORMED_BUCKET_URL}{SINK_PREFIX}'
+    TBLPROPERTIES (
+        'parquet.compression'='SNAPPY',
+        'projection.enabled'='true',
+        'projection.yr_mo_partition.type'='date',
+        'projection.yr_mo_partition.format'='yyyy-MM',
+        'projection.yr_mo_partition.range'='1940-01,NOW',
+        'projection.yr_mo_partition.interval'='1',
+        'projection.yr_mo_partition.interval.unit'='MONTHS'
+    )
+    """
+    summary = runner.run(create_query)
+    print(f"Sink table query {format_stats(summary)}")
+
+def find_changed_partitions(since):
+    """
+    yr_mo_partition values that received raw or sink files after `since`
+    "$file_modified_time" lets Athena skip every file older than the last run
+    """
+    query = f"""
+    SELECT DISTINCT SUBSTRING(time,1,7) AS yr_mo_partition
+    FROM "{DATABASE_NAME}"."{SOURCE_TABLE_NAME}"
+    WHERE "$file_modified_time" > from_iso8601_timestamp('{since}')
+    UNION
+    SELECT DISTINCT yr_mo_partition
+    FROM "{DATABASE_NAME}"."{SINK_TABLE_NAME}"
+    WHERE "$file_modified_time" > from_iso8601_timestamp('{since}')
+    """
+    summary = runner.run(query)
+    print(f"Changed partition lookup {format_stats(summary)}")
+    return sorted(row['yr_mo_partition'] for row in runner.fetch_rows(summary) if row['yr_mo_partition'])
+
+def delete_partition_objects(partition):
+    """
+    Remove a partition's Parquet files so INSERT INTO rewrites it from scratch
+    """
+    return delete_prefix(s3_client, TRANSFORMED_BUCKET, f"{TRANSFORMED_PREFIX}yr_mo_partition={partition}/")
+
+def clear_transformed_objects():
+    """
+    Remove every Parquet file of the transformed table before a local full rebuild
+    """
+    return delete_prefix(s3_client, TRANSFORMED_BUCKET, TRANSFORMED_PREFIX)
+
+def local_backend():
+    """
+    The LocalTransform for this run, or None to transform in Athena
+    """
+    if TRANSFORM_BACKEND == 'athena':
+        return None
+    if not pyarrow_available():
+        if TRANSFORM_BACKEND == 'local':
+            sys.exit("--transform-backend local needs pyarrow (--additional-python-modules pyarrow)")
+        print("pyarrow not available, transforming in Athena")
+        return None
+
+    source = glue_client.get_table(DatabaseName=DATABASE_NAME, Name=SOURCE_TABLE_NAME)['Table']
+    backend = LocalTransform(
+        s3_client,
+        source['StorageDescriptor']['Location'],
+        f"{TRANSFORMED_BUCKET_URL}{TRANSFORMED_PREFIX}",
+        sink_location=f"{TRANSFORMED_BUCKET_URL}{SINK_PREFIX}"
+    )
+    raw_mb = backend.raw_bytes() / (1024 * 1024)
+    metrics.count('raw_bytes', backend.raw_bytes())
+    if TRANSFORM_BACKEND == 'auto' and raw_mb > LOCAL_TRANSFORM_MAX_MB:
+        print(f"Raw data is {raw_mb:.1f} MB (> {LOCAL_TRANSFORM_MAX_MB:g} MB), transforming in Athena")
+        return None
+    print(f"Transforming {raw_mb:.1f} MB of raw data in-process")
+    return backend
+
+def add_partitions(backend, partitions):
+    """
+    Register partitions written by the local backend; ones already in the catalog are left alone
+    """
+    statements = []
+    for i in range(0, len(partitions), MAX_PARTITIONS_PER_ALTER):
+        chunk = partitions[i:i + MAX_PARTITIONS_PER_ALTER]
+        specs = " ".join(
+            f"PARTITION (yr_mo_partition='{p}') LOCATION '{backend.partition_location(p)}'" for p in chunk
+        )
+        statements.append(f"""
+        ALTER TABLE "{DATABASE_NAME}".{TRANSFORMED_TABLE_NAME} ADD IF NOT EXISTS {specs}
+        """)
+    for summary in runner.run_many(statements):
+        print(f"Add partitions query {format_stats(summary)}")
+
+def record_written(written):
+    for partition, entry in sorted(written.items()):
+        print(f"Wrote {entry['rows']} row(s), {entry['bytes']} bytes to yr_mo_partition={partition}")
+    metrics.count('rows_written', sum(entry['rows'] for entry in written.values()))
+    metrics.count('parquet_bytes_written', sum(entry['bytes'] for entry in written.values()))
+
+def rebuild_partitions_local(backend, partitions):
+    """
+    rebuild_partitions with the transformation done in-process
+    """
+    for partition in partitions:
+        deleted = delete_partition_objects(partition)
+        print(f"Cleared {deleted} object(s) from partition yr_mo_partition={partition}")
+    written = backend.rebuild(partitions)
+    record_written(written)
+    add_partitions(backend, sorted(written))
+
+def rebuild_partitions(partitions):
+    """
+    Replace only the given partitions; every other partition is left in place
+    """
+    for partition in partitions:
+        deleted = delete_partition_objects(partition)
+        print(f"Cleared {deleted} object(s) from partition yr_mo_partition={partition}")
+
+    inserts = []
+    for i in range(0, len(partitions), MAX_PARTITIONS_PER_INSERT):
+        chunk = partitions[i:i + MAX_PARTITIONS_PER_INSERT]
+        inserts.append(f"""
+        INSERT INTO "{DATABASE_NAME}".{TRANSFORMED_TABLE_NAME}
+        {transform_select(chunk)}
+        """)
+
+    # chunks cover disjoint partitions so they can run side by side
+    for summary in runner.run_many(inserts):
+        print(f"Insert query {format_stats(summary)}")
+
+def drop_table():
+    drop_query = f"""
+    DROP TABLE IF EXISTS "{DATABASE_NAME}".{TRANSFORMED_TABLE_NAME}
+    """
+
+    print(f"Dropping existing table if it exists: {drop_query}")
+
+    try:
+        # wait for drop query to finish
+        drop_response = runner.run(drop_query, raise_on_failure=False)
+        print(f"Drop table status: {drop_response['state']}")
+    except Exception as e:
+        print(f"Warning: Error dropping table: {str(e)}")
+        # Continue even if dropping fails
+
+def full_rebuild_local(backend):
+    """
+    full_rebuild with the transformation done in-process
+    The files match the CTAS output, so the table is declared over them with
+    CREATE EXTERNAL TABLE and its partitions are added explicitly
+    """
+    drop_table()
+    deleted = clear_transformed_objects()
+    print(f"Cleared {deleted} object(s) from {TRANSFORMED_BUCKET_URL}{TRANSFORMED_PREFIX}")
+
+    written = backend.rebuild()
+    record_written(written)
+
+    columns = ",\n        ".join(f"`{field.name}` {'double' if str(field.type) == 'double' else 'string'}"
+                                  for field in transformed_schema())
+    create_query = f"""
+    CREATE EXTERNAL TABLE "{DATABASE_NAME}".{TRANSFORMED_TABLE_NAME} (
+        {columns}
     )
+    PARTITIONED BY (`yr_mo_partition` string)
+    STORED AS PARQUET
+    LOCATION '{TRANSFORMED_BUCKET_URL}{TRANSFORMED_PREFIX}'
+    TBLPROPERTIES ('parquet.compression'='SNAPPY')
+    """
+    print(f"Creating new table: {create_query}")
+    response = runner.run(create_query, raise_on_failure=False)
+    if response["state"] != "SUCCEEDED":
+        error_message = response["state_change_reason"] or response["state"]
+        print(f"Query failed: {error_message}")
+        sys.exit(error_message)
+
+    add_partitions(backend, sorted(written))
+    print(f"Successfully created table {DATABASE_NAME}.{TRANSFORMED_TABLE_NAME}")
+    return response["state"]
 
-    # list of responses
-    resp = ["FAILED", "SUCCEEDED", "CANCELLED"]
+def full_rebuild():
+    """
+    Drop the table and rebuild it from the whole source with CTAS
+    Returns the final state of the CTAS query
+    """
+    # First drop the existing table if it exists
+    drop_table()
 
-    # get the response
-    response = client.get_query_execution(QueryExecutionId=queryStart["QueryExecutionId"])
+    # Now create the new table
+    create_query = f"""
+    CREATE TABLE "{DATABASE_NAME}".{TRANSFORMED_TABLE_NAME} WITH
+    (external_location='{TRANSFORMED_BUCKET_URL}{TRANSFORMED_PREFIX}',
+    format='PARQUET',
+    write_compression='SNAPPY',
+    partitioned_by = ARRAY['yr_mo_partition'])
+    AS
+    {transform_select()}
+    """
+
+    print(f"Creating new table: {create_query}")
 
     # wait until query finishes
     print("Waiting for query to complete...")
-    while response["QueryExecution"]["Status"]["State"] not in resp:
-        response = client.get_query_execution(QueryExecutionId=queryStart["QueryExecutionId"])
-        
+    response = runner.run(create_query, raise_on_failure=False)
+    print(f"Create table query {format_stats(response)}")
+
     # Check if query succeeded
-    if response["QueryExecution"]["Status"]["State"] == "SUCCEEDED":
+    if response["state"] == "SUCCEEDED":
         print(f"Successfully created table {DATABASE_NAME}.{TRANSFORMED_TABLE_NAME}")
     # if it fails, exit and give the Athena error message in the logs
-    elif response["QueryExecution"]["Status"]["State"] == "FAILED":
-        error_message = response["QueryExecution"]["Status"].get("StateChangeReason", "Unknown error")
+    elif response["state"] == "FAILED":
+        error_message = response["state_change_reason"]
         print(f"Query failed: {error_message}")
         sys.exit(error_message)
     else:
-        print(f"Query {response['QueryExecution']['Status']['State']}")
-        
+        print(f"Query {response['state']}")
+
+    return response["state"]
+
+run_started_at = datetime.now(timezone.utc).isoformat()
+
+try:
+    state = load_state() if MODE == 'incremental' else None
+
+    ensure_sink_table()
+
+    with metrics.stage('choose_backend'):
+        backend = local_backend()
+    metrics.count('local_transform', 1 if backend else 0)
+
+    if MODE == 'incremental' and state and table_exists():
+        with metrics.stage('find_changed_partitions'):
+            if backend:
+                partitions = backend.changed_partitions(datetime.fromisoformat(state['last_run_started_at']))
+            else:
+                partitions = find_changed_partitions(state['last_run_started_at'])
+        if partitions:
+            print(f"Incremental run: rebuilding {len(partitions)} partition(s): {partitions}")
+            with metrics.stage('rebuild_partitions'):
+                if backend:
+                    rebuild_partitions_local(backend, partitions)
+                else:
+                    rebuild_partitions(partitions)
+            metrics.count('partitions_rebuilt', len(partitions))
+        else:
+            print(f"Incremental run: no new raw data since {state['last_run_started_at']}")
+        save_state(run_started_at, 'incremental', partitions)
+    else:
+        if MODE == 'incremental':
+            print("Incremental run not possible (no previous state or table missing), falling back to full rebuild")
+        with metrics.stage('full_rebuild'):
+            rebuilt = full_rebuild_local(backend) if backend else full_rebuild()
+        if rebuilt == "SUCCEEDED":
+            save_state(run_started_at, 'full', None)
+
 except Exception as e:
     error_message = f"Error executing Athena query: {str(e)}"
     print(error_message)
-    sys.exit(error_message)
\ No newline at end of file
+    sys.exit(error_message)
+finally:
+    metrics.flush()
@@ -1,6 +1,9 @@
 import sys
 import json
-import boto3
+
+from athena_query_runner import AthenaQueryRunner, format_stats
+from instrumentation import Metrics
+from job_args import get_job_arg
 
 # AWS Resource Configuration for Weather Data Pipeline
 # S3 Buckets
@@ -31,8 +34,10 @@ QUERY_OUTPUT_BUCKET = QUERY_RESULTS_BUCKET_URL
 
 print("Running delete script - DROPPING TABLE ONLY, NOT DELETING S3 OBJECTS")
 
+metrics = Metrics('delete_parquet_weather_table', get_job_arg('metrics-location'))
+
 # drop the table ONLY - do NOT delete objects from S3
-client = boto3.client('athena')
+runner = AthenaQueryRunner(DATABASE_TO_DEL, QUERY_OUTPUT_BUCKET, client=metrics.client('athena'), metrics=metrics)
 
 # Try a simpler approach without quoting the database name
 queryString = f"DROP TABLE IF EXISTS {TABLE_TO_DEL}"
@@ -40,36 +45,24 @@ queryString = f"DROP TABLE IF EXISTS {TABLE_TO_DEL}"
 print(f"Executing query: {queryString}")
 
 try:
-    queryStart = client.start_query_execution(
-        QueryString = queryString,
-        QueryExecutionContext = {
-            'Database': DATABASE_TO_DEL
-        }, 
-        ResultConfiguration = { 'OutputLocation': QUERY_OUTPUT_BUCKET}
-    )
-
-    # list of responses
-    resp = ["FAILED", "SUCCEEDED", "CANCELLED"]
-
-    # get the response
-    response = client.get_query_execution(QueryExecutionId=queryStart["QueryExecutionId"])
-
     # wait until query finishes
-    while response["QueryExecution"]["Status"]["State"] not in resp:
-        response = client.get_query_execution(QueryExecutionId=queryStart["QueryExecutionId"])
-        
+    response = runner.run(queryString, raise_on_failure=False)
+    print(f"Drop table query {format_stats(response)}")
+
     # Check if query succeeded
-    if response["QueryExecution"]["Status"]["State"] == "SUCCEEDED":
+    if response["state"] == "SUCCEEDED":
         print(f"Successfully dropped table {TABLE_TO_DEL} from database {DATABASE_TO_DEL}")
     # if it fails, exit and give the Athena error message in the logs
-    elif response["QueryExecution"]["Status"]["State"] == "FAILED":
-        error_message = response["QueryExecution"]["Status"].get("StateChangeReason", "Unknown error")
+    elif response["state"] == "FAILED":
+        error_message = response["state_change_reason"]
         print(f"Query failed: {error_message}")
         sys.exit(error_message)
     else:
-        print(f"Query {response['QueryExecution']['Status']['State']}")
-        
+        print(f"Query {response['state']}")
+
 except Exception as e:
     error_message = f"Error executing Athena query: {str(e)}"
     print(error_message)
-    sys.exit(error_message)
\ No newline at end of file
+    sys.exit(error_message)
+finally:
+    metrics.flush()
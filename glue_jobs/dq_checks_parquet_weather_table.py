@@ -1,5 +1,18 @@
 import sys
-import awswrangler as wr
+import json
+
+from dq_engine import (
+    AthenaBackend,
+    DuplicateKeyCheck,
+    FreshnessCheck,
+    NullCheck,
+    RangeCheck,
+    RowCountCheck,
+    format_report,
+    run_checks
+)
+from instrumentation import Metrics
+from job_args import get_job_arg
 
 # AWS Resource Configuration for Weather Data Pipeline
 # Database
@@ -8,25 +21,54 @@ DATABASE_NAME = 'weather-database-04142025'
 # Tables
 TRANSFORMED_TABLE_NAME = 'open_meteo_weather_data_parquet_tbl'
 
-# This check counts the number of NULL rows in the temp_C column
-# If any rows are NULL, the check returns a number > 0
-NULL_DQ_CHECK = f"""
-SELECT 
-    SUM(CASE WHEN temp_C IS NULL THEN 1 ELSE 0 END) AS res_col
-FROM "{DATABASE_NAME}"."{TRANSFORMED_TABLE_NAME}"
-;
-"""
+# Optional settings
+# --per-partition true: also report the row-level checks per yr_mo_partition (same single scan)
+# --freshness-days N: fail when the newest day is more than N days old
+PER_PARTITION = get_job_arg('per-partition', 'true').lower() == 'true'
+FRESHNESS_DAYS = get_job_arg('freshness-days')
+
+# Every check is declared once here and compiled into ONE aggregate query,
+# so adding a check does not add another full table scan
+CHECKS = [
+    # The original check: any NULL temp_C fails the run
+    NullCheck('temp_C'),
+    NullCheck('time'),
+    # Plausible surface temperatures
+    RangeCheck('temp_C', -90, 60),
+    RangeCheck('latitude', -90, 90),
+    RangeCheck('longitude', -180, 180),
+    # The create job keeps one row per key, so a duplicate means the transformation is broken
+    DuplicateKeyCheck(['latitude', 'longitude', 'time']),
+    # The table must hold data (table-wide only: an empty partition never appears in a GROUP BY)
+    RowCountCheck(min_rows=1)
+]
+
+if FRESHNESS_DAYS is not None:
+    CHECKS.append(FreshnessCheck('time', int(FRESHNESS_DAYS)))
+
+metrics = Metrics('dq_checks_parquet_weather_table', get_job_arg('metrics-location'))
 
 print(f"Running data quality check on {DATABASE_NAME}.{TRANSFORMED_TABLE_NAME}")
 
-# Run the quality check using the SAME database as the other scripts
-df = wr.athena.read_sql_query(sql=NULL_DQ_CHECK, database=DATABASE_NAME)
-
-# Exit if we get a result > 0
-# Else, the check was successful
-if df['res_col'][0] > 0:
-    error_message = f"Results returned. Quality check failed. Found {df['res_col'][0]} NULL values in temp_C column."
-    print(error_message)
-    sys.exit(error_message)
-else:
-    print('Quality check passed. No NULL values found in temp_C column.')
\ No newline at end of file
+try:
+    # Run the quality checks using the SAME database as the other scripts
+    # awswrangler makes its own Athena calls, so the scan is recorded from the report
+    report = run_checks(CHECKS, AthenaBackend(DATABASE_NAME), TRANSFORMED_TABLE_NAME, per_partition=PER_PARTITION)
+    metrics.record('athena.read_sql_query', report['query_seconds'] * 1000)
+    metrics.count('checks', len(CHECKS))
+    metrics.count('failed_checks', report['failed_checks'])
+    metrics.count('warnings', report['warnings'])
+
+    print(format_report(report))
+    print(json.dumps(report, default=str))
+
+    # Exit if any error-severity check failed
+    # Else, the check was successful
+    if not report['passed']:
+        error_message = f"Results returned. Quality check failed. {report['failed_checks']} check(s) failed."
+        print(error_message)
+        sys.exit(error_message)
+    else:
+        print('Quality check passed.')
+finally:
+    metrics.flush()
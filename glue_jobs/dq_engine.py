@@ -0,0 +1,306 @@
+import time
+
+# Data quality engine for the weather tables
+# Checks are declared once, compiled into a single aggregate query
+# (one table scan for every check) and evaluated by a pluggable backend:
+#   AthenaBackend - runs the compiled query through awswrangler
+#   LocalBackend  - evaluates the same checks on a pandas DataFrame, for tests and local runs
+
+PARTITION_COLUMN = "yr_mo_partition"
+
+# Rows whose partition value is NULL are reported under the name Hive gives that
+# partition, so they can never be mistaken for the table-wide totals (partition None)
+NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+
+class Check:
+    """
+    Base class: a check is one aggregate metric plus a pass condition
+    severity "error" fails the run, "warn" is only reported
+    table_only checks are not meaningful per partition (e.g. freshness)
+    """
+
+    table_only = False
+
+    def __init__(self, name, severity="error"):
+        self.name = name
+        self.severity = severity
+
+    def sql_expression(self):
+        raise NotImplementedError
+
+    def local_value(self, df):
+        raise NotImplementedError
+
+    def passed(self, value):
+        raise NotImplementedError
+
+    def message(self, value):
+        raise NotImplementedError
+
+
+class NullCheck(Check):
+    """
+    No NULL values in a column
+    """
+
+    def __init__(self, column, severity="error"):
+        super().__init__(f"null_{column}", severity)
+        self.column = column
+
+    def sql_expression(self):
+        return f"SUM(CASE WHEN {self.column} IS NULL THEN 1 ELSE 0 END)"
+
+    def local_value(self, df):
+        return int(df[self.column.lower()].isna().sum())
+
+    def passed(self, value):
+        return (value or 0) == 0
+
+    def message(self, value):
+        return f"Found {value or 0} NULL values in {self.column} column"
+
+
+class RangeCheck(Check):
+    """
+    Every non-NULL value of a column lies within [min_value, max_value]
+    """
+
+    def __init__(self, column, min_value, max_value, severity="error"):
+        super().__init__(f"range_{column}", severity)
+        self.column = column
+        self.min_value = min_value
+        self.max_value = max_value
+
+    def sql_expression(self):
+        return (f"SUM(CASE WHEN {self.column} < {self.min_value} "
+                f"OR {self.column} > {self.max_value} THEN 1 ELSE 0 END)")
+
+    def local_value(self, df):
+        col = df[self.column.lower()]
+        return int(((col < self.min_value) | (col > self.max_value)).sum())
+
+    def passed(self, value):
+        return (value or 0) == 0
+
+    def message(self, value):
+        return f"Found {value or 0} values of {self.column} outside [{self.min_value}, {self.max_value}]"
+
+
+class DuplicateKeyCheck(Check):
+    """
+    No two rows share the same key
+    NULL key values compare equal, in SQL (DISTINCT over a ROW) and in pandas alike
+    """
+
+    def __init__(self, columns, severity="error"):
+        super().__init__(f"duplicate_{'_'.join(columns)}", severity)
+        self.columns = columns
+
+    def sql_expression(self):
+        return f"COUNT(*) - COUNT(DISTINCT ROW({', '.join(self.columns)}))"
+
+    def local_value(self, df):
+        return int(df.duplicated(subset=[col.lower() for col in self.columns]).sum())
+
+    def passed(self, value):
+        return (value or 0) == 0
+
+    def message(self, value):
+        return f"Found {value or 0} duplicate rows on ({', '.join(self.columns)})"
+
+
+class FreshnessCheck(Check):
+    """
+    The newest value of an ISO date column is at most max_age_days old
+    """
+
+    table_only = True
+
+    def __init__(self, column, max_age_days, severity="error"):
+        super().__init__(f"freshness_{column}", severity)
+        self.column = column
+        self.max_age_days = max_age_days
+
+    def sql_expression(self):
+        return f"date_diff('day', CAST(SUBSTRING(MAX({self.column}), 1, 10) AS DATE), current_date)"
+
+    def local_value(self, df):
+        import pandas as pd
+        newest = pd.to_datetime(df[self.column.lower()].str.slice(0, 10)).max()
+        if pd.isna(newest):
+            return None
+        return int((pd.Timestamp.now().normalize() - newest).days)
+
+    def passed(self, value):
+        return value is not None and value <= self.max_age_days
+
+    def message(self, value):
+        return f"Newest {self.column} is {value} day(s) old (limit {self.max_age_days})"
+
+
+class RowCountCheck(Check):
+    """
+    At least min_rows rows in the table
+    Only evaluated table-wide: GROUP BY never yields an empty partition, so a
+    per-partition count could not fail
+    """
+
+    table_only = True
+
+    def __init__(self, min_rows=1, severity="error"):
+        super().__init__("row_count", severity)
+        self.min_rows = min_rows
+
+    def sql_expression(self):
+        return "COUNT(*)"
+
+    def local_value(self, df):
+        return int(len(df))
+
+    def passed(self, value):
+        return (value or 0) >= self.min_rows
+
+    def message(self, value):
+        return f"{value or 0} rows (minimum {self.min_rows})"
+
+
+def compile_query(checks, database, table, per_partition=False):
+    """
+    One SELECT computing every check's metric in a single scan
+    Metric i is returned as column c_i
+    per_partition uses GROUPING SETS so the same scan also yields the
+    table-wide totals, the row where is_total = 1 (yr_mo_partition itself
+    can be NULL in a real partition too)
+    """
+    select = [f"{check.sql_expression()} AS c_{i}" for i, check in enumerate(checks)]
+    if per_partition:
+        select[:0] = [PARTITION_COLUMN, f"GROUPING({PARTITION_COLUMN}) AS is_total"]
+    columns = ",\n    ".join(select)
+    query = f'SELECT\n    {columns}\nFROM "{database}"."{table}"'
+    if per_partition:
+        query += f"\nGROUP BY GROUPING SETS (({PARTITION_COLUMN}), ())"
+    return query
+
+
+class AthenaBackend:
+    """
+    Runs the compiled query with awswrangler and returns one row of metrics per group
+    """
+
+    def __init__(self, database):
+        self.database = database
+
+    def metrics(self, checks, table, per_partition):
+        import awswrangler as wr
+
+        sql = compile_query(checks, self.database, table, per_partition)
+        started = time.perf_counter()
+        df = wr.athena.read_sql_query(sql=sql, database=self.database)
+        elapsed = time.perf_counter() - started
+
+        rows = []
+        for record in df.to_dict("records"):
+            values = [_plain(record[f"c_{i}"]) for i in range(len(checks))]
+            if per_partition and not _plain(record["is_total"]):
+                partition = _plain(record[PARTITION_COLUMN]) or NULL_PARTITION
+            else:
+                partition = None
+            # the single scan is shared by every check
+            rows.append((partition, values, [elapsed] * len(checks)))
+        return rows, elapsed
+
+
+class LocalBackend:
+    """
+    Evaluates the checks directly on a pandas DataFrame, e.g. one loaded with
+    awswrangler.s3.read_parquet(path, dataset=True)
+    """
+
+    def __init__(self, df):
+        self.df = df.rename(columns=str.lower)
+
+    def metrics(self, checks, table, per_partition):
+        started = time.perf_counter()
+        # the whole table first, then each partition - same rows GROUPING SETS returns
+        groups = [(None, self.df)]
+        if per_partition:
+            groups.extend((_plain(partition) or NULL_PARTITION, group)
+                          for partition, group in self.df.groupby(PARTITION_COLUMN, sort=True, dropna=False))
+
+        rows = []
+        for partition, group in groups:
+            values = []
+            timings = []
+            for check in checks:
+                check_started = time.perf_counter()
+                values.append(check.local_value(group))
+                timings.append(time.perf_counter() - check_started)
+            rows.append((partition, values, timings))
+        return rows, time.perf_counter() - started
+
+
+def _plain(value):
+    # numpy / pandas scalars and NaN to plain Python values
+    if value is None:
+        return None
+    try:
+        if value != value:
+            return None
+    except (TypeError, ValueError):
+        pass
+    return value.item() if hasattr(value, "item") else value
+
+
+def run_checks(checks, backend, table, per_partition=False):
+    """
+    Evaluate every check with one pass of the backend and return a structured report
+    """
+    started = time.perf_counter()
+    rows, query_seconds = backend.metrics(checks, table, per_partition)
+
+    results = []
+    # table-wide row first, partitions in order
+    rows = sorted(rows, key=lambda row: (row[0] is not None, row[0] or ""))
+    for partition, values, timings in rows:
+        for check, value, seconds in zip(checks, values, timings):
+            if partition is not None and check.table_only:
+                continue
+            results.append({
+                "check": check.name,
+                "severity": check.severity,
+                "partition": partition,
+                "value": value,
+                "passed": check.passed(value),
+                "message": check.message(value),
+                "seconds": seconds
+            })
+
+    failed = [r for r in results if not r["passed"] and r["severity"] == "error"]
+    warnings = [r for r in results if not r["passed"] and r["severity"] != "error"]
+    return {
+        "table": table,
+        "per_partition": per_partition,
+        "passed": not failed,
+        "failed_checks": len(failed),
+        "warnings": len(warnings),
+        "query_seconds": query_seconds,
+        "total_seconds": time.perf_counter() - started,
+        "results": results
+    }
+
+
+def format_report(report):
+    """
+    Human-readable report lines for the job log
+    """
+    lines = [
+        f"DQ report for {report['table']}: {'PASSED' if report['passed'] else 'FAILED'} "
+        f"({report['failed_checks']} failed, {report['warnings']} warning(s), "
+        f"scan {report['query_seconds']:.2f}s)"
+    ]
+    for r in report["results"]:
+        status = "PASS" if r["passed"] else ("FAIL" if r["severity"] == "error" else "WARN")
+        where = f" [{r['partition']}]" if r["partition"] is not None else ""
+        lines.append(f"  {status} {r['check']}{where}: {r['message']} ({r['seconds'] * 1000:.1f} ms)")
+    return "\n".join(lines)
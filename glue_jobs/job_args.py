@@ -0,0 +1,38 @@
+import sys
+import threading
+from contextlib import contextmanager
+
+# Arguments of jobs run in-process by the local orchestrator, per thread,
+# so stages running side by side do not share sys.argv
+_local = threading.local()
+
+
+@contextmanager
+def job_arguments(argv):
+    """
+    Make get_job_arg read `argv` instead of sys.argv in the current thread
+    """
+    previous = getattr(_local, "argv", None)
+    _local.argv = list(argv)
+    try:
+        yield
+    finally:
+        _local.argv = previous
+
+
+def get_job_arg(name, default=None, argv=None):
+    """
+    Read an optional `--name value` Glue job argument
+    awsglue.utils.getResolvedOptions fails on arguments that were not passed,
+    so optional settings are read straight from sys.argv
+    """
+    if argv is None:
+        argv = getattr(_local, "argv", None)
+    argv = sys.argv if argv is None else argv
+    flag = f"--{name}"
+    for i, arg in enumerate(argv):
+        if arg == flag and i + 1 < len(argv):
+            return argv[i + 1]
+        if arg.startswith(f"{flag}="):
+            return arg.split("=", 1)[1]
+    return default
@@ -0,0 +1,262 @@
+import ast
+import gzip
+import io
+import json
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from s3_uri import split_s3_uri
+
+# In-process alternative to the create job's Athena CTAS / INSERT INTO
+# Reads the raw Firehose JSON straight from S3 and applies the same transformation
+# with Arrow: temp -> temp_F, (temp - 32) * (5.0/9.0) -> temp_C,
+# SUBSTRING(time,1,7) -> yr_mo_partition, then one row per (latitude, longitude, time),
+# the latest row_ts winning. The ingestion Lambda's Parquet sink files are read as a
+# second input, as the create job's SQL reads the sink table.
+# Each partition is written as one Snappy Parquet file with the CTAS's columns,
+# so readers cannot tell which backend wrote it. Small deltas skip Athena's query
+# startup and minimum scan charge entirely; the jobs only run catalog DDL.
+# Needs pyarrow (Glue Python shell with the analytics libraries, or --additional-python-modules)
+# Ship it next to the job scripts with --extra-py-files s3://.../local_transform.py (and lambda/s3_uri.py, lambda/optional_deps.py)
+
+PARTITION_COLUMN = 'yr_mo_partition'
+
+# Athena's name for the partition of rows whose key is NULL
+NULL_PARTITION = '__HIVE_DEFAULT_PARTITION__'
+
+READ_MAX_WORKERS = 16
+
+
+def raw_schema():
+    import pyarrow as pa
+    # the record layout written by record_encoder.py
+    return pa.schema([
+        ('latitude', pa.float64()),
+        ('longitude', pa.float64()),
+        ('time', pa.string()),
+        ('temp', pa.float64()),
+        ('row_ts', pa.string())
+    ])
+
+
+def transformed_schema():
+    import pyarrow as pa
+    # what the CTAS writes: Athena lowercases temp_F / temp_C, and the partition key lives in the path
+    return pa.schema([
+        ('latitude', pa.float64()),
+        ('longitude', pa.float64()),
+        ('temp_f', pa.float64()),
+        ('temp_c', pa.float64()),
+        ('row_ts', pa.string()),
+        ('time', pa.string())
+    ])
+
+
+def parse_records(body):
+    """
+    Raw file bytes -> Arrow table with the raw schema
+    Files from before the NDJSON encoder hold Python dict reprs, which pyarrow cannot read;
+    those fall back to a line-by-line parse
+    """
+    import pyarrow as pa
+    import pyarrow.json as pj
+
+    schema = raw_schema()
+    try:
+        return pj.read_json(
+            io.BytesIO(body),
+            parse_options=pj.ParseOptions(explicit_schema=schema, unexpected_field_behavior='ignore')
+        )
+    except pa.ArrowInvalid:
+        rows = []
+        for line in body.decode('utf-8').splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                rows.append(json.loads(line))
+            except ValueError:
+                rows.append(ast.literal_eval(line))
+        return pa.Table.from_pylist([{name: row.get(name) for name in schema.names} for row in rows], schema=schema)
+
+
+def parse_sink_file(body):
+    """
+    A Parquet sink file -> Arrow table with the raw schema (the sink's temp_f is the raw temp)
+    """
+    import pyarrow.parquet as pq
+
+    table = pq.read_table(io.BytesIO(body), columns=['latitude', 'longitude', 'time', 'temp_f', 'row_ts'])
+    return table.rename_columns(['latitude', 'longitude', 'time', 'temp', 'row_ts']).cast(raw_schema())
+
+
+def latest_per_key(table):
+    """
+    Keep one row per (latitude, longitude, time): the one with the latest row_ts
+    Same ranking as the create job's ROW_NUMBER() ... ORDER BY row_ts DESC, temp DESC
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    if table.num_rows == 0:
+        return table
+    table = table.sort_by([('latitude', 'ascending'), ('longitude', 'ascending'), ('time', 'ascending'),
+                           ('row_ts', 'descending'), ('temp_f', 'descending')])
+    # nulls are one key value, as in PARTITION BY, so compare the key as text with nulls filled in
+    key = pc.binary_join_element_wise(
+        *[pc.fill_null(pc.cast(table[name], pa.string()), '\x00') for name in ('latitude', 'longitude', 'time')],
+        '|'
+    )
+    first = pc.not_equal(key.slice(1), key.slice(0, len(key) - 1))
+    return table.filter(pa.chunked_array([pa.array([True])] + first.chunks, pa.bool_()))
+
+
+def transform(raw, partitions=None):
+    """
+    The create job's transform_select() on an Arrow table, optionally limited to some partitions
+    Returns the deduplicated rows with the transformed columns plus yr_mo_partition
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    partition = pc.utf8_slice_codeunits(raw['time'], 0, 7)
+    table = pa.table({
+        'latitude': raw['latitude'],
+        'longitude': raw['longitude'],
+        'temp_f': raw['temp'],
+        'temp_c': pc.multiply(pc.subtract(raw['temp'], 32.0), 5.0 / 9.0),
+        'row_ts': raw['row_ts'],
+        'time': raw['time'],
+        PARTITION_COLUMN: partition
+    })
+    if partitions is not None:
+        table = table.filter(pc.is_in(partition, value_set=pa.array(sorted(partitions), type=pa.string())))
+    return latest_per_key(table)
+
+
+class LocalTransform:
+    """
+    Reads every raw file under raw_location (and every Parquet sink file under
+    sink_location), transforms in memory and writes
+    s3://target/yr_mo_partition=VALUE/<run id>.snappy.parquet
+    Parsed input files are kept for the run, so finding the changed partitions
+    and rebuilding them reads each file once
+    """
+
+    def __init__(self, s3_client, raw_location, target_location, max_workers=READ_MAX_WORKERS, sink_location=None):
+        self.s3_client = s3_client
+        self.raw_bucket, self.raw_prefix = split_s3_uri(raw_location)
+        self.target_bucket, self.target_prefix = split_s3_uri(target_location)
+        self.sink_bucket, self.sink_prefix = split_s3_uri(sink_location) if sink_location else (None, None)
+        self.max_workers = max_workers
+        self._objects = None
+        self._parsed = {}
+
+    def _list(self, bucket, prefix, skip=()):
+        # hidden files (_ or . names) are skipped, as Athena would
+        objects = []
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                key = obj['Key']
+                if key.endswith('/') or any(key.startswith(other) for other in skip):
+                    continue
+                if any(part.startswith(('_', '.')) for part in key[len(prefix):].split('/')):
+                    continue
+                objects.append(dict(obj, Bucket=bucket))
+        return objects
+
+    def raw_objects(self):
+        """
+        Every input file: the raw data files, then the sink's Parquet files
+        The target and sink prefixes are never read as raw data
+        """
+        if self._objects is None:
+            skip = [prefix for bucket, prefix in ((self.target_bucket, self.target_prefix),
+                                                  (self.sink_bucket, self.sink_prefix))
+                    if bucket == self.raw_bucket]
+            objects = self._list(self.raw_bucket, self.raw_prefix, skip)
+            if self.sink_bucket:
+                objects += [dict(obj, Sink=True) for obj in self._list(self.sink_bucket, self.sink_prefix)
+                            if obj['Key'].endswith('.parquet')]
+            self._objects = objects
+        return self._objects
+
+    def raw_bytes(self):
+        return sum(obj['Size'] for obj in self.raw_objects())
+
+    def _read(self, objects):
+        import pyarrow as pa
+
+        def read(obj):
+            key = (obj['Bucket'], obj['Key'])
+            if key not in self._parsed:
+                body = self.s3_client.get_object(Bucket=obj['Bucket'], Key=obj['Key'])['Body'].read()
+                if obj.get('Sink'):
+                    self._parsed[key] = parse_sink_file(body)
+                    return self._parsed[key]
+                if obj['Key'].endswith('.gz'):
+                    body = gzip.decompress(body)
+                self._parsed[key] = parse_records(body)
+            return self._parsed[key]
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            tables = list(executor.map(read, objects))
+        if not tables:
+            return raw_schema().empty_table()
+        return pa.concat_tables(tables)
+
+    def changed_partitions(self, since):
+        """
+        yr_mo_partition values found in input files modified after `since` (an aware datetime)
+        The in-process counterpart of the job's "$file_modified_time" lookup
+        """
+        import pyarrow.compute as pc
+
+        recent = [obj for obj in self.raw_objects() if obj['LastModified'] > since]
+        raw = self._read(recent)
+        values = pc.unique(pc.utf8_slice_codeunits(raw['time'], 0, 7)).to_pylist()
+        return sorted(value for value in values if value)
+
+    def rebuild(self, partitions=None):
+        """
+        Transform the raw data and write one file per partition (all partitions when None)
+        The caller clears the target partitions first and registers them afterwards
+        Returns {partition value: {"key", "rows", "bytes"}}
+        """
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.parquet as pq
+
+        table = transform(self._read(self.raw_objects()), partitions)
+        keys = table[PARTITION_COLUMN]
+        run_id = uuid.uuid4().hex
+        schema = transformed_schema()
+
+        written = {}
+        for value in pc.unique(keys).to_pylist():
+            mask = pc.is_null(keys) if value is None else pc.equal(keys, value)
+            part = table.filter(mask).drop_columns([PARTITION_COLUMN]).select(schema.names).cast(schema)
+            # sorted rows give every file tight min/max statistics per location and day
+            part = part.sort_by([('latitude', 'ascending'), ('longitude', 'ascending'), ('time', 'ascending')])
+            buf = io.BytesIO()
+            pq.write_table(part, buf, compression='snappy')
+            body = buf.getvalue()
+            partition = NULL_PARTITION if value is None else value
+            key = f"{self.target_prefix}{PARTITION_COLUMN}={partition}/{run_id}.snappy.parquet"
+            self.s3_client.put_object(Bucket=self.target_bucket, Key=key, Body=body)
+            written[partition] = {'key': key, 'rows': part.num_rows, 'bytes': len(body)}
+        return written
+
+    def partition_location(self, partition):
+        return f"s3://{self.target_bucket}/{self.target_prefix}{PARTITION_COLUMN}={partition}/"
+
+
+def rows_to_table(rows):
+    """
+    Raw records given as dicts -> Arrow table, for running transform() without S3
+    """
+    import pyarrow as pa
+
+    schema = raw_schema()
+    return pa.Table.from_pylist([{name: row.get(name) for name in schema.names} for row in rows], schema=schema)
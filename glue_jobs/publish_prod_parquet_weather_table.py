@@ -1,25 +1,212 @@
 import sys
-import boto3
+import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+from athena_query_runner import AthenaQueryRunner, format_stats
+from instrumentation import Metrics
+from job_args import get_job_arg
+
 QUERY_RESULTS_BUCKET = 's3://query-results-location-de-proj-04152025/'
 MY_DATABASE = 'weather-database-04142025'
 SOURCE_PARQUET_TABLE_NAME = 'open_meteo_weather_data_parquet_tbl'
 NEW_PROD_PARQUET_TABLE_NAME = 'open_meteo_weather_data_parquet_tbl_PROD'
 NEW_PROD_PARQUET_TABLE_S3_BUCKET = 's3://parquet-weather-table-prod-04142025/'
 
+# Where the transformed table's partitions live
+SOURCE_BUCKET = 'open-meteo-weather-data-parquet-bucket-04142025'
+SOURCE_PREFIX = 'transformed_data/'
+PROD_BUCKET = 'parquet-weather-table-prod-04142025'
+
+# Stable name Grafana and the metadata extractor read from
+# it is repointed at the newest version at the end of every publish
+LATEST_VIEW_NAME = 'open_meteo_weather_data_parquet_tbl_prod_latest'
+LATEST_MANIFEST_KEY = '_latest/manifest.json'
+
+# --mode delta (default): copy only partitions whose content changed,
+#   share unchanged partitions with the previous version
+# --mode full: CTAS copy of the whole table, the original behaviour
+MODE = get_job_arg('mode', 'delta')
+COPY_WORKERS = int(get_job_arg('copy-workers', '16'))
+
+# Athena accepts many partitions per ALTER TABLE ADD PARTITION; keep statements a sensible size
+PARTITIONS_PER_ALTER = 100
+
 # create a string with the current UTC datetime
 # convert all special characters to underscores
 # this will be used in the table name and in the bucket path in S3 where the table is stored
 DATETIME_NOW_INT_STR = str(datetime.now()).replace('-', '_').replace(' ', '_').replace(':', '_').replace('.', '_')
 
-client = boto3.client('athena')
+NEW_TABLE_NAME = f"{NEW_PROD_PARQUET_TABLE_NAME}_{DATETIME_NOW_INT_STR}".lower()
+
+metrics = Metrics('publish_prod_parquet_weather_table', get_job_arg('metrics-location'), {'mode': MODE})
+
+runner = AthenaQueryRunner(MY_DATABASE, QUERY_RESULTS_BUCKET, client=metrics.client('athena'), metrics=metrics)
+s3_client = metrics.client('s3')
+glue_client = metrics.client('glue')
+
+def list_partitions(bucket, prefix):
+    """
+    {partition value: [objects]} for every yr_mo_partition=... under the prefix
+    """
+    partitions = {}
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get('Contents', []):
+            relative = obj['Key'][len(prefix):]
+            if not relative.startswith('yr_mo_partition=') or '/' not in relative:
+                continue
+            value = relative.split('/', 1)[0].split('=', 1)[1]
+            partitions.setdefault(value, []).append(obj)
+    return partitions
+
+def fingerprint(objects):
+    """
+    Content fingerprint of a partition: sizes and ETags, ignoring file names
+    """
+    digest = hashlib.sha256()
+    for size, etag in sorted((obj['Size'], obj['ETag']) for obj in objects):
+        digest.update(f"{size}:{etag}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+def load_latest_manifest():
+    try:
+        obj = s3_client.get_object(Bucket=PROD_BUCKET, Key=LATEST_MANIFEST_KEY)
+    except s3_client.exceptions.NoSuchKey:
+        return None
+    return json.loads(obj['Body'].read())
+
+def partition_destination(partition):
+    return f"{DATETIME_NOW_INT_STR}/yr_mo_partition={partition}/"
+
+def copy_object(source_key, destination_prefix):
+    """
+    Server-side copy of one file into this version's prefix - no bytes pass through the job
+    """
+    file_name = source_key.rsplit('/', 1)[1]
+    s3_client.copy(
+        {'Bucket': SOURCE_BUCKET, 'Key': source_key},
+        PROD_BUCKET,
+        f"{destination_prefix}{file_name}"
+    )
+
+def source_columns():
+    """
+    Non-partition columns of the transformed table, as Athena DDL
+    """
+    table = glue_client.get_table(DatabaseName=MY_DATABASE, Name=SOURCE_PARQUET_TABLE_NAME)['Table']
+    return ",\n        ".join(
+        f"`{col['Name']}` {col['Type']}" for col in table['StorageDescriptor']['Columns']
+    )
+
+def register_version_table(partitions):
+    """
+    Create the versioned table and point each partition at wherever its files live
+    """
+    runner.run(f"""
+    CREATE EXTERNAL TABLE `{NEW_TABLE_NAME}` (
+        {source_columns()}
+    )
+    PARTITIONED BY (`yr_mo_partition` string)
+    STORED AS PARQUET
+    LOCATION 's3://{PROD_BUCKET}/{DATETIME_NOW_INT_STR}/'
+    TBLPROPERTIES ('parquet.compression'='SNAPPY')
+    """)
 
-# Refresh the table
-queryStart = client.start_query_execution(
-    QueryString = f"""
+    items = sorted(partitions.items())
+    statements = []
+    for i in range(0, len(items), PARTITIONS_PER_ALTER):
+        specs = "\n        ".join(
+            f"PARTITION (yr_mo_partition='{value}') LOCATION '{entry['location']}'"
+            for value, entry in items[i:i + PARTITIONS_PER_ALTER]
+        )
+        statements.append(f"ALTER TABLE `{NEW_TABLE_NAME}` ADD IF NOT EXISTS\n        {specs}")
+    runner.run_many(statements)
+
+def repoint_latest(partitions, mode, stats):
+    """
+    Swap the stable view to the new version, then publish the pointer manifest
+    CREATE OR REPLACE VIEW is a single catalog update, so readers see either
+    the old version or the new one, never a mix
+    """
+    summary = runner.run(f"""
+    CREATE OR REPLACE VIEW {LATEST_VIEW_NAME} AS
+    SELECT * FROM "{MY_DATABASE}"."{NEW_TABLE_NAME}"
+    """)
+    print(f"Repoint view query {format_stats(summary)}")
+
+    manifest = json.dumps({
+        'version': DATETIME_NOW_INT_STR,
+        'table_name': NEW_TABLE_NAME,
+        'view_name': LATEST_VIEW_NAME,
+        'database': MY_DATABASE,
+        'location': f"s3://{PROD_BUCKET}/{DATETIME_NOW_INT_STR}/",
+        'mode': mode,
+        'published_at': datetime.now().isoformat(),
+        'partitions': partitions,
+        'stats': stats
+    }, indent=2)
+
+    # keep every version's manifest, then overwrite the pointer
+    s3_client.put_object(Bucket=PROD_BUCKET, Key=f"_versions/{DATETIME_NOW_INT_STR}/manifest.json",
+                         Body=manifest, ContentType='application/json')
+    s3_client.put_object(Bucket=PROD_BUCKET, Key=LATEST_MANIFEST_KEY,
+                         Body=manifest, ContentType='application/json')
+    print(f"Latest version is now {NEW_TABLE_NAME} (s3://{PROD_BUCKET}/{LATEST_MANIFEST_KEY})")
+
+def delta_publish():
+    with metrics.stage('list_source'):
+        source_partitions = list_partitions(SOURCE_BUCKET, SOURCE_PREFIX)
+    if not source_partitions:
+        sys.exit(f"No partitions found under s3://{SOURCE_BUCKET}/{SOURCE_PREFIX}")
+
+    previous = (load_latest_manifest() or {}).get('partitions', {})
+
+    partitions = {}
+    to_copy = []
+    for value, objects in source_partitions.items():
+        content_fingerprint = fingerprint(objects)
+        if value in previous and previous[value]['fingerprint'] == content_fingerprint:
+            # unchanged - the new version shares the previous version's files
+            partitions[value] = previous[value]
+        else:
+            to_copy.append(value)
+            partitions[value] = {'fingerprint': content_fingerprint}
+
+    print(f"Delta publish: {len(to_copy)} changed partition(s) to copy, "
+          f"{len(partitions) - len(to_copy)} unchanged partition(s) shared")
+
+    # copy every file of every changed partition in parallel
+    copies = [
+        (obj['Key'], partition_destination(value))
+        for value in to_copy
+        for obj in source_partitions[value]
+    ]
+    copied_bytes = sum(obj['Size'] for value in to_copy for obj in source_partitions[value])
+    with metrics.stage('copy'), ThreadPoolExecutor(max_workers=COPY_WORKERS) as executor:
+        list(executor.map(lambda copy: copy_object(*copy), copies))
+    metrics.count('partitions_copied', len(to_copy))
+    metrics.count('partitions_shared', len(partitions) - len(to_copy))
+    metrics.count('files_copied', len(copies))
+    metrics.count('bytes_copied', copied_bytes)
+    for value in to_copy:
+        partitions[value]['location'] = f"s3://{PROD_BUCKET}/{partition_destination(value)}"
+
+    with metrics.stage('register'):
+        register_version_table(partitions)
+    repoint_latest(partitions, 'delta', {
+        'partitions_copied': len(to_copy),
+        'partitions_shared': len(partitions) - len(to_copy),
+        'files_copied': len(copies),
+        'bytes_copied': copied_bytes
+    })
+
+def full_publish():
+    # Refresh the table
+    publish_query = f"""
     CREATE TABLE {NEW_PROD_PARQUET_TABLE_NAME}_{DATETIME_NOW_INT_STR} WITH
-    (external_location='{NEW_PROD_PARQUET_TABLE_S3_BUCKET}/{DATETIME_NOW_INT_STR}/',
+    (external_location='{NEW_PROD_PARQUET_TABLE_S3_BUCKET}{DATETIME_NOW_INT_STR}/',
     format='PARQUET',
     write_compression='SNAPPY',
     partitioned_by = ARRAY['yr_mo_partition'])
@@ -30,24 +217,40 @@ queryStart = client.start_query_execution(
     FROM "{MY_DATABASE}"."{SOURCE_PARQUET_TABLE_NAME}"
 
     ;
-    """,
-    QueryExecutionContext = {
-        'Database': f'{MY_DATABASE}'
-    }, 
-    ResultConfiguration = { 'OutputLocation': f'{QUERY_RESULTS_BUCKET}'}
-)
-
-# list of responses
-resp = ["FAILED", "SUCCEEDED", "CANCELLED"]
-
-# get the response
-response = client.get_query_execution(QueryExecutionId=queryStart["QueryExecutionId"])
-
-# wait until query finishes
-while response["QueryExecution"]["Status"]["State"] not in resp:
-    response = client.get_query_execution(QueryExecutionId=queryStart["QueryExecutionId"])
-    
-# if it fails, exit and give the Athena error message in the logs
-if response["QueryExecution"]["Status"]["State"] == 'FAILED':
-    sys.exit(response["QueryExecution"]["Status"]["StateChangeReason"])
+    """
+
+    # fingerprint the transformed files the copy is made from, as delta_publish does,
+    # so the next delta publish can tell which partitions are unchanged
+    with metrics.stage('list_source'):
+        source_partitions = list_partitions(SOURCE_BUCKET, SOURCE_PREFIX)
+
+    # wait until query finishes
+    with metrics.stage('ctas'):
+        response = runner.run(publish_query, raise_on_failure=False)
+    print(f"Publish query {format_stats(response)}")
+
+    # if it fails, exit and give the Athena error message in the logs
+    if response["state"] == 'FAILED':
+        sys.exit(response["state_change_reason"])
+
+    new_partitions = list_partitions(PROD_BUCKET, f"{DATETIME_NOW_INT_STR}/")
+    partitions = {
+        value: {
+            'fingerprint': fingerprint(source_partitions.get(value, [])),
+            'location': f"s3://{PROD_BUCKET}/{DATETIME_NOW_INT_STR}/yr_mo_partition={value}/"
+        }
+        for value in new_partitions
+    }
+    repoint_latest(partitions, 'full', {'bytes_scanned': response['bytes_scanned']})
 
+try:
+    if MODE == 'full':
+        full_publish()
+    else:
+        delta_publish()
+except Exception as e:
+    error_message = f"Error publishing PROD table: {str(e)}"
+    print(error_message)
+    sys.exit(error_message)
+finally:
+    metrics.flush()
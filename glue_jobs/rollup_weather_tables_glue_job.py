@@ -0,0 +1,253 @@
+import sys
+import json
+from datetime import datetime, timezone
+
+from athena_query_runner import AthenaQueryRunner, format_stats
+from instrumentation import Metrics
+from job_args import get_job_arg
+from s3_objects import delete_prefix
+
+# AWS Resource Configuration for Weather Data Pipeline
+PROD_BUCKET = 'parquet-weather-table-prod-04142025'
+QUERY_RESULTS_BUCKET_URL = 's3://query-results-location-de-proj-04152025/'
+DATABASE_NAME = 'weather-database-04142025'
+
+# The rollups are built from the stable PROD name the publish job repoints
+SOURCE_VIEW_NAME = 'open_meteo_weather_data_parquet_tbl_prod_latest'
+LATEST_MANIFEST_KEY = '_latest/manifest.json'
+
+# Rollup tables live next to the PROD versions, outside any version prefix
+ROLLUP_PREFIX = 'rollups/'
+STATE_KEY = '_pipeline_state/rollup_weather_tables.json'
+
+# --mode incremental (default): rebuild only rollup partitions fed by source partitions
+#   whose publish fingerprint changed
+# --mode full: drop and rebuild every rollup table
+# incremental falls back to full when there is no previous state or a rollup table is missing
+MODE = get_job_arg('mode', 'incremental')
+
+# Athena allows at most 100 partitions to be written by one INSERT INTO
+MAX_PARTITIONS_PER_INSERT = 100
+
+# One rollup per dashboard resolution
+#   period_start      - first day of the bucket, as a DATE
+#   partition_column  - computed from period_start, see partition_expression()
+# Daily and weekly rollups are partitioned by month, monthly by year, so a dashboard
+# query touches a handful of small partitions whatever its time range
+ROLLUPS = {
+    'daily': {
+        'table': 'open_meteo_weather_rollup_daily',
+        'period_start': "CAST(SUBSTRING(time,1,10) AS DATE)",
+        'partition_column': 'yr_mo_partition'
+    },
+    'weekly': {
+        'table': 'open_meteo_weather_rollup_weekly',
+        'period_start': "date_trunc('week', CAST(SUBSTRING(time,1,10) AS DATE))",
+        'partition_column': 'yr_mo_partition'
+    },
+    'monthly': {
+        'table': 'open_meteo_weather_rollup_monthly',
+        'period_start': "date_trunc('month', CAST(SUBSTRING(time,1,10) AS DATE))",
+        'partition_column': 'yr_partition'
+    }
+}
+
+metrics = Metrics('rollup_weather_tables', get_job_arg('metrics-location'), {'mode': MODE})
+
+runner = AthenaQueryRunner(DATABASE_NAME, QUERY_RESULTS_BUCKET_URL, client=metrics.client('athena'), metrics=metrics)
+s3_client = metrics.client('s3')
+glue_client = metrics.client('glue')
+
+def partition_expression(rollup):
+    """
+    The rollup partition value computed from the bucket's period start
+    """
+    length = 7 if rollup['partition_column'] == 'yr_mo_partition' else 4
+    return f"SUBSTRING(CAST({rollup['period_start']} AS VARCHAR),1,{length})"
+
+def rollup_select(rollup, where=""):
+    """
+    Per-location min / max / mean / count of both temperatures for every bucket
+    The partition column comes last, as CTAS and INSERT INTO require
+    """
+    return f"""
+    SELECT
+        latitude,
+        longitude,
+        {rollup['period_start']} AS period_start,
+        MIN(temp_f) AS temp_f_min,
+        MAX(temp_f) AS temp_f_max,
+        AVG(temp_f) AS temp_f_mean,
+        COUNT(temp_f) AS temp_f_count,
+        MIN(temp_c) AS temp_c_min,
+        MAX(temp_c) AS temp_c_max,
+        AVG(temp_c) AS temp_c_mean,
+        COUNT(temp_c) AS temp_c_count,
+        {partition_expression(rollup)} AS {rollup['partition_column']}
+    FROM "{DATABASE_NAME}"."{SOURCE_VIEW_NAME}"
+    {where}
+    GROUP BY 1, 2, 3
+    """
+
+def shift_month(month, delta):
+    """
+    YYYY-MM moved by delta months
+    """
+    year, mon = int(month[:4]), int(month[5:7])
+    index = year * 12 + mon - 1 + delta
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+def affected_partitions(rollup_name, changed_months):
+    """
+    (rollup partitions to rebuild, source months to read) for a set of changed source months
+    A week that starts in month M can end in month M+1, so the weekly partition of the
+    previous month is rebuilt too, and reads one month past each rebuilt partition
+    """
+    changed = set(changed_months)
+    if rollup_name == 'daily':
+        return sorted(changed), sorted(changed)
+    if rollup_name == 'weekly':
+        targets = changed | {shift_month(month, -1) for month in changed}
+        return sorted(targets), sorted(targets | {shift_month(month, 1) for month in targets})
+    years = sorted({month[:4] for month in changed})
+    return years, [f"{year}-{mon:02d}" for year in years for mon in range(1, 13)]
+
+def load_json(key):
+    try:
+        obj = s3_client.get_object(Bucket=PROD_BUCKET, Key=key)
+    except s3_client.exceptions.NoSuchKey:
+        return None
+    return json.loads(obj['Body'].read())
+
+def save_state(run_started_at, mode, manifest, rebuilt):
+    s3_client.put_object(
+        Bucket=PROD_BUCKET,
+        Key=STATE_KEY,
+        Body=json.dumps({
+            'last_run_started_at': run_started_at,
+            'mode': mode,
+            'source_version': manifest.get('version'),
+            'fingerprints': {
+                value: entry.get('fingerprint') for value, entry in manifest.get('partitions', {}).items()
+            },
+            'partitions_rebuilt': rebuilt
+        }),
+        ContentType='application/json'
+    )
+
+def table_exists(table):
+    try:
+        glue_client.get_table(DatabaseName=DATABASE_NAME, Name=table)
+        return True
+    except glue_client.exceptions.EntityNotFoundException:
+        return False
+
+def changed_months(manifest, state):
+    """
+    Source months whose publish fingerprint differs from the last rolled-up version
+    Months that disappeared from the source count as changed, so their buckets are cleared
+    """
+    previous = state.get('fingerprints', {})
+    current = {value: entry.get('fingerprint') for value, entry in manifest.get('partitions', {}).items()}
+    return sorted(
+        month for month in set(previous) | set(current)
+        if previous.get(month) != current.get(month)
+    )
+
+def rollup_location(rollup_name):
+    return f"{ROLLUP_PREFIX}{rollup_name}/"
+
+def full_rebuild():
+    """
+    Drop and rebuild every rollup with CTAS; the three CTAS run side by side
+    """
+    drops = [f'DROP TABLE IF EXISTS "{DATABASE_NAME}".{rollup["table"]}' for rollup in ROLLUPS.values()]
+    runner.run_many(drops, raise_on_failure=False)
+    for rollup_name in ROLLUPS:
+        deleted = delete_prefix(s3_client, PROD_BUCKET, rollup_location(rollup_name))
+        print(f"Cleared {deleted} object(s) from the {rollup_name} rollup location")
+
+    creates = [
+        f"""
+        CREATE TABLE "{DATABASE_NAME}".{rollup['table']} WITH
+        (external_location='s3://{PROD_BUCKET}/{rollup_location(rollup_name)}',
+        format='PARQUET',
+        write_compression='SNAPPY',
+        partitioned_by = ARRAY['{rollup['partition_column']}'])
+        AS
+        {rollup_select(rollup)}
+        """
+        for rollup_name, rollup in ROLLUPS.items()
+    ]
+    results = runner.run_many(creates, raise_on_failure=False)
+    for rollup_name, summary in zip(ROLLUPS, results):
+        print(f"Create {rollup_name} rollup {format_stats(summary)}")
+    failed = [summary for summary in results if summary['state'] != 'SUCCEEDED']
+    if failed:
+        sys.exit(failed[0]['state_change_reason'])
+
+def rebuild_partitions(months):
+    """
+    Replace only the rollup partitions fed by the changed months
+    Returns {rollup name: partitions rebuilt}
+    """
+    inserts = []
+    rebuilt = {}
+    for rollup_name, rollup in ROLLUPS.items():
+        targets, sources = affected_partitions(rollup_name, months)
+        rebuilt[rollup_name] = targets
+        column = rollup['partition_column']
+        for target in targets:
+            delete_prefix(s3_client, PROD_BUCKET, f"{rollup_location(rollup_name)}{column}={target}/")
+
+        source_values = ", ".join(f"'{month}'" for month in sources)
+        for i in range(0, len(targets), MAX_PARTITIONS_PER_INSERT):
+            values = ", ".join(f"'{target}'" for target in targets[i:i + MAX_PARTITIONS_PER_INSERT])
+            # the yr_mo_partition predicate prunes the source scan to the months that can contribute
+            where = (f"WHERE yr_mo_partition IN ({source_values})\n"
+                     f"    AND {partition_expression(rollup)} IN ({values})")
+            inserts.append(f"""
+            INSERT INTO "{DATABASE_NAME}".{rollup['table']}
+            {rollup_select(rollup, where)}
+            """)
+        print(f"{rollup_name} rollup: rebuilding {len(targets)} partition(s) from {len(sources)} source month(s)")
+
+    # every insert writes disjoint partitions so they can all run side by side
+    for summary in runner.run_many(inserts):
+        print(f"Rollup insert {format_stats(summary)}")
+    return rebuilt
+
+run_started_at = datetime.now(timezone.utc).isoformat()
+
+try:
+    manifest = load_json(LATEST_MANIFEST_KEY)
+    if manifest is None:
+        sys.exit(f"No published version found at s3://{PROD_BUCKET}/{LATEST_MANIFEST_KEY}")
+
+    state = load_json(STATE_KEY) if MODE == 'incremental' else None
+    tables_present = all(table_exists(rollup['table']) for rollup in ROLLUPS.values())
+
+    if MODE == 'incremental' and state and tables_present:
+        months = changed_months(manifest, state)
+        if months:
+            print(f"Incremental rollup of version {manifest.get('version')}: {len(months)} changed month(s): {months}")
+            with metrics.stage('rebuild_partitions'):
+                rebuilt = rebuild_partitions(months)
+            metrics.count('partitions_rebuilt', sum(len(targets) for targets in rebuilt.values()))
+        else:
+            print(f"Incremental rollup: nothing changed since version {state.get('source_version')}")
+            rebuilt = {}
+        save_state(run_started_at, 'incremental', manifest, rebuilt)
+    else:
+        if MODE == 'incremental':
+            print("Incremental rollup not possible (no previous state or rollup table missing), falling back to full rebuild")
+        with metrics.stage('full_rebuild'):
+            full_rebuild()
+        save_state(run_started_at, 'full', manifest, None)
+
+except Exception as e:
+    error_message = f"Error building rollup tables: {str(e)}"
+    print(error_message)
+    sys.exit(error_message)
+finally:
+    metrics.flush()
@@ -0,0 +1,30 @@
+# Bulk S3 deletes shared by the Glue jobs
+# Each job passes its own (instrumented) S3 client
+# Ship it with --extra-py-files next to job_args.py
+
+# delete_objects takes at most this many keys per call
+DELETE_BATCH = 1000
+
+
+def delete_keys(s3_client, bucket, keys):
+    """
+    Remove the given keys, DELETE_BATCH per request
+    """
+    for i in range(0, len(keys), DELETE_BATCH):
+        s3_client.delete_objects(
+            Bucket=bucket,
+            Delete={'Objects': [{'Key': key} for key in keys[i:i + DELETE_BATCH]], 'Quiet': True}
+        )
+
+
+def delete_prefix(s3_client, bucket, prefix):
+    """
+    Remove every object under a prefix; returns how many
+    """
+    paginator = s3_client.get_paginator('list_objects_v2')
+    deleted = 0
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        keys = [obj['Key'] for obj in page.get('Contents', [])]
+        delete_keys(s3_client, bucket, keys)
+        deleted += len(keys)
+    return deleted
@@ -0,0 +1,33 @@
+-- Table over the metadata extractor's Parquet log (lambda/metadata_log.py)
+--   s3://query-results-location-de-proj-04152025/weather_metadata_log/extraction_date=YYYY-MM-DD/*.parquet
+-- Partition projection computes the partitions from the query's extraction_date
+-- predicate, so new days are readable at once - no crawler, no MSCK REPAIR TABLE.
+CREATE EXTERNAL TABLE IF NOT EXISTS weather_metadata_results.weather_metadata_log (
+  run_id STRING,
+  table_name STRING,
+  source_database STRING,
+  extraction_time TIMESTAMP,
+  column_count BIGINT,
+  s3_location STRING,
+  s3_objects_count BIGINT,
+  s3_total_size_bytes BIGINT,
+  s3_latest_modification STRING,
+  partition_count BIGINT,
+  row_count BIGINT,
+  partitions_relisted BIGINT,
+  partitions_from_index BIGINT,
+  detail_json STRING
+)
+PARTITIONED BY (extraction_date STRING)
+STORED AS PARQUET
+LOCATION 's3://query-results-location-de-proj-04152025/weather_metadata_log/'
+TBLPROPERTIES (
+  'parquet.compression' = 'SNAPPY',
+  'projection.enabled' = 'true',
+  'projection.extraction_date.type' = 'date',
+  'projection.extraction_date.format' = 'yyyy-MM-dd',
+  'projection.extraction_date.range' = '2025-01-01,NOW',
+  'projection.extraction_date.interval' = '1',
+  'projection.extraction_date.interval.unit' = 'DAYS',
+  'storage.location.template' = 's3://query-results-location-de-proj-04152025/weather_metadata_log/extraction_date=${extraction_date}/'
+)
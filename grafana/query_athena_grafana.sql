@@ -1,7 +1,11 @@
+-- Raw daily values; prefer query_athena_grafana_rollup.sql for dashboards
+-- The yr_mo_partition predicate lets Athena prune to the months in the time range,
+-- which the CAST inside $__timeFilter cannot do on its own
 SELECT
    CAST(time AS TIMESTAMP) AS "time"
   ,temp_F
   ,temp_C
-FROM open_meteo_weather_data_parquet_tbl_prod_2025_04_17_02_58_16_622979
-WHERE $__timeFilter(CAST(time AS TIMESTAMP))
-ORDER BY 1 
\ No newline at end of file
+FROM open_meteo_weather_data_parquet_tbl_prod_latest
+WHERE yr_mo_partition BETWEEN date_format($__timeFrom(), '%Y-%m') AND date_format($__timeTo(), '%Y-%m')
+  AND $__timeFilter(CAST(time AS TIMESTAMP))
+ORDER BY 1
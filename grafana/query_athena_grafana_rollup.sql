@@ -0,0 +1,42 @@
+-- Temperature per location at a resolution that fits the dashboard time range:
+--   up to 92 days  -> daily rollup
+--   up to 2 years  -> weekly rollup
+--   longer         -> monthly rollup
+-- Only one branch's condition is true; the others are constant-false and scan nothing.
+-- Each branch prunes its rollup by partition before filtering on period_start.
+SELECT "time", location, temp_f_mean, temp_f_min, temp_f_max, temp_c_mean, temp_c_min, temp_c_max
+FROM (
+  SELECT
+     CAST(period_start AS TIMESTAMP) AS "time"
+    ,CONCAT(CAST(latitude AS VARCHAR), ',', CAST(longitude AS VARCHAR)) AS location
+    ,temp_f_mean, temp_f_min, temp_f_max, temp_c_mean, temp_c_min, temp_c_max
+  FROM open_meteo_weather_rollup_daily
+  WHERE date_diff('day', $__timeFrom(), $__timeTo()) <= 92
+    AND yr_mo_partition BETWEEN date_format($__timeFrom(), '%Y-%m') AND date_format($__timeTo(), '%Y-%m')
+    AND $__timeFilter(CAST(period_start AS TIMESTAMP))
+
+  UNION ALL
+
+  SELECT
+     CAST(period_start AS TIMESTAMP) AS "time"
+    ,CONCAT(CAST(latitude AS VARCHAR), ',', CAST(longitude AS VARCHAR)) AS location
+    ,temp_f_mean, temp_f_min, temp_f_max, temp_c_mean, temp_c_min, temp_c_max
+  FROM open_meteo_weather_rollup_weekly
+  WHERE date_diff('day', $__timeFrom(), $__timeTo()) > 92
+    AND date_diff('day', $__timeFrom(), $__timeTo()) <= 731
+    -- a week starting in the previous month can overlap the range
+    AND yr_mo_partition BETWEEN date_format(date_add('day', -6, $__timeFrom()), '%Y-%m') AND date_format($__timeTo(), '%Y-%m')
+    AND period_start BETWEEN CAST(date_add('day', -6, $__timeFrom()) AS DATE) AND CAST($__timeTo() AS DATE)
+
+  UNION ALL
+
+  SELECT
+     CAST(period_start AS TIMESTAMP) AS "time"
+    ,CONCAT(CAST(latitude AS VARCHAR), ',', CAST(longitude AS VARCHAR)) AS location
+    ,temp_f_mean, temp_f_min, temp_f_max, temp_c_mean, temp_c_min, temp_c_max
+  FROM open_meteo_weather_rollup_monthly
+  WHERE date_diff('day', $__timeFrom(), $__timeTo()) > 731
+    AND yr_partition BETWEEN date_format($__timeFrom(), '%Y') AND date_format($__timeTo(), '%Y')
+    AND period_start BETWEEN CAST(date_trunc('month', $__timeFrom()) AS DATE) AND CAST($__timeTo() AS DATE)
+)
+ORDER BY 1, 2
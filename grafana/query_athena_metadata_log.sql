@@ -0,0 +1,20 @@
+-- Metadata snapshots in the dashboard time range, from the Parquet metadata log
+-- The extraction_date predicate limits the scan to the days in range (about one
+-- compacted file each); the time filter then trims the first and last day.
+SELECT
+  extraction_time AS "time",
+  table_name,
+  column_count,
+  s3_objects_count,
+  CAST(s3_total_size_bytes AS DOUBLE) / 1024 / 1024 AS total_size_mb,
+  row_count,
+  partition_count,
+  source_database
+FROM
+  weather_metadata_results.weather_metadata_log
+WHERE
+  extraction_date BETWEEN date_format($__timeFrom(), '%Y-%m-%d') AND date_format($__timeTo(), '%Y-%m-%d')
+  AND $__timeFilter(extraction_time)
+  AND table_name LIKE '%open_meteo_weather_data_parquet_tbl_prod%'
+ORDER BY
+  extraction_time DESC
@@ -0,0 +1,188 @@
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from json_store import make_json_store
+from record_encoder import encode_daily_records
+from seen_days_index import drop_seen_days, record_delivered_days
+from watermark_store import location_key
+
+# Backfill mode for the ingestion Lambda
+# Each location's date range is cut into fixed windows of window_days, one shard per
+# window. A shard runs as a pipeline of generators: fetch one window, decode the daily
+# columns it delivers, encode and send them a batch at a time. Peak memory is one
+# window per worker however many years are backfilled.
+# A checkpoint per shard records it as delivered, so rerunning a failed backfill
+# with the same range and checkpoint location only fetches the shards that did not finish
+
+WINDOW_DAYS = 31
+
+
+def plan_shards(locations, start_date, end_date, window_days=WINDOW_DAYS):
+    """
+    Split every location's range into windows of window_days
+    A location may carry its own start_date/end_date, which take precedence
+    """
+    shards = []
+    for location in locations:
+        start = datetime.date.fromisoformat(location.get('start_date', start_date))
+        end = datetime.date.fromisoformat(location.get('end_date', end_date))
+        while start <= end:
+            window_end = min(end, start + datetime.timedelta(days=window_days - 1))
+            shards.append({
+                'id': f"{location_key(location)}_{start.isoformat()}_{window_end.isoformat()}",
+                'location': dict(location, start_date=start.isoformat(), end_date=window_end.isoformat())
+            })
+            start = window_end + datetime.timedelta(days=1)
+    return shards
+
+
+def decode_window(r_dict):
+    """
+    Keep only the columns the records are built from
+    Anything else in the response (e.g. hourly arrays) is released with it
+    """
+    daily = r_dict['daily']
+    return {
+        'latitude': float(r_dict['latitude']),
+        'longitude': float(r_dict['longitude']),
+        'daily': {
+            'time': list(daily['time']),
+            'temperature_2m_max': list(daily['temperature_2m_max'])
+        }
+    }
+
+
+def encode_batches(window, row_ts, batch_records):
+    """
+    Yield the window's Firehose records batch_records at a time
+    """
+    daily = window['daily']
+    for i in range(0, len(daily['time']), batch_records):
+        payloads = encode_daily_records(
+            window['latitude'],
+            window['longitude'],
+            daily['time'][i:i + batch_records],
+            daily['temperature_2m_max'][i:i + batch_records],
+            row_ts=row_ts
+        )
+        yield [{'Data': payload} for payload in payloads]
+
+
+def make_checkpoint_store(uri, s3_client=None):
+    """
+    Build a store from a URI: s3://bucket/prefix or a local file path
+    One checkpoint per shard, so workers and fan-out invocations never overwrite each other on S3
+    Returns None when no URI is configured, which re-sends every shard on a rerun
+    """
+    return make_json_store(uri, s3_client)
+
+
+class Backfill:
+    """
+    Runs shards on a bounded thread pool
+    - fetch(location) returns a fetch_location() result for one window
+    - deliver(window) sends a decoded window and returns
+      {"records_sent", "bytes_sent", "failed"}: the records delivered, their bytes,
+      and the records not delivered
+    A shard counts as done only when all its records were delivered; with a seen-days
+    index, shards of the same location update it one at a time
+    """
+
+    def __init__(self, fetch, deliver, sink, checkpoints=None, seen_index=None,
+                 max_workers=4, resume=True, resend=False):
+        self.fetch = fetch
+        self.deliver = deliver
+        self.sink = sink
+        self.checkpoints = checkpoints
+        self.seen_index = seen_index
+        self.max_workers = max_workers
+        self.resume = resume
+        self.resend = resend
+        self._lock = threading.Lock()
+        self._location_locks = {}
+
+    def _location_lock(self, key):
+        with self._lock:
+            return self._location_locks.setdefault(key, threading.Lock())
+
+    def _checkpoint(self, shard_id, status, **fields):
+        if self.checkpoints is not None:
+            self.checkpoints.put(shard_id, dict(
+                fields,
+                status=status,
+                sink=self.sink,
+                updated_at=datetime.datetime.now(datetime.timezone.utc).isoformat()
+            ))
+
+    def run_shard(self, shard):
+        """
+        Fetch, decode, deliver and checkpoint one window
+        Returns the shard's summary; errors are reported there rather than raised,
+        so one bad window never stops the others
+        """
+        summary = {'id': shard['id'], 'status': None, 'records_sent': 0, 'bytes_sent': 0, 'records_failed': 0,
+                   'days_already_seen': 0}
+        try:
+            if self.checkpoints is not None and self.resume:
+                checkpoint = self.checkpoints.get(shard['id'])
+                if checkpoint and checkpoint['status'] == 'delivered' and checkpoint.get('sink') == self.sink:
+                    return dict(summary, status='skipped')
+            error = self._deliver_shard(shard, summary)
+            if not error:
+                self._checkpoint(shard['id'], 'delivered', records=summary['records_sent'])
+                return dict(summary, status='delivered')
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        try:
+            self._checkpoint(shard['id'], 'failed', error=error)
+        except Exception as e:
+            error = f"{error} (failed checkpoint not written: {type(e).__name__}: {e})"
+        return dict(summary, status='failed', error=error)
+
+    def _deliver_shard(self, shard, summary):
+        # the error message when the window could not be fully delivered, else None
+        result = self.fetch(shard['location'])
+        if result['error']:
+            return result['error']
+        window = decode_window(result['response'])
+        del result
+
+        key = location_key(shard['location'])
+        if self.seen_index is not None and not self.resend:
+            with self._location_lock(key):
+                window, summary['days_already_seen'] = drop_seen_days(window, self.seen_index.get(key))
+
+        if window['daily']['time']:
+            sent = self.deliver(window)
+            summary.update(records_sent=sent['records_sent'], bytes_sent=sent['bytes_sent'], records_failed=sent['failed'])
+            if sent['failed']:
+                return f"{sent['failed']} record(s) could not be delivered"
+
+            if self.seen_index is not None:
+                # re-read under the lock: other shards of this location may have added days since
+                with self._location_lock(key):
+                    seen = self.seen_index.get(key)
+                    record_delivered_days(window, seen)
+                    self.seen_index.put(key, seen)
+        return None
+
+    def run(self, shards):
+        """
+        Run every shard and return the totals plus the shards that failed
+        """
+        if shards:
+            with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(shards)))) as executor:
+                results = list(executor.map(self.run_shard, shards))
+        else:
+            results = []
+        return {
+            'shards': len(results),
+            'shards_delivered': sum(1 for r in results if r['status'] == 'delivered'),
+            'shards_skipped': sum(1 for r in results if r['status'] == 'skipped'),
+            'shards_failed': [{'id': r['id'], 'error': r['error']} for r in results if r['status'] == 'failed'],
+            'records_sent': sum(r['records_sent'] for r in results),
+            'bytes_sent': sum(r['bytes_sent'] for r in results),
+            'records_failed': sum(r['records_failed'] for r in results),
+            'days_already_seen': sum(r['days_already_seen'] for r in results)
+        }
@@ -0,0 +1,162 @@
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Firehose PutRecordBatch service limits
+MAX_RECORDS_PER_BATCH = 500
+MAX_BYTES_PER_BATCH = 4 * 1024 * 1024
+MAX_BYTES_PER_RECORD = 1000 * 1024
+
+# errors raised for the whole call that are worth retrying
+RETRYABLE_CALL_ERRORS = (
+    "ServiceUnavailableException",
+    "ThrottlingException",
+    "InternalFailure",
+    "RequestTimeout"
+)
+
+
+def record_size(record):
+    """
+    Size of a record's Data blob in bytes, as Firehose counts it
+    """
+    data = record['Data']
+    if isinstance(data, str):
+        return len(data.encode('utf-8'))
+    return len(data)
+
+
+def chunk_records(records, max_records=MAX_RECORDS_PER_BATCH, max_bytes=MAX_BYTES_PER_BATCH):
+    """
+    Split records into batches that respect both the record count and
+    the payload size limits of a single PutRecordBatch call
+    """
+    batch = []
+    batch_bytes = 0
+    for record in records:
+        size = record_size(record)
+        if size > MAX_BYTES_PER_RECORD:
+            raise ValueError(f"Record of {size} bytes exceeds the Firehose limit of {MAX_BYTES_PER_RECORD} bytes")
+        if batch and (len(batch) >= max_records or batch_bytes + size > max_bytes):
+            yield batch
+            batch = []
+            batch_bytes = 0
+        batch.append(record)
+        batch_bytes += size
+    if batch:
+        yield batch
+
+
+class FirehoseBatchSender:
+    """
+    Sends any number of records to a Firehose delivery stream
+    - chunks records to stay within the per-call limits
+    - sends chunks concurrently on a small thread pool
+    - resends only the entries Firehose reported as failed, with exponential backoff and jitter
+    - reports per-batch throughput stats
+    """
+
+    def __init__(self, firehose_client, delivery_stream_name, max_workers=4,
+                 max_attempts=5, base_delay=0.1, max_delay=5.0):
+        self.client = firehose_client
+        self.delivery_stream_name = delivery_stream_name
+        self.max_workers = max_workers
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def send(self, records):
+        """
+        Send all records and return a summary with per-batch stats
+        records / bytes count everything sent, records_delivered / bytes_delivered
+        only what Firehose accepted; records that still fail after max_attempts
+        are returned in failed_records and counted in FailedPutCount
+        """
+        started = time.perf_counter()
+        batches = list(chunk_records(records))
+
+        if batches:
+            with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(batches)))) as executor:
+                batch_results = list(executor.map(self._send_batch, range(len(batches)), batches))
+        else:
+            batch_results = []
+
+        elapsed = time.perf_counter() - started
+        failed_records = [r for result in batch_results for r in result.pop('failed_records')]
+        total_records = sum(result['records'] for result in batch_results)
+        total_bytes = sum(result['bytes'] for result in batch_results)
+
+        return {
+            'records': total_records,
+            'bytes': total_bytes,
+            'records_delivered': total_records - len(failed_records),
+            'bytes_delivered': total_bytes - sum(record_size(r) for r in failed_records),
+            'batches': batch_results,
+            'FailedPutCount': len(failed_records),
+            'failed_records': failed_records,
+            'elapsed_seconds': elapsed,
+            'records_per_second': total_records / elapsed if elapsed > 0 else 0.0
+        }
+
+    def _send_batch(self, batch_index, batch):
+        started = time.perf_counter()
+        pending = batch
+        attempts = 0
+        retried_records = 0
+        last_error = None
+
+        while pending and attempts < self.max_attempts:
+            if attempts:
+                retried_records += len(pending)
+                self._sleep(attempts)
+            attempts += 1
+
+            try:
+                reply = self.client.put_record_batch(
+                    DeliveryStreamName=self.delivery_stream_name,
+                    Records=pending
+                )
+            except Exception as e:
+                # the whole call failed, retry every pending record if the error is transient
+                last_error = str(e)
+                if not self._is_retryable(e):
+                    break
+                continue
+
+            if reply.get('FailedPutCount', 0) == 0:
+                pending = []
+                break
+
+            # RequestResponses lines up one-to-one with the records we sent
+            failed = []
+            for record, response in zip(pending, reply['RequestResponses']):
+                if response.get('ErrorCode'):
+                    failed.append(record)
+                    last_error = f"{response['ErrorCode']}: {response.get('ErrorMessage', '')}"
+            pending = failed
+
+        elapsed = time.perf_counter() - started
+        batch_bytes = sum(record_size(r) for r in batch)
+        return {
+            'batch': batch_index,
+            'records': len(batch),
+            'bytes': batch_bytes,
+            'attempts': attempts,
+            'retried_records': retried_records,
+            'failed': len(pending),
+            'last_error': last_error if pending else None,
+            'elapsed_seconds': elapsed,
+            'records_per_second': len(batch) / elapsed if elapsed > 0 else 0.0,
+            'mib_per_second': batch_bytes / (1024 * 1024) / elapsed if elapsed > 0 else 0.0,
+            'failed_records': pending
+        }
+
+    def _sleep(self, attempt):
+        # full jitter exponential backoff
+        delay = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        time.sleep(random.uniform(0, delay))
+
+    @staticmethod
+    def _is_retryable(error):
+        code = getattr(error, 'response', {}).get('Error', {}).get('Code', '')
+        return code in RETRYABLE_CALL_ERRORS or not code
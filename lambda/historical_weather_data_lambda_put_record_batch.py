@@ -1,58 +1,381 @@
 import json
-import boto3
-import urllib3
+import os
 import datetime
 
-# REPLACE WITH YOUR DATA FIREHOSE NAME
-FIREHOSE_NAME = 'PUT-S3-HToZ2'
+import lambda_runtime
+from backfill import Backfill, encode_batches, make_checkpoint_store, plan_shards
+from firehose_batch_sender import MAX_RECORDS_PER_BATCH, FirehoseBatchSender
+from instrumentation import Metrics
+from open_meteo_fetcher import fetch_location, fetch_locations, load_locations, make_pool_manager
+from record_encoder import encode_response
+from response_cache import make_response_cache
+from seen_days_index import drop_seen_days, make_seen_days_index, record_delivered_days
+from watermark_store import location_key, make_watermark_store, plan_incremental_ranges, trim_incomplete_days
+
+# Settings are read once per container, when the module is imported
+# REPLACE WITH YOUR DATA FIREHOSE NAME (or set FIREHOSE_NAME)
+FIREHOSE_NAME = os.environ.get('FIREHOSE_NAME', 'PUT-S3-HToZ2')
+
+START_DATE = os.environ.get('START_DATE', '2025-01-01')
+END_DATE = os.environ.get('END_DATE', '2025-04-16')
+
+# optional JSON file bundled with the function listing the stations to ingest
+LOCATIONS_CONFIG = os.environ.get('LOCATIONS_CONFIG')
+
+# fan-out settings for multi-location runs
+MAX_WORKERS = int(os.environ.get('FETCH_MAX_WORKERS', '16'))
+FETCH_TIMEOUT_SECONDS = float(os.environ.get('FETCH_TIMEOUT_SECONDS', '10'))
+FETCH_RETRIES = int(os.environ.get('FETCH_RETRIES', '3'))
+
+# Firehose sender settings
+SEND_MAX_WORKERS = int(os.environ.get('SEND_MAX_WORKERS', '4'))
+SEND_MAX_ATTEMPTS = int(os.environ.get('SEND_MAX_ATTEMPTS', '5'))
+
+# incremental ingestion - s3://bucket/prefix or a local file path
+# when set, each location only requests the days after its last delivered day
+WATERMARK_STORE = os.environ.get('WATERMARK_STORE')
+
+# days already delivered per location - s3://bucket/prefix or a local file path
+# when set, days a previous run delivered are never sent again, whatever the date range
+SEEN_INDEX = os.environ.get('SEEN_INDEX')
+
+# on-disk cache of API responses, e.g. /tmp/open-meteo-cache
+# /tmp survives warm invocations; closed historical ranges never expire
+RESPONSE_CACHE_DIR = os.environ.get('RESPONSE_CACHE_DIR')
+RESPONSE_CACHE_MAX_MB = float(os.environ.get('RESPONSE_CACHE_MAX_MB', '256'))
+RESPONSE_CACHE_TTL_SECONDS = int(os.environ.get('RESPONSE_CACHE_TTL_SECONDS', '900'))
+
+# where records go: 'firehose' (default) or 'parquet'
+# the parquet sink writes Snappy Parquet in the transformed table's layout, skipping
+# Firehose, the raw JSON and the crawler - meant for bulk backfills
+# the create job reads sink_data/ as a second input next to the raw JSON; never point the
+# sink at transformed_data/, which the create job clears and rewrites from its inputs
+OUTPUT_SINK = os.environ.get('OUTPUT_SINK', 'firehose')
+PARQUET_SINK_LOCATION = os.environ.get(
+    'PARQUET_SINK_LOCATION',
+    's3://open-meteo-weather-data-parquet-bucket-04142025/sink_data/'
+)
+
+# backfill mode ("backfill": true in the event): the date range is cut into windows
+# of BACKFILL_WINDOW_DAYS per location, streamed on BACKFILL_MAX_WORKERS threads
+# BACKFILL_CHECKPOINTS (s3://bucket/prefix or a local file path) records each finished
+# window, so a rerun of a failed backfill only fetches the rest
+# BACKFILL_FAN_OUT > 0 hands that many locations to each asynchronous invocation of this function
+BACKFILL_WINDOW_DAYS = int(os.environ.get('BACKFILL_WINDOW_DAYS', '31'))
+BACKFILL_MAX_WORKERS = int(os.environ.get('BACKFILL_MAX_WORKERS', '4'))
+BACKFILL_CHECKPOINTS = os.environ.get('BACKFILL_CHECKPOINTS')
+BACKFILL_FAN_OUT = int(os.environ.get('BACKFILL_FAN_OUT', '0'))
+
+# per-run metrics document (s3://bucket/prefix or a local directory, empty to only log them)
+metrics = Metrics('historical_weather_data_ingest', os.environ.get('METRICS_LOCATION'))
+
+# created on first use and kept for warm invocations; most runs never touch S3
+s3_client = lambda_runtime.lazy_client('s3', metrics)
 
 def lambda_handler(event, context):
-    
-    http = urllib3.PoolManager()
-    
-    r = http.request("GET", "https://api.open-meteo.com/v1/forecast?latitude=40.7143&longitude=-74.006&daily=temperature_2m_max&temperature_unit=fahrenheit&timezone=America%2FNew_York&start_date=2025-01-01&end_date=2025-04-16")
-    
-    # turn it into a dictionary
-    r_dict = json.loads(r.data.decode(encoding='utf-8', errors='strict'))
-    
-    time_list = []
-    for val in r_dict['daily']['time']:
-        time_list.append(val)
-    
-    temp_list = []
-    for temp in r_dict['daily']['temperature_2m_max']:
-        
-        # handle null values
-        # if we don't, the crawler may get confused
-        if temp == None:
-            temp = 0.0
-        
-        temp_list.append(temp)
-    
-    # extract pieces of the dictionary
-    processed_dict = {}
-    
+    with metrics.run():
+        event = event or {}
+        if event.get('backfill'):
+            return backfill(event, context)
+        return ingest(event)
+
+def ingest(event):
+    locations = load_locations(event, LOCATIONS_CONFIG)
+    metrics.count('locations', len(locations))
+
+    # an explicit start_date in the event always wins over the watermark (e.g. backfills)
+    watermarks = make_watermark_store(event.get('watermark_store', WATERMARK_STORE), s3_client)
+    incremental = watermarks is not None and 'start_date' not in event
+    up_to_date = []
+    if incremental:
+        # default to yesterday, the last day that is complete everywhere
+        end_date = event.get('end_date', str(datetime.date.today() - datetime.timedelta(days=1)))
+        locations, up_to_date = plan_incremental_ranges(locations, watermarks, START_DATE, end_date)
+        print(f"Incremental run: {len(locations)} location(s) to fetch, {len(up_to_date)} already up to date")
+        if not locations:
+            return {'locations_requested': 0, 'locations_up_to_date': len(up_to_date), 'records_sent': 0}
+
+    # fetch every location concurrently over one shared connection pool
+    with metrics.stage('fetch'):
+        results = fetch_locations(
+            locations,
+            event.get('start_date', START_DATE),
+            event.get('end_date', END_DATE),
+            max_workers=MAX_WORKERS,
+            timeout=FETCH_TIMEOUT_SECONDS,
+            retries=FETCH_RETRIES,
+            # one keep-alive pool per container, so warm invocations reuse open connections
+            http=metrics.http(lambda_runtime.shared('open_meteo_pool', lambda: make_pool_manager(MAX_WORKERS))),
+            cache=lambda_runtime.shared('response_cache', lambda: make_response_cache(
+                RESPONSE_CACHE_DIR, RESPONSE_CACHE_MAX_MB, RESPONSE_CACHE_TTL_SECONDS
+            ))
+        )
+
+    # one ingest timestamp for the whole batch
+    row_ts = str(datetime.datetime.now())
+
+    # (location, response, last day it covers) for each successful fetch
+    fetched = []
+    failed_locations = []
+    for result in results:
+        if result['error']:
+            print(f"Failed to fetch {result['location']['name']}: {result['error']}")
+            failed_locations.append({'location': result['location'], 'error': result['error']})
+            continue
+        response = result['response']
+        last_day = None
+        if incremental:
+            response, last_day = trim_incomplete_days(response)
+        if response['daily']['time']:
+            fetched.append((result['location'], response, last_day))
+
+    metrics.count('locations_failed', len(failed_locations))
+    metrics.count('cache_hits', sum(1 for result in results if result['cache_hit']))
+
+    # drop the days earlier runs already delivered; "resend": true in the event sends them anyway
+    seen_index = make_seen_days_index(event.get('seen_index', SEEN_INDEX), s3_client)
+    seen = {}
+    already_delivered = []
+    days_already_seen = 0
+    if seen_index is not None:
+        with metrics.stage('seen_index'):
+            unseen = []
+            for location, response, last_day in fetched:
+                key = location_key(location)
+                seen[key] = seen_index.get(key)
+                if not event.get('resend'):
+                    response, dropped = drop_seen_days(response, seen[key])
+                    days_already_seen += dropped
+                if response['daily']['time']:
+                    unseen.append((location, response, last_day))
+                else:
+                    already_delivered.append((location, last_day))
+            fetched = unseen
+        metrics.count('days_already_seen', days_already_seen)
+
+    summary = {
+        'locations_requested': len(locations),
+        'locations_failed': failed_locations,
+        'locations_up_to_date': len(up_to_date),
+        'cache_hits': sum(1 for result in results if result['cache_hit']),
+        'days_already_seen': days_already_seen
+    }
+
+    if not fetched:
+        if (incremental or already_delivered) and not failed_locations:
+            advanced = advance_watermarks(watermarks, already_delivered) if incremental else 0
+            return dict(summary, watermarks_advanced=advanced, records_sent=0)
+        raise RuntimeError(f"No records fetched, {len(failed_locations)} location(s) failed")
+
+    with metrics.stage('deliver'):
+        if event.get('sink', OUTPUT_SINK) == 'parquet':
+            delivered, sink_summary = write_parquet(fetched, row_ts, event.get('parquet_location', PARQUET_SINK_LOCATION),
+                                                    s3_client)
+        else:
+            delivered, sink_summary = send_to_firehose(fetched, row_ts)
+    metrics.count('records_sent', sink_summary['records_sent'])
+    metrics.count('record_bytes_sent', sink_summary['bytes_sent'])
+    metrics.count('records_failed', sink_summary.get('FailedPutCount', 0))
+
+    # record the days only for locations whose records were all delivered
+    if seen_index is not None:
+        with metrics.stage('seen_index'):
+            responses = {location_key(location): response for location, response, _ in fetched}
+            for location, _ in delivered:
+                key = location_key(location)
+                record_delivered_days(responses[key], seen[key])
+                seen_index.put(key, seen[key])
+
+    # advance watermarks only for locations whose records were all delivered
+    watermarks_advanced = 0
+    if incremental:
+        watermarks_advanced = advance_watermarks(watermarks, delivered + already_delivered)
+
+    if sink_summary.get('FailedPutCount'):
+        raise RuntimeError(f"{sink_summary['FailedPutCount']} record(s) could not be delivered to Firehose")
+
+    return dict(summary, watermarks_advanced=watermarks_advanced, **sink_summary)
+
+def backfill(event, context):
+    """
+    Stream an explicit date range window by window, with a checkpoint per window
+    Watermarks are neither read nor advanced; the seen-days index still applies
+    """
+    locations = load_locations(event, LOCATIONS_CONFIG)
+    metrics.count('locations', len(locations))
+
+    fan_out = int(event.get('fan_out', BACKFILL_FAN_OUT))
+    if fan_out and len(locations) > fan_out:
+        return fan_out_backfill(event, context, locations, fan_out)
+
+    window_days = int(event.get('window_days', BACKFILL_WINDOW_DAYS))
+    shards = plan_shards(locations, event.get('start_date', START_DATE), event.get('end_date', END_DATE), window_days)
+    metrics.count('shards', len(shards))
+
+    http = metrics.http(lambda_runtime.shared('open_meteo_pool', lambda: make_pool_manager(MAX_WORKERS)))
+    cache = lambda_runtime.shared('response_cache', lambda: make_response_cache(
+        RESPONSE_CACHE_DIR, RESPONSE_CACHE_MAX_MB, RESPONSE_CACHE_TTL_SECONDS
+    ))
+
+    def fetch(location):
+        with metrics.stage('fetch'):
+            return fetch_location(http, location, None, None, FETCH_TIMEOUT_SECONDS, FETCH_RETRIES, cache=cache)
+
+    # one ingest timestamp for the whole backfill
+    row_ts = str(datetime.datetime.now())
+    sink = event.get('sink', OUTPUT_SINK)
+    if sink == 'parquet':
+        parquet_location = event.get('parquet_location', PARQUET_SINK_LOCATION)
+
+        def deliver(window):
+            with metrics.stage('deliver'):
+                _, written = write_parquet([(None, window, None)], row_ts, parquet_location, s3_client)
+            return dict(written, failed=0)
+    else:
+        def deliver(window):
+            with metrics.stage('deliver'):
+                return stream_to_firehose(window, row_ts)
+
+    runner = Backfill(
+        fetch,
+        deliver,
+        sink,
+        checkpoints=make_checkpoint_store(event.get('checkpoints', BACKFILL_CHECKPOINTS), s3_client),
+        seen_index=make_seen_days_index(event.get('seen_index', SEEN_INDEX), s3_client),
+        max_workers=int(event.get('max_workers', BACKFILL_MAX_WORKERS)),
+        resume=not event.get('restart'),
+        resend=bool(event.get('resend'))
+    )
+    summary = runner.run(shards)
+    print(f"Backfill: {summary['shards_delivered']} window(s) delivered, {summary['shards_skipped']} already "
+          f"checkpointed, {len(summary['shards_failed'])} failed, {summary['records_sent']} records")
+    metrics.count('shards_skipped', summary['shards_skipped'])
+    metrics.count('shards_failed', len(summary['shards_failed']))
+    metrics.count('records_sent', summary['records_sent'])
+    metrics.count('record_bytes_sent', summary['bytes_sent'])
+    metrics.count('records_failed', summary['records_failed'])
+
+    if summary['shards_failed']:
+        raise RuntimeError(f"{len(summary['shards_failed'])} of {len(shards)} backfill window(s) failed, "
+                           f"first: {summary['shards_failed'][0]}")
+    return dict(summary, mode='backfill', sink=sink, locations_requested=len(locations), window_days=window_days)
+
+def fan_out_backfill(event, context, locations, per_invocation):
+    """
+    Hand the locations to asynchronous invocations of this function, per_invocation each
+    All windows of a location stay in one invocation, so its seen-days entry has one writer
+    """
+    if context is None:
+        raise ValueError("Backfill fan-out needs the Lambda context to invoke this function")
+    lambda_client = lambda_runtime.client('lambda', metrics)
+    invocations = 0
+    for i in range(0, len(locations), per_invocation):
+        payload = dict(event, locations=locations[i:i + per_invocation], fan_out=0)
+        payload.pop('locations_config', None)
+        lambda_client.invoke(
+            FunctionName=context.invoked_function_arn,
+            InvocationType='Event',
+            Payload=json.dumps(payload).encode('utf-8')
+        )
+        invocations += 1
+    metrics.count('invocations', invocations)
+    return {'mode': 'backfill', 'locations_requested': len(locations), 'invocations': invocations}
+
+def advance_watermarks(watermarks, delivered):
+    advanced = 0
+    for location, last_day in delivered:
+        if last_day:
+            watermarks.set(location_key(location), last_day)
+            advanced += 1
+    return advanced
+
+def send_to_firehose(fetched, row_ts):
+    """
+    Encode responses as NDJSON and deliver them through Firehose
+    Returns the (location, last_day) pairs whose records were all accepted
+    """
     # append to list records_to_push
-    # each record is a new list item
+    # each record is one line of newline-delimited JSON
     records_to_push = []
-    for i in range(len(time_list)):
-        # construct each record
-        processed_dict['latitude'] = r_dict['latitude']
-        processed_dict['longitude'] = r_dict['longitude']
-        processed_dict['time'] = time_list[i]
-        processed_dict['temp'] = temp_list[i]
-        processed_dict['row_ts'] = str(datetime.datetime.now())
-    
-        # add a newline to denote the end of a record
-        # add each record to the records_to_push list
-        msg = str(processed_dict) + '\n'
-        records_to_push.append({'Data': msg})
-    
-    fh = boto3.client('firehose')
-    
-    reply = fh.put_record_batch(
-        DeliveryStreamName=FIREHOSE_NAME,
-        Records = records_to_push
+    records_by_location = []
+    with metrics.stage('encode'):
+        for location, response, last_day in fetched:
+            records = encode_response(response, row_ts=row_ts)
+            records_to_push.extend(records)
+            records_by_location.append((location, records, last_day))
+
+    fh = lambda_runtime.client('firehose', metrics)
+
+    # chunk to the PutRecordBatch limits, send chunks in parallel
+    # and resend only the entries Firehose reports as failed
+    sender = FirehoseBatchSender(
+        fh,
+        FIREHOSE_NAME,
+        max_workers=SEND_MAX_WORKERS,
+        max_attempts=SEND_MAX_ATTEMPTS
+    )
+    send_result = sender.send(records_to_push)
+
+    for batch in send_result['batches']:
+        print(f"Batch {batch['batch']}: {batch['records']} records, {batch['bytes']} bytes, "
+              f"{batch['attempts']} attempt(s), {batch['records_per_second']:.0f} records/sec")
+
+    failed_ids = {id(record) for record in send_result['failed_records']}
+    delivered = [
+        (location, last_day)
+        for location, records, last_day in records_by_location
+        if not any(id(record) in failed_ids for record in records)
+    ]
+
+    return delivered, {
+        'sink': 'firehose',
+        # only what Firehose accepted; records that finally failed are in FailedPutCount
+        'records_sent': send_result['records_delivered'],
+        'bytes_sent': send_result['bytes_delivered'],
+        'FailedPutCount': send_result['FailedPutCount'],
+        'batches': send_result['batches'],
+        'records_per_second': send_result['records_per_second']
+    }
+
+def stream_to_firehose(window, row_ts):
+    """
+    Encode and send one backfill window a few PutRecordBatch calls at a time
+    Only one group of encoded records is held at once
+    """
+    sender = FirehoseBatchSender(
+        lambda_runtime.client('firehose', metrics),
+        FIREHOSE_NAME,
+        max_workers=SEND_MAX_WORKERS,
+        max_attempts=SEND_MAX_ATTEMPTS
     )
+    sent = {'records_sent': 0, 'bytes_sent': 0, 'failed': 0}
+    # enough records for every sender thread to have a full batch
+    for records in encode_batches(window, row_ts, MAX_RECORDS_PER_BATCH * SEND_MAX_WORKERS):
+        result = sender.send(records)
+        sent['records_sent'] += result['records_delivered']
+        sent['bytes_sent'] += result['bytes_delivered']
+        sent['failed'] += result['FailedPutCount']
+    return sent
+
+def write_parquet(fetched, row_ts, location_uri, s3_client=None):
+    """
+    Write responses as partitioned Snappy Parquet straight to S3
+    put_object raises on failure, so returning means every location was written
+    """
+    # pyarrow is only needed for this sink (e.g. from the AWS SDK for pandas layer)
+    from parquet_sink import make_parquet_sink
+
+    sink = make_parquet_sink(location_uri, s3_client)
+    written = sink.write([response for _, response, _ in fetched], row_ts)
+
+    for f in written['files']:
+        print(f"Wrote {f['rows']} rows ({f['bytes']} bytes) to s3://{sink.bucket}/{f['key']}")
 
-    return reply
\ No newline at end of file
+    delivered = [(location, last_day) for location, _, last_day in fetched]
+    return delivered, {
+        'sink': 'parquet',
+        'records_sent': written['rows'],
+        'bytes_sent': written['bytes'],
+        'partitions_written': sorted({f['partition'] for f in written['files']}),
+        'files': written['files']
+    }
@@ -0,0 +1,356 @@
+import json
+import os
+import sys
+import threading
+import time
+import urllib.parse
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import boto3
+
+from s3_uri import split_s3_uri
+
+# Structured performance data for the Lambdas and Glue jobs
+# A Metrics object is attached to the boto3 clients (through botocore's event hooks)
+# and the Open-Meteo connection pool, and records per-operation latency, retries,
+# errors and payload bytes. Stage timers and counters are added by the scripts.
+# At the end of a run flush() writes one JSON document next to the extracted
+# metadata and prints the headline numbers as a CloudWatch Embedded Metric Format line.
+# The Glue jobs ship it with --extra-py-files s3://.../instrumentation.py
+
+DEFAULT_LOCATION = 's3://query-results-location-de-proj-04152025/pipeline_metrics/'
+EMF_NAMESPACE = 'WeatherPipeline'
+
+# Latencies kept per operation for the percentiles; beyond this only count, total and max grow
+MAX_SAMPLES = 10000
+
+
+def _percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _body_size(body, headers=None):
+    if isinstance(body, str):
+        return len(body.encode('utf-8'))
+    if isinstance(body, (bytes, bytearray)):
+        return len(body)
+    if hasattr(body, 'seek') and hasattr(body, 'tell'):
+        # file-like bodies (PutObject wraps even bytes in one): measure without consuming
+        # (s3transfer's chunk readers return None from seek, so ask tell() for the end)
+        position = body.tell()
+        body.seek(0, os.SEEK_END)
+        size = body.tell() - position
+        body.seek(position)
+        return size
+    return int((headers or {}).get('Content-Length') or 0)
+
+
+class OperationStats:
+    """
+    Calls, errors, retries, bytes and latency of one operation (e.g. s3.ListObjectsV2)
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.samples = []
+
+    def add(self, ms, error=False, retries=0, bytes_sent=0, bytes_received=0):
+        self.calls += 1
+        self.errors += 1 if error else 0
+        self.retries += retries
+        self.bytes_sent += bytes_sent
+        self.bytes_received += bytes_received
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        if len(self.samples) < MAX_SAMPLES:
+            self.samples.append(ms)
+
+    def to_dict(self):
+        ordered = sorted(self.samples)
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'retries': self.retries,
+            'bytes_sent': self.bytes_sent,
+            'bytes_received': self.bytes_received,
+            'latency_ms': {
+                'total': round(self.total_ms, 1),
+                'p50': round(_percentile(ordered, 0.50), 1) if ordered else None,
+                'p95': round(_percentile(ordered, 0.95), 1) if ordered else None,
+                'max': round(self.max_ms, 1)
+            }
+        }
+
+
+class InstrumentedPool:
+    """
+    urllib3 PoolManager wrapper timing every request
+    Retries are read from the response's retry history, so they include urllib3's own
+    """
+
+    def __init__(self, pool, metrics):
+        self._pool = pool
+        self._metrics = metrics
+
+    def request(self, method, url, *args, **kwargs):
+        operation = f"http.{method} {urllib.parse.urlsplit(url).netloc}"
+        started = time.perf_counter()
+        try:
+            response = self._pool.request(method, url, *args, **kwargs)
+        except Exception:
+            self._metrics.record(operation, (time.perf_counter() - started) * 1000, error=True)
+            raise
+        retries = len(response.retries.history) if response.retries is not None else 0
+        self._metrics.record(
+            operation,
+            (time.perf_counter() - started) * 1000,
+            error=response.status >= 400,
+            retries=retries,
+            bytes_sent=_body_size(kwargs.get('body')),
+            bytes_received=len(response.data or b'')
+        )
+        return response
+
+    def __getattr__(self, name):
+        return getattr(self._pool, name)
+
+
+class Metrics:
+    """
+    Counters, stage timers and per-operation call stats for one run of a component
+    Safe to use from worker threads
+    location is where flush() writes the run's metrics document: s3://bucket/prefix/ or a
+    local directory, '' to only log them. The Glue jobs pass their --metrics-location
+    argument and the Lambdas their METRICS_LOCATION environment variable
+    """
+
+    def __init__(self, component, location=None, dimensions=None, emf=True):
+        self.component = component
+        self.location = DEFAULT_LOCATION if location is None else location
+        self.dimensions = dict(dimensions or {})
+        self.emf = emf
+        self._lock = threading.Lock()
+        # created on the first flush to S3 and kept, so warm Lambdas write through the same client
+        self._s3_client = None
+        self.reset()
+
+    def reset(self):
+        """
+        Start a new run; module-level Metrics in a warm Lambda are reset per invocation
+        """
+        with self._lock:
+            self.run_id = uuid.uuid4().hex
+            self.started_at = datetime.now(timezone.utc)
+            self._started = time.perf_counter()
+            self.status = None
+            self.error = None
+            self.counters = {}
+            self.stages = {}
+            self.operations = {}
+
+    # recording
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def record(self, operation, ms, error=False, retries=0, bytes_sent=0, bytes_received=0):
+        with self._lock:
+            stats = self.operations.get(operation)
+            if stats is None:
+                stats = self.operations[operation] = OperationStats()
+            stats.add(ms, error, retries, bytes_sent, bytes_received)
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Time a block; a stage entered several times accumulates
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            with self._lock:
+                entry = self.stages.setdefault(name, {'runs': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+                entry['runs'] += 1
+                entry['seconds'] += seconds
+                entry['max_seconds'] = max(entry['max_seconds'], seconds)
+
+    def fail(self, error):
+        """
+        Mark the run failed when the script reports failure without raising
+        """
+        self.status = 'failed'
+        self.error = str(error)
+
+    # wiring
+
+    def client(self, service_name, **kwargs):
+        return self.instrument(boto3.client(service_name, **kwargs))
+
+    def instrument(self, client):
+        """
+        Hook a boto3 client; anything without botocore events (e.g. a local stand-in) is returned as is
+        """
+        events = getattr(getattr(client, 'meta', None), 'events', None)
+        if events is None:
+            return client
+        events.register('before-call', self._before_call)
+        events.register('after-call', self._after_call)
+        events.register('after-call-error', self._after_call_error)
+        return client
+
+    def http(self, pool):
+        return InstrumentedPool(pool, self)
+
+    def _before_call(self, model, params, context, **kwargs):
+        context['metrics_started'] = time.perf_counter()
+        context['metrics_bytes_sent'] = _body_size(params.get('body'), params.get('headers'))
+
+    def _after_call(self, model, http_response, parsed, context, **kwargs):
+        started = context.get('metrics_started')
+        if started is None:
+            return
+        received = http_response.headers.get('content-length')
+        if received is None and not model.has_streaming_output:
+            # non-streaming bodies are already read; never touch a streaming one here
+            received = len(http_response.content or b'')
+        self.record(
+            f"{model.service_model.service_name}.{model.name}",
+            (time.perf_counter() - started) * 1000,
+            error='Error' in parsed,
+            retries=parsed.get('ResponseMetadata', {}).get('RetryAttempts', 0),
+            bytes_sent=context.get('metrics_bytes_sent', 0),
+            bytes_received=int(received or 0)
+        )
+
+    def _after_call_error(self, model, exception, context, **kwargs):
+        started = context.get('metrics_started')
+        if started is None:
+            return
+        self.record(
+            f"{model.service_model.service_name}.{model.name}",
+            (time.perf_counter() - started) * 1000,
+            error=True,
+            bytes_sent=context.get('metrics_bytes_sent', 0)
+        )
+
+    # output
+
+    def snapshot(self):
+        with self._lock:
+            operations = {name: stats.to_dict() for name, stats in sorted(self.operations.items())}
+            stages = {
+                name: {'runs': entry['runs'], 'seconds': round(entry['seconds'], 3),
+                       'max_seconds': round(entry['max_seconds'], 3)}
+                for name, entry in self.stages.items()
+            }
+            return {
+                'component': self.component,
+                'run_id': self.run_id,
+                'dimensions': self.dimensions,
+                'status': self.status or 'succeeded',
+                'error': self.error,
+                'started_at': self.started_at.isoformat(),
+                'finished_at': datetime.now(timezone.utc).isoformat(),
+                'wall_seconds': round(time.perf_counter() - self._started, 3),
+                'stages': stages,
+                'counters': dict(self.counters),
+                'operations': operations,
+                'totals': {
+                    'api_calls': sum(o['calls'] for o in operations.values()),
+                    'api_errors': sum(o['errors'] for o in operations.values()),
+                    'api_retries': sum(o['retries'] for o in operations.values()),
+                    'bytes_sent': sum(o['bytes_sent'] for o in operations.values()),
+                    'bytes_received': sum(o['bytes_received'] for o in operations.values())
+                }
+            }
+
+    def emf_record(self, document):
+        """
+        CloudWatch Embedded Metric Format: run totals, stage times and counters under one Component dimension
+        """
+        values = {'WallSeconds': (document['wall_seconds'], 'Seconds'),
+                  'Failed': (1 if document['status'] == 'failed' else 0, 'Count')}
+        for name, value in document['totals'].items():
+            values[name] = (value, 'Bytes' if name.startswith('bytes') else 'Count')
+        for name, entry in document['stages'].items():
+            values[f"stage.{name}"] = (entry['seconds'], 'Seconds')
+        for name, value in document['counters'].items():
+            values[name] = (value, 'Bytes' if 'bytes' in name else 'Count')
+        # EMF accepts at most 100 metrics per record
+        values = dict(list(values.items())[:100])
+
+        record = {
+            '_aws': {
+                'Timestamp': int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': EMF_NAMESPACE,
+                    'Dimensions': [['Component']],
+                    'Metrics': [{'Name': name, 'Unit': unit} for name, (_, unit) in values.items()]
+                }]
+            },
+            'Component': self.component,
+            'RunId': document['run_id']
+        }
+        record.update({name: value for name, (value, _) in values.items()})
+        return record
+
+    def flush(self, status=None):
+        """
+        Write the run's metrics document and emit the EMF line; returns where the document went
+        Called from a finally block, an exception on its way out (a failing sys.exit
+        included) marks the run failed. Never raises: metrics must not fail the run.
+        """
+        exc = sys.exc_info()[1]
+        if status is not None:
+            self.status = status
+        elif exc is not None and not (isinstance(exc, SystemExit) and exc.code in (None, 0)):
+            self.fail(exc if not isinstance(exc, SystemExit) else exc.code)
+
+        document = self.snapshot()
+        if self.emf:
+            print(json.dumps(self.emf_record(document), default=str))
+
+        if not self.location:
+            return None
+        key = (f"{self.component}/date={self.started_at.strftime('%Y-%m-%d')}/"
+               f"{self.started_at.strftime('%H-%M-%S')}_{self.run_id}.json")
+        body = json.dumps(document, indent=2, default=str)
+        try:
+            if self.location.startswith('s3://'):
+                bucket, prefix = split_s3_uri(self.location)
+                if self._s3_client is None:
+                    # not instrumented: writing the document must not show up in the next run's stats
+                    self._s3_client = boto3.client('s3')
+                self._s3_client.put_object(Bucket=bucket, Key=f"{prefix}{key}", Body=body,
+                                           ContentType='application/json')
+                return f"s3://{bucket}/{prefix}{key}"
+            path = os.path.join(self.location, key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(body)
+            return path
+        except Exception as e:
+            print(f"Could not write metrics for {self.component}: {e}")
+            return None
+
+    @contextmanager
+    def run(self):
+        """
+        Reset, run the block, flush whatever happened
+        """
+        self.reset()
+        try:
+            yield self
+        finally:
+            self.flush()
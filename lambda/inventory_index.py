@@ -0,0 +1,138 @@
+import datetime
+import os
+
+from json_store import make_json_store
+from s3_inventory import InventoryAggregate, ReservoirSample
+from s3_uri import split_s3_uri
+
+# Persisted per-partition inventory for the metadata extractor
+# A yr_mo_partition stops changing once its month has closed, so later runs
+# re-list only partitions that are new, still open, moved or changed, and take
+# everything else from the index: O(changed partitions) instead of O(all objects)
+
+# Listing fields kept for sampled objects
+SAMPLE_FIELDS = ('Key', 'Size', 'LastModified', 'StorageClass', 'ETag')
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def partition_month(partition):
+    """
+    YYYY-MM of a partition name like yr_mo_partition=2025-03, or None if it has no month
+    """
+    value = partition.rsplit('=', 1)[-1]
+    try:
+        datetime.datetime.strptime(value, '%Y-%m')
+    except ValueError:
+        return None
+    return value
+
+
+def open_months(now=None):
+    """
+    Months that can still receive data: the current one, and the previous one
+    for late-arriving days around the month boundary
+    """
+    now = now or _now()
+    first = now.date().replace(day=1)
+    previous = first - datetime.timedelta(days=1)
+    return {first.strftime('%Y-%m'), previous.strftime('%Y-%m')}
+
+
+def relist_reason(partition, location, entry, fingerprint=None, max_age=None, now=None):
+    """
+    Why a partition must be listed again, or None when its indexed entry can be reused
+    """
+    if entry is None:
+        return 'new'
+    if entry.get('location') != location:
+        return 'moved'
+    if fingerprint is not None and entry.get('fingerprint') != fingerprint:
+        return 'changed'
+    month = partition_month(partition)
+    if month is None or month in open_months(now):
+        return 'open'
+    if max_age is not None:
+        indexed_at = datetime.datetime.fromisoformat(entry['indexed_at'])
+        if (now or _now()) - indexed_at > max_age:
+            return 'stale'
+    return None
+
+
+def sample_to_dict(sample):
+    items = []
+    for obj in sample.items:
+        item = {field: obj.get(field) for field in SAMPLE_FIELDS}
+        if isinstance(item['LastModified'], datetime.datetime):
+            item['LastModified'] = item['LastModified'].isoformat()
+        items.append(item)
+    return {'seen': sample.seen, 'items': items}
+
+
+def sample_from_dict(data, size):
+    sample = ReservoirSample(size)
+    sample.seen = data.get('seen', 0)
+    for item in data.get('items', [])[:size]:
+        item = dict(item)
+        if isinstance(item.get('LastModified'), str):
+            item['LastModified'] = datetime.datetime.fromisoformat(item['LastModified'])
+        sample.items.append(item)
+    return sample
+
+
+def index_entry(location, aggregate, sample, fingerprint=None):
+    """
+    Index record for one freshly listed partition
+    """
+    return {
+        'location': location,
+        'fingerprint': fingerprint,
+        'indexed_at': _now().isoformat(),
+        'aggregate': aggregate.to_dict(),
+        'sample': sample_to_dict(sample)
+    }
+
+
+def entry_inventory(entry, sample_size):
+    """
+    (aggregate, sample) stored in an index record
+    """
+    return InventoryAggregate.from_dict(entry['aggregate']), sample_from_dict(entry.get('sample', {}), sample_size)
+
+
+class InventoryIndex:
+    """
+    The whole index as one document of a JSON store
+    """
+
+    def __init__(self, store, name):
+        self.store = store
+        self.name = name
+
+    def load(self):
+        document = self.store.get(self.name)
+        return document.get('partitions', {}) if document else {}
+
+    def save(self, partitions):
+        self.store.put(self.name, {'updated_at': _now().isoformat(), 'partitions': partitions})
+
+
+def make_inventory_index(uri, s3_client=None):
+    """
+    Build an index from a URI: s3://bucket/key.json or a local file path
+    On S3 the index is the object itself; a local file keeps it under the file's name
+    Returns None when no URI is configured, which lists every partition on every run
+    """
+    if not uri:
+        return None
+    if uri.startswith('s3://'):
+        if not split_s3_uri(uri)[1]:
+            raise ValueError(f"Inventory index URI needs an object key, got {uri}")
+        location, _, name = uri.rstrip('/').rpartition('/')
+    else:
+        location, name = uri, os.path.basename(uri)
+    if name.endswith('.json'):
+        name = name[:-len('.json')]
+    return InventoryIndex(make_json_store(location, s3_client), name)
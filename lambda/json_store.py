@@ -0,0 +1,87 @@
+import json
+import os
+import threading
+
+from s3_uri import split_s3_uri
+
+# Small JSON documents kept by key between runs, on S3 or in a local file
+# The watermark store, the seen-days index, the inventory index and the backfill
+# checkpoints are built on it; each decides what its documents hold
+
+
+class LocalFileJsonStore:
+    """
+    Every key's document in a single local JSON file - for tests and local runs
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def get(self, key):
+        with self._lock:
+            return self._load().get(key)
+
+    def put(self, key, document):
+        with self._lock:
+            state = self._load()
+            state[key] = document
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.path)
+
+
+class S3JsonStore:
+    """
+    One small JSON object per key, s3://bucket/prefix/<key>.json,
+    so writers of different keys never overwrite each other
+    """
+
+    def __init__(self, s3_client, bucket, prefix):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def _key(self, key):
+        return f"{self.prefix}{key}.json"
+
+    def get(self, key):
+        try:
+            obj = self.s3_client.get_object(Bucket=self.bucket, Key=self._key(key))
+        except self.s3_client.exceptions.NoSuchKey:
+            return None
+        return json.loads(obj['Body'].read())
+
+    def put(self, key, document):
+        self.s3_client.put_object(
+            Bucket=self.bucket,
+            Key=self._key(key),
+            Body=json.dumps(document),
+            ContentType='application/json'
+        )
+
+
+def make_json_store(uri, s3_client=None):
+    """
+    Build a store from a URI: s3://bucket/prefix or a local file path
+    Returns None when no URI is configured
+    """
+    if not uri:
+        return None
+    if uri.startswith('s3://'):
+        bucket, prefix = split_s3_uri(uri)
+        if s3_client is None:
+            import boto3
+            s3_client = boto3.client('s3')
+        return S3JsonStore(s3_client, bucket, prefix)
+    return LocalFileJsonStore(uri)
@@ -0,0 +1,87 @@
+import os
+import threading
+import time
+
+import boto3
+
+# State the Lambdas keep across warm invocations
+# Clients, connection pools and Glue table descriptors are created on first use
+# and then reused by every later invocation of the same container, so a cold
+# start only pays for what the invocation actually touches and a warm one pays
+# for nothing. Everything is safe to use from worker threads.
+
+# How long a Glue table descriptor is trusted before get_table is called again
+GLUE_TABLE_TTL_SECONDS = float(os.environ.get('GLUE_TABLE_TTL_SECONDS', '300'))
+
+_lock = threading.RLock()
+_clients = {}
+_shared = {}
+_tables = {}
+
+
+def client(service_name, metrics=None):
+    """
+    The container's boto3 client for a service, created on first use
+    With metrics (an instrumentation.Metrics) the client is instrumented once, when created
+    """
+    key = (service_name, metrics)
+    with _lock:
+        if key not in _clients:
+            created = boto3.client(service_name)
+            _clients[key] = metrics.instrument(created) if metrics is not None else created
+        return _clients[key]
+
+
+class LazyClient:
+    """
+    Stands in for a module-level client: nothing is created until the first call
+    """
+
+    def __init__(self, service_name, metrics=None):
+        self.service_name = service_name
+        self.metrics = metrics
+
+    def __getattr__(self, name):
+        return getattr(client(self.service_name, self.metrics), name)
+
+
+def lazy_client(service_name, metrics=None):
+    return LazyClient(service_name, metrics)
+
+
+def shared(name, factory):
+    """
+    Any other per-container object (e.g. a keep-alive connection pool), built once by factory()
+    """
+    with _lock:
+        if name not in _shared:
+            _shared[name] = factory()
+        return _shared[name]
+
+
+def glue_table(database, name, glue_client, ttl_seconds=None):
+    """
+    The Glue table descriptor (get_table()['Table']), cached for ttl_seconds
+    Failures are not cached, so a table that appears later is picked up on the next call
+    """
+    ttl = GLUE_TABLE_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+    key = (database, name)
+    with _lock:
+        cached = _tables.get(key)
+    if cached and time.monotonic() - cached[0] < ttl:
+        return cached[1]
+
+    table = glue_client.get_table(DatabaseName=database, Name=name)['Table']
+    with _lock:
+        _tables[key] = (time.monotonic(), table)
+    return table
+
+
+def reset():
+    """
+    Forget every cached client, pool and table, as a new container would
+    """
+    with _lock:
+        _clients.clear()
+        _shared.clear()
+        _tables.clear()
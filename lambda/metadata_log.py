@@ -0,0 +1,202 @@
+import io
+import json
+import os
+import threading
+import uuid
+from datetime import date, datetime, timedelta, timezone
+
+from s3_uri import split_s3_uri
+
+# Append-only log of metadata snapshots as a date-partitioned Parquet dataset
+#   <location>/extraction_date=YYYY-MM-DD/<time>_<id>.parquet
+# Snapshots are buffered and written one file per partition on flush(); a partition
+# is compacted into a single file once it holds COMPACT_AT files, and again when
+# its day is over, so the dashboard reads about one small file per day in range.
+# The Athena table uses partition projection on extraction_date (see
+# grafana/create_metadata_log_table.sql), so no crawler or MSCK REPAIR is needed.
+# Needs pyarrow (e.g. the AWS SDK for pandas Lambda layer)
+
+PARTITION_COLUMN = 'extraction_date'
+
+# Files a partition may hold before it is compacted during the day
+COMPACT_AT = 24
+
+
+def log_schema():
+    import pyarrow as pa
+    # the flattened snapshot, plus the full detailed snapshot as JSON for anything the columns leave out
+    return pa.schema([
+        ('run_id', pa.string()),
+        ('table_name', pa.string()),
+        ('source_database', pa.string()),
+        ('extraction_time', pa.timestamp('ms')),
+        ('column_count', pa.int64()),
+        ('s3_location', pa.string()),
+        ('s3_objects_count', pa.int64()),
+        ('s3_total_size_bytes', pa.int64()),
+        ('s3_latest_modification', pa.string()),
+        ('partition_count', pa.int64()),
+        ('row_count', pa.int64()),
+        ('partitions_relisted', pa.int64()),
+        ('partitions_from_index', pa.int64()),
+        ('detail_json', pa.string())
+    ])
+
+
+class MetadataLog:
+    """
+    Buffered writer for the metadata log at an s3://bucket/prefix/ or a local directory
+    """
+
+    def __init__(self, location, s3_client=None, compact_at=COMPACT_AT):
+        self.location = location if location.endswith('/') else location + '/'
+        self.compact_at = compact_at
+        self._s3_client = s3_client
+        self._lock = threading.Lock()
+        self._buffer = []
+        if self.location.startswith('s3://'):
+            self.bucket, self.prefix = split_s3_uri(self.location)
+        else:
+            self.bucket, self.prefix = None, self.location
+
+    # storage: S3 or a local directory
+
+    @property
+    def s3_client(self):
+        if self._s3_client is None:
+            import boto3
+            self._s3_client = boto3.client('s3')
+        return self._s3_client
+
+    def _list(self, prefix):
+        if self.bucket is None:
+            directory = os.path.join(self.prefix, prefix)
+            if not os.path.isdir(directory):
+                return []
+            return sorted(prefix + name for name in os.listdir(directory) if name.endswith('.parquet'))
+        keys = []
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix + prefix):
+            keys.extend(obj['Key'][len(self.prefix):] for obj in page.get('Contents', [])
+                        if obj['Key'].endswith('.parquet'))
+        return sorted(keys)
+
+    def _read(self, key):
+        if self.bucket is None:
+            with open(os.path.join(self.prefix, key), 'rb') as f:
+                return f.read()
+        return self.s3_client.get_object(Bucket=self.bucket, Key=self.prefix + key)['Body'].read()
+
+    def _write(self, key, body):
+        if self.bucket is None:
+            path = os.path.join(self.prefix, key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(f"{path}.tmp", 'wb') as f:
+                f.write(body)
+            os.replace(f"{path}.tmp", path)
+            return path
+        self.s3_client.put_object(Bucket=self.bucket, Key=self.prefix + key, Body=body)
+        return f"s3://{self.bucket}/{self.prefix}{key}"
+
+    def _delete(self, keys):
+        if self.bucket is None:
+            for key in keys:
+                os.remove(os.path.join(self.prefix, key))
+            return
+        for i in range(0, len(keys), 1000):
+            self.s3_client.delete_objects(
+                Bucket=self.bucket,
+                Delete={'Objects': [{'Key': self.prefix + key} for key in keys[i:i + 1000]], 'Quiet': True}
+            )
+
+    # writing
+
+    def append(self, snapshot, detail=None):
+        """
+        Buffer one snapshot (the flattened metadata dict); detail is stored as JSON
+        """
+        extraction_time = snapshot['extraction_time']
+        if isinstance(extraction_time, str):
+            extraction_time = datetime.strptime(extraction_time, '%Y-%m-%d %H:%M:%S')
+        record = {name: snapshot.get(name) for name in log_schema().names}
+        record.update({
+            'run_id': snapshot.get('run_id') or uuid.uuid4().hex,
+            'extraction_time': extraction_time,
+            'detail_json': json.dumps(detail, default=str) if detail is not None else None
+        })
+        with self._lock:
+            self._buffer.append(record)
+        return record
+
+    def flush(self):
+        """
+        Write the buffered snapshots, one Parquet file per extraction_date
+        Returns {extraction_date: location written}
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        with self._lock:
+            records, self._buffer = self._buffer, []
+        by_day = {}
+        for record in records:
+            by_day.setdefault(record['extraction_time'].strftime('%Y-%m-%d'), []).append(record)
+
+        written = {}
+        stamp = datetime.now(timezone.utc).strftime('%H-%M-%S')
+        for day, rows in sorted(by_day.items()):
+            buf = io.BytesIO()
+            pq.write_table(pa.Table.from_pylist(rows, schema=log_schema()), buf, compression='snappy')
+            key = f"{PARTITION_COLUMN}={day}/{stamp}_{uuid.uuid4().hex[:12]}.parquet"
+            written[day] = self._write(key, buf.getvalue())
+        return written
+
+    # compaction
+
+    def compact(self, day):
+        """
+        Merge every file of one extraction_date into one; returns the number of files merged
+        The merged file is written before the originals are deleted, so a query in
+        between can see a snapshot twice (run_id tells them apart), never miss one
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        keys = self._list(f"{PARTITION_COLUMN}={day}/")
+        if len(keys) < 2:
+            return 0
+        schema = log_schema()
+        table = pa.concat_tables(
+            pq.read_table(io.BytesIO(self._read(key))).select(schema.names).cast(schema) for key in keys
+        ).sort_by([('extraction_time', 'ascending')])
+        buf = io.BytesIO()
+        pq.write_table(table, buf, compression='snappy')
+        self._write(f"{PARTITION_COLUMN}={day}/compacted_{uuid.uuid4().hex[:12]}.parquet", buf.getvalue())
+        self._delete(keys)
+        return len(keys)
+
+    def maintain(self, today=None):
+        """
+        Periodic compaction: today's partition once it reaches compact_at files,
+        yesterday's as soon as it holds more than one
+        Returns {extraction_date: files merged} for the partitions compacted
+        """
+        today = today or date.today()
+        compacted = {}
+        yesterday = (today - timedelta(days=1)).isoformat()
+        if len(self._list(f"{PARTITION_COLUMN}={today.isoformat()}/")) >= self.compact_at:
+            compacted[today.isoformat()] = self.compact(today.isoformat())
+        merged = self.compact(yesterday)
+        if merged:
+            compacted[yesterday] = merged
+        return compacted
+
+
+def make_metadata_log(uri, s3_client=None, compact_at=COMPACT_AT):
+    """
+    Build a log from a URI: s3://bucket/prefix or a local directory
+    Returns None when no URI is configured
+    """
+    if not uri:
+        return None
+    return MetadataLog(uri, s3_client, compact_at)
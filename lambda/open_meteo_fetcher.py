@@ -0,0 +1,156 @@
+import json
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+import urllib3
+
+OPEN_METEO_FORECAST_URL = "https://api.open-meteo.com/v1/forecast"
+
+# the location the pipeline was originally built around
+# used when the event does not name any locations
+DEFAULT_LOCATION = {
+    "name": "new_york",
+    "latitude": 40.7143,
+    "longitude": -74.006,
+    "timezone": "America/New_York"
+}
+
+# HTTP statuses worth retrying - rate limiting and transient server errors
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def build_forecast_url(location, start_date, end_date,
+                       daily="temperature_2m_max", temperature_unit="fahrenheit"):
+    """
+    Build the Open-Meteo request URL for a single location and date range
+    """
+    params = {
+        "latitude": location["latitude"],
+        "longitude": location["longitude"],
+        "daily": daily,
+        "temperature_unit": temperature_unit,
+        "timezone": location.get("timezone", "auto"),
+        "start_date": start_date,
+        "end_date": end_date
+    }
+    return f"{OPEN_METEO_FORECAST_URL}?{urllib.parse.urlencode(params)}"
+
+
+def make_pool_manager(max_workers):
+    """
+    One connection pool shared by every worker thread
+    urllib3.PoolManager is thread safe, so sizing it to the worker count
+    lets each thread keep its own keep-alive connection to the API host
+    """
+    return urllib3.PoolManager(maxsize=max_workers, block=True)
+
+
+def fetch_location(http, location, start_date, end_date,
+                   timeout=10.0, retries=3, backoff_factor=0.5, cache=None):
+    """
+    Fetch one location and return a result dict instead of raising,
+    so a single bad station does not sink the whole fan-out
+    A location may carry its own start_date/end_date, which take precedence
+    With a response cache, repeat requests are served from local disk
+    """
+    url = build_forecast_url(
+        location,
+        location.get("start_date", start_date),
+        location.get("end_date", end_date)
+    )
+    started = time.perf_counter()
+    result = {"location": location, "url": url, "response": None, "error": None, "cache_hit": False}
+
+    if cache is not None:
+        body = cache.get(url)
+        if body is not None:
+            result["response"] = json.loads(body.decode(encoding='utf-8', errors='strict'))
+            result["cache_hit"] = True
+            result["elapsed_seconds"] = time.perf_counter() - started
+            return result
+
+    try:
+        r = http.request(
+            "GET",
+            url,
+            timeout=urllib3.Timeout(connect=min(timeout, 3.0), read=timeout),
+            retries=urllib3.Retry(
+                total=retries,
+                backoff_factor=backoff_factor,
+                status_forcelist=RETRY_STATUSES,
+                allowed_methods=["GET"],
+                raise_on_status=False
+            )
+        )
+        if r.status != 200:
+            result["error"] = f"HTTP {r.status}: {r.data[:200]!r}"
+        else:
+            result["response"] = json.loads(r.data.decode(encoding='utf-8', errors='strict'))
+            if cache is not None:
+                cache.put(url, r.data)
+    except Exception as e:
+        result["error"] = str(e)
+    result["elapsed_seconds"] = time.perf_counter() - started
+    return result
+
+
+def fetch_locations(locations, start_date, end_date, max_workers=16,
+                    timeout=10.0, retries=3, http=None, cache=None):
+    """
+    Fetch every location concurrently with a bounded thread pool
+    Wall time tracks the slowest fetch rather than the sum of all fetches
+    Results come back in the same order as the input locations
+    """
+    if not locations:
+        return []
+
+    workers = max(1, min(max_workers, len(locations)))
+    if http is None:
+        http = make_pool_manager(workers)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(fetch_location, http, location, start_date, end_date,
+                            timeout, retries, cache=cache)
+            for location in locations
+        ]
+        return [future.result() for future in futures]
+
+
+def load_locations(event, config_path=None):
+    """
+    Resolve the list of locations for this run, in order of precedence:
+    1. event["locations"] - a list of {"latitude", "longitude", ...} dicts
+    2. event["locations_config"] or config_path - a JSON file holding that list
+    3. DEFAULT_LOCATION
+    """
+    event = event or {}
+
+    if event.get("locations"):
+        return [normalize_location(loc) for loc in event["locations"]]
+
+    path = event.get("locations_config") or config_path
+    if path:
+        with open(path, encoding="utf-8") as f:
+            config = json.load(f)
+        # allow either a bare list or {"locations": [...]}
+        if isinstance(config, dict):
+            config = config.get("locations", [])
+        return [normalize_location(loc) for loc in config]
+
+    return [dict(DEFAULT_LOCATION)]
+
+
+def normalize_location(location):
+    """
+    Validate a location entry and fill in defaults
+    """
+    if "latitude" not in location or "longitude" not in location:
+        raise ValueError(f"Location is missing latitude/longitude: {location}")
+    normalized = dict(location)
+    normalized["latitude"] = float(location["latitude"])
+    normalized["longitude"] = float(location["longitude"])
+    normalized.setdefault("timezone", "auto")
+    normalized.setdefault("name", f"{normalized['latitude']}_{normalized['longitude']}")
+    return normalized
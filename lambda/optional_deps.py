@@ -0,0 +1,16 @@
+# Checks for optional dependencies, shared by the Lambdas and the Glue jobs
+# pyarrow comes from a Lambda layer (e.g. the AWS SDK for pandas) or, in Glue,
+# from --additional-python-modules; everything that needs it degrades without it
+# Ship it to the Glue jobs with --extra-py-files, like s3_uri.py
+
+
+def pyarrow_available():
+    """
+    True when pyarrow, with the JSON reader and Parquet support, can be imported
+    """
+    try:
+        import pyarrow.json  # noqa: F401
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
@@ -0,0 +1,188 @@
+import datetime
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+# Row-level statistics from Parquet footers, without reading any data pages
+# A Parquet file ends with <footer><4-byte footer length>PAR1, so one suffix
+# ranged GET (two for unusually large footers) gives row counts, per-column
+# min / max / null counts and the real schema for a few KB of I/O per file
+# pyarrow is only needed to decode the footer and is imported lazily
+
+MAGIC = b'PAR1'
+# First suffix read; the footers of the weather files are a couple of KB
+INITIAL_READ_BYTES = 64 * 1024
+
+# Arrow types to the Athena / Glue type names used in table_info["columns"]
+ATHENA_TYPES = {
+    'double': 'double',
+    'float': 'float',
+    'int64': 'bigint',
+    'int32': 'int',
+    'int16': 'smallint',
+    'int8': 'tinyint',
+    'bool': 'boolean',
+    'string': 'string',
+    'large_string': 'string',
+    'date32[day]': 'date',
+    'binary': 'binary'
+}
+
+
+def read_footer_bytes(s3_client, bucket, key, size=None, initial_bytes=INITIAL_READ_BYTES):
+    """
+    The footer, its length and the trailing magic of a Parquet object, via ranged GETs
+    Returns None when the object is not a Parquet file
+    """
+    if size is not None and size < 12:
+        return None
+    read = initial_bytes if size is None else min(initial_bytes, size)
+    tail = s3_client.get_object(Bucket=bucket, Key=key, Range=f"bytes=-{read}")['Body'].read()
+    if len(tail) < 8 or tail[-4:] != MAGIC:
+        return None
+
+    footer_length = struct.unpack('<I', tail[-8:-4])[0]
+    needed = footer_length + 8
+    if needed > len(tail):
+        # footer larger than the first read - fetch exactly the missing part
+        missing = needed - len(tail)
+        if size is not None:
+            start = size - needed
+            head = s3_client.get_object(Bucket=bucket, Key=key,
+                                        Range=f"bytes={start}-{start + missing - 1}")['Body'].read()
+        else:
+            head = s3_client.get_object(Bucket=bucket, Key=key, Range=f"bytes=-{needed}")['Body'].read()[:missing]
+        tail = head + tail
+    return tail[-needed:]
+
+
+def _jsonable(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, bytes):
+        return value.decode('utf-8', errors='replace')
+    return value
+
+
+def parse_footer(footer):
+    """
+    File statistics from footer bytes (as returned by read_footer_bytes)
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # read_metadata only looks at the end of the buffer; the leading magic makes it a valid file
+    metadata = pq.read_metadata(pa.BufferReader(MAGIC + footer))
+    schema = metadata.schema.to_arrow_schema()
+    columns = {}
+    for i in range(metadata.num_row_groups):
+        row_group = metadata.row_group(i)
+        for j in range(row_group.num_columns):
+            chunk = row_group.column(j)
+            name = chunk.path_in_schema
+            column = columns.setdefault(name, {'min': None, 'max': None, 'null_count': 0})
+            stats = chunk.statistics
+            if stats is None:
+                column['null_count'] = None
+                continue
+            if column['null_count'] is not None:
+                column['null_count'] += stats.null_count
+            if stats.has_min_max:
+                column['min'] = _jsonable(stats.min) if column['min'] is None else min(column['min'], _jsonable(stats.min))
+                column['max'] = _jsonable(stats.max) if column['max'] is None else max(column['max'], _jsonable(stats.max))
+    return {
+        'rows': metadata.num_rows,
+        'row_groups': metadata.num_row_groups,
+        'footer_bytes': len(footer),
+        'schema': [{'name': field.name, 'type': ATHENA_TYPES.get(str(field.type), str(field.type))} for field in schema],
+        'columns': columns
+    }
+
+
+class FooterCache:
+    """
+    Parsed footer statistics keyed by ETag - a file's footer cannot change without its ETag changing
+    Seeded from the inventory index so unchanged files are never read again
+    entries is used in place, so a dict kept across invocations keeps what this run reads
+    """
+
+    def __init__(self, entries=None):
+        self.entries = entries if entries is not None else {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, etag):
+        stats = self.entries.get(etag)
+        if stats is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return stats
+
+    def put(self, etag, stats):
+        self.entries[etag] = stats
+
+    def retain(self, etags):
+        """
+        Drop every entry whose ETag is not in etags
+        """
+        for etag in [etag for etag in self.entries if etag not in etags]:
+            del self.entries[etag]
+
+
+def collect_footer_stats(s3_client, objects, cache, max_workers=16):
+    """
+    {ETag: file stats} for objects given as dicts with Bucket, Key, ETag and Size,
+    reading only uncached footers; objects that are not Parquet files are left out
+    Returns (stats, errors): a file whose footer cannot be read or parsed (a throttled
+    GET, a corrupt object) is skipped and listed in errors as (object, message),
+    so one bad file never costs the stats of the others
+    """
+    results = {}
+    to_read = []
+    for obj in objects:
+        stats = cache.get(obj['ETag'])
+        if stats is not None:
+            results[obj['ETag']] = stats
+        else:
+            to_read.append(obj)
+
+    def read(obj):
+        try:
+            footer = read_footer_bytes(s3_client, obj['Bucket'], obj['Key'], obj.get('Size'))
+            return obj, (parse_footer(footer) if footer is not None else None), None
+        except Exception as e:
+            return obj, None, f"{type(e).__name__}: {e}"
+
+    errors = []
+    if to_read:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(to_read)))) as executor:
+            for obj, stats, error in executor.map(read, to_read):
+                if error is not None:
+                    errors.append((obj, error))
+                elif stats is not None:
+                    cache.put(obj['ETag'], stats)
+                    results[obj['ETag']] = stats
+    return results, errors
+
+
+def merge_stats(file_stats):
+    """
+    Combine file (or partition) statistics into one summary
+    """
+    merged = {'files': 0, 'rows': 0, 'row_groups': 0, 'footer_bytes': 0, 'schema': None, 'columns': {}}
+    for stats in file_stats:
+        merged['files'] += stats.get('files', 1)
+        merged['rows'] += stats['rows']
+        merged['row_groups'] += stats['row_groups']
+        merged['footer_bytes'] += stats['footer_bytes']
+        if merged['schema'] is None:
+            merged['schema'] = stats['schema']
+        for name, column in stats['columns'].items():
+            target = merged['columns'].setdefault(name, {'min': None, 'max': None, 'null_count': 0})
+            if target['null_count'] is not None:
+                target['null_count'] = None if column['null_count'] is None else target['null_count'] + column['null_count']
+            if column['min'] is not None:
+                target['min'] = column['min'] if target['min'] is None else min(target['min'], column['min'])
+            if column['max'] is not None:
+                target['max'] = column['max'] if target['max'] is None else max(target['max'], column['max'])
+    return merged
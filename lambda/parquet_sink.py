@@ -0,0 +1,111 @@
+import io
+import uuid
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from s3_uri import split_s3_uri
+
+# same columns, names and types the CTAS in create_parquet_weather_table_glue_job.py writes
+# (Athena lowercases temp_F / temp_C); yr_mo_partition lives in the path, not the file
+TRANSFORMED_SCHEMA = pa.schema([
+    ('latitude', pa.float64()),
+    ('longitude', pa.float64()),
+    ('temp_f', pa.float64()),
+    ('temp_c', pa.float64()),
+    ('row_ts', pa.string()),
+    ('time', pa.string())
+])
+
+PARTITION_COLUMN = 'yr_mo_partition'
+
+
+def response_to_table(r_dict, row_ts):
+    """
+    Build an Arrow table straight from one response's daily arrays
+    """
+    daily = r_dict['daily']
+    n = len(daily['time'])
+    # nulls become 0.0, the same as the Firehose path
+    temp_f = pc.fill_null(pa.array(daily['temperature_2m_max'], type=pa.float64()), 0.0)
+    temp_c = pc.multiply(pc.subtract(temp_f, 32.0), 5.0 / 9.0)
+    return pa.table({
+        'latitude': pa.array([float(r_dict['latitude'])] * n, type=pa.float64()),
+        'longitude': pa.array([float(r_dict['longitude'])] * n, type=pa.float64()),
+        'temp_f': temp_f,
+        'temp_c': temp_c,
+        'row_ts': pa.array([row_ts] * n, type=pa.string()),
+        'time': pa.array(daily['time'], type=pa.string())
+    }, schema=TRANSFORMED_SCHEMA)
+
+
+def split_by_partition(table):
+    """
+    Yield (yr_mo_partition, sub-table) pairs - SUBSTRING(time,1,7) in the CTAS
+    """
+    if table.num_rows == 0:
+        return
+    partitions = pc.utf8_slice_codeunits(table['time'], 0, 7)
+    for value in pc.unique(partitions).to_pylist():
+        yield value, table.filter(pc.equal(partitions, value))
+
+
+def table_to_parquet_bytes(table):
+    buf = io.BytesIO()
+    pq.write_table(table, buf, compression='snappy')
+    return buf.getvalue()
+
+
+class ParquetSink:
+    """
+    Writes API responses as Snappy Parquet under
+    s3://bucket/prefix/yr_mo_partition=YYYY-MM/, the layout of the transformed table
+    One file per partition per run; file names carry a run id so runs never collide
+    """
+
+    def __init__(self, s3_client, bucket, prefix):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+
+    def write(self, responses, row_ts):
+        """
+        Write every response and return a summary of the files written
+        """
+        tables = [response_to_table(r_dict, row_ts) for r_dict in responses]
+        if not tables:
+            return {'rows': 0, 'bytes': 0, 'files': []}
+
+        table = pa.concat_tables(tables)
+        run_id = uuid.uuid4().hex
+        files = []
+        for partition_value, part in split_by_partition(table):
+            body = table_to_parquet_bytes(part)
+            key = f"{self.prefix}/{PARTITION_COLUMN}={partition_value}/{run_id}.snappy.parquet"
+            self.s3_client.put_object(Bucket=self.bucket, Key=key, Body=body)
+            files.append({
+                'partition': partition_value,
+                'key': key,
+                'rows': part.num_rows,
+                'bytes': len(body)
+            })
+
+        return {
+            'rows': table.num_rows,
+            'bytes': sum(f['bytes'] for f in files),
+            'files': files
+        }
+
+
+def make_parquet_sink(uri, s3_client=None):
+    """
+    Build a sink from s3://bucket/prefix
+    """
+    if not uri.startswith('s3://'):
+        raise ValueError(f"Parquet sink location must be an s3:// URI, got {uri}")
+    bucket, prefix = split_s3_uri(uri)
+    if s3_client is None:
+        import boto3
+        s3_client = boto3.client('s3')
+    return ParquetSink(s3_client, bucket, prefix)
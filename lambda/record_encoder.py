@@ -0,0 +1,57 @@
+import datetime
+import json
+from json.encoder import encode_basestring
+
+# column order matches the records the crawler has always seen
+RECORD_FIELDS = ('latitude', 'longitude', 'time', 'temp', 'row_ts')
+
+
+def encode_number(value):
+    """
+    JSON-encode a number the same way json.dumps does
+    null values become 0.0 - if we don't, the crawler may get confused
+    """
+    if value is None:
+        return '0.0'
+    # repr matches json.dumps for the ints and finite floats json.loads produces
+    if type(value) in (int, float):
+        return repr(value)
+    return json.dumps(value)
+
+
+def encode_daily_records(latitude, longitude, times, temps, row_ts=None):
+    """
+    Encode one location's daily arrays as newline-delimited JSON records
+
+    Everything that is constant for the batch (coordinates, ingest timestamp)
+    is encoded once into a shared prefix/suffix, so each row only costs one
+    string escape for the date, one number format and one concatenation
+    """
+    if len(times) != len(temps):
+        raise ValueError(f"time and temperature arrays differ in length: {len(times)} != {len(temps)}")
+
+    if row_ts is None:
+        row_ts = str(datetime.datetime.now())
+
+    prefix = f'{{"latitude": {json.dumps(latitude)}, "longitude": {json.dumps(longitude)}, "time": '
+    suffix = f', "row_ts": {encode_basestring(row_ts)}}}\n'
+
+    return [
+        (prefix + encode_basestring(t) + ', "temp": ' + encode_number(temp) + suffix).encode('utf-8')
+        for t, temp in zip(times, temps)
+    ]
+
+
+def encode_response(r_dict, row_ts=None):
+    """
+    Encode an Open-Meteo daily response dictionary as Firehose records
+    """
+    daily = r_dict['daily']
+    payloads = encode_daily_records(
+        r_dict['latitude'],
+        r_dict['longitude'],
+        daily['time'],
+        daily['temperature_2m_max'],
+        row_ts=row_ts
+    )
+    return [{'Data': payload} for payload in payloads]
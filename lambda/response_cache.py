@@ -0,0 +1,165 @@
+import datetime
+import hashlib
+import json
+import os
+import threading
+import time
+import urllib.parse
+
+# query parameters that change what the API returns
+# anything else (e.g. cache busters, api keys) is left out of the cache key
+KEY_PARAMS = (
+    "latitude", "longitude", "daily", "hourly", "temperature_unit",
+    "wind_speed_unit", "precipitation_unit", "timezone", "start_date", "end_date"
+)
+
+
+def normalize_request(url):
+    """
+    Canonical form of an Open-Meteo request: location, variables,
+    date range and units, independent of parameter order and formatting
+    """
+    parsed = urllib.parse.urlparse(url)
+    params = dict(urllib.parse.parse_qsl(parsed.query))
+    normalized = {"endpoint": f"{parsed.netloc}{parsed.path}"}
+    for name in KEY_PARAMS:
+        if name not in params:
+            continue
+        value = params[name]
+        if name in ("latitude", "longitude"):
+            value = f"{float(value):.4f}"
+        elif name in ("daily", "hourly"):
+            value = ",".join(sorted(v.strip() for v in value.split(",")))
+        normalized[name] = value
+    return normalized
+
+
+def cache_key(url):
+    canonical = json.dumps(normalize_request(url), sort_keys=True)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Size-bounded LRU cache of raw API responses on local disk
+
+    - a range that ended before (today - closed_lag_days) is history and never expires
+    - a range that reaches today or later expires after ttl_seconds
+    - file modification time doubles as the LRU clock; a hit touches the file
+    - once the directory grows past max_bytes the least recently used entries are evicted
+    """
+
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024, ttl_seconds=900, closed_lag_days=1):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.closed_lag_days = closed_lag_days
+        self._lock = threading.Lock()
+        self._total_bytes = None
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.cache")
+
+    def _expires_at(self, url, now):
+        end_date = normalize_request(url).get("end_date")
+        if end_date:
+            closed_before = datetime.date.today() - datetime.timedelta(days=self.closed_lag_days)
+            if datetime.date.fromisoformat(end_date) < closed_before:
+                return None
+        return now + self.ttl_seconds
+
+    def get(self, url):
+        """
+        Return the cached response body (bytes) or None on a miss
+        """
+        path = self._path(cache_key(url))
+        try:
+            with open(path, "rb") as f:
+                header = json.loads(f.readline())
+                body = f.read()
+        except (FileNotFoundError, ValueError):
+            return None
+
+        if header["expires_at"] is not None and header["expires_at"] < time.time():
+            self._discard(path)
+            return None
+
+        # mark as recently used
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return body
+
+    def put(self, url, body):
+        """
+        Store a response body, evicting least recently used entries if needed
+        """
+        now = time.time()
+        path = self._path(cache_key(url))
+        header = json.dumps({"url": url, "stored_at": now, "expires_at": self._expires_at(url, now)})
+        payload = header.encode("utf-8") + b"\n" + body
+
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(payload)
+
+        with self._lock:
+            total = self._current_total()
+            try:
+                total -= os.path.getsize(path)
+            except FileNotFoundError:
+                pass
+            os.replace(tmp_path, path)
+            self._total_bytes = total + len(payload)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _current_total(self):
+        if self._total_bytes is None:
+            self._total_bytes = sum(size for _, _, size in self._entries())
+        return self._total_bytes
+
+    def _entries(self):
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(".cache"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, entry.path, stat.st_size))
+        return entries
+
+    def _evict(self):
+        # oldest access first
+        for _, path, size in sorted(self._entries()):
+            if self._total_bytes <= self.max_bytes:
+                break
+            if self._remove(path):
+                self._total_bytes -= size
+
+    def _discard(self, path):
+        with self._lock:
+            try:
+                size = os.path.getsize(path)
+            except FileNotFoundError:
+                return
+            if self._remove(path) and self._total_bytes is not None:
+                self._total_bytes -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+
+def make_response_cache(directory, max_mb=256, ttl_seconds=900):
+    """
+    Build a cache from configuration, or None when no directory is configured
+    """
+    if not directory:
+        return None
+    return ResponseCache(directory, max_bytes=int(max_mb * 1024 * 1024), ttl_seconds=ttl_seconds)
@@ -0,0 +1,195 @@
+import random
+from datetime import datetime
+
+# Streaming S3 inventory for the metadata extractor
+# Listing pages are folded into running aggregates as they arrive, so memory
+# stays constant no matter how many objects a table has
+
+
+class ReservoirSample:
+    """
+    Uniform random sample of at most `size` items from a stream of unknown length
+    """
+
+    def __init__(self, size, rng=None):
+        self.size = size
+        self.seen = 0
+        self.items = []
+        self._rng = rng or random.Random()
+
+    def add(self, item):
+        self.seen += 1
+        if len(self.items) < self.size:
+            self.items.append(item)
+            return
+        slot = self._rng.randrange(self.seen)
+        if slot < self.size:
+            self.items[slot] = item
+
+    def merge(self, other):
+        """
+        Combine two reservoirs into one that is still uniform over both streams
+        """
+        total = self.seen + other.seen
+        if total == 0:
+            return
+        mine = list(self.items)
+        theirs = list(other.items)
+        merged = []
+        remaining_mine, remaining_theirs = self.seen, other.seen
+        while len(merged) < self.size and (mine or theirs):
+            # pick the source in proportion to how many items each one stands for
+            if not theirs:
+                take_mine = True
+            elif not mine:
+                take_mine = False
+            else:
+                take_mine = self._rng.random() < remaining_mine / (remaining_mine + remaining_theirs)
+            if take_mine:
+                merged.append(mine.pop(self._rng.randrange(len(mine))))
+                remaining_mine -= 1
+            else:
+                merged.append(theirs.pop(self._rng.randrange(len(theirs))))
+                remaining_theirs -= 1
+        self.items = merged
+        self.seen = total
+
+
+class InventoryAggregate:
+    """
+    Running count, bytes, LastModified range and storage-class histogram
+    The newest object's key and ETag are kept as a high-water mark
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total_bytes = 0
+        self.min_last_modified = None
+        self.max_last_modified = None
+        self.latest_key = None
+        self.latest_etag = None
+        self.storage_classes = {}
+
+    def add(self, obj):
+        """
+        Fold one entry of a list_objects_v2 page into the aggregate
+        """
+        self.count += 1
+        self.total_bytes += obj.get('Size', 0) or 0
+        storage_class = obj.get('StorageClass', 'STANDARD')
+        self.storage_classes[storage_class] = self.storage_classes.get(storage_class, 0) + 1
+
+        modified = obj.get('LastModified')
+        if modified is None:
+            return
+        if self.min_last_modified is None or modified < self.min_last_modified:
+            self.min_last_modified = modified
+        if self.max_last_modified is None or modified > self.max_last_modified:
+            self.max_last_modified = modified
+            self.latest_key = obj.get('Key')
+            self.latest_etag = obj.get('ETag')
+
+    def merge(self, other):
+        self.count += other.count
+        self.total_bytes += other.total_bytes
+        for storage_class, count in other.storage_classes.items():
+            self.storage_classes[storage_class] = self.storage_classes.get(storage_class, 0) + count
+        if other.min_last_modified is not None and (
+                self.min_last_modified is None or other.min_last_modified < self.min_last_modified):
+            self.min_last_modified = other.min_last_modified
+        if other.max_last_modified is not None and (
+                self.max_last_modified is None or other.max_last_modified > self.max_last_modified):
+            self.max_last_modified = other.max_last_modified
+            self.latest_key = other.latest_key
+            self.latest_etag = other.latest_etag
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "total_bytes": self.total_bytes,
+            "min_last_modified": _iso(self.min_last_modified),
+            "max_last_modified": _iso(self.max_last_modified),
+            "latest_key": self.latest_key,
+            "latest_etag": self.latest_etag,
+            "storage_classes": dict(self.storage_classes)
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        aggregate = cls()
+        aggregate.count = data["count"]
+        aggregate.total_bytes = data["total_bytes"]
+        aggregate.min_last_modified = _parse(data.get("min_last_modified"))
+        aggregate.max_last_modified = _parse(data.get("max_last_modified"))
+        aggregate.latest_key = data.get("latest_key")
+        aggregate.latest_etag = data.get("latest_etag")
+        aggregate.storage_classes = dict(data.get("storage_classes", {}))
+        return aggregate
+
+
+def _iso(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _parse(value):
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+def sample_entry(obj):
+    """
+    The fields kept for an object in the detailed metadata sample
+    """
+    return {
+        "key": obj.get('Key'),
+        "size": obj.get('Size'),
+        "last_modified": obj.get('LastModified'),
+        "storage_class": obj.get('StorageClass'),
+        "etag": obj.get('ETag')
+    }
+
+
+def aggregate_prefix(s3_client, bucket_name, prefix, sample_size=5, on_object=None):
+    """
+    Stream every object under a prefix into an aggregate and a reservoir sample
+    Only one listing page (at most 1000 entries) is in memory at a time;
+    the sample keeps raw listing entries, see sample_entry()
+    on_object, if given, is called with every listing entry
+    """
+    aggregate = InventoryAggregate()
+    sample = ReservoirSample(sample_size)
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+        for obj in page.get('Contents', []):
+            # skip folder markers
+            if obj.get('Key', '').endswith('/'):
+                continue
+            aggregate.add(obj)
+            sample.add(obj)
+            if on_object is not None:
+                on_object(obj)
+    return aggregate, sample
+
+
+class TableInventory:
+    """
+    Table-wide aggregate, per-partition aggregates and one bounded sample
+    """
+
+    def __init__(self, sample_size=5):
+        self.total = InventoryAggregate()
+        self.partitions = {}
+        self.sample = ReservoirSample(sample_size)
+
+    def add_partition(self, partition, aggregate, sample):
+        if partition in self.partitions:
+            self.partitions[partition].merge(aggregate)
+        else:
+            self.partitions[partition] = aggregate
+        self.total.merge(aggregate)
+        self.sample.merge(sample)
+
+    def sample_entries(self):
+        return [sample_entry(obj) for obj in self.sample.items]
+
+    def partition_summaries(self):
+        return {partition: aggregate.to_dict() for partition, aggregate in sorted(self.partitions.items())}
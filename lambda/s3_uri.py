@@ -0,0 +1,19 @@
+import re
+
+# S3 location parsing shared by the Lambdas and the Glue jobs
+# Ship it to the Glue jobs with --extra-py-files, like instrumentation.py
+
+
+def split_s3_uri(uri):
+    """
+    s3://bucket/prefix -> (bucket, prefix)
+    Repeated slashes are collapsed and a non-empty prefix always ends with "/",
+    so it can be used as a listing prefix and joined with a relative key
+    """
+    if not uri.startswith('s3://'):
+        raise ValueError(f"Not an s3:// URI: {uri}")
+    bucket, _, prefix = uri[len('s3://'):].partition('/')
+    prefix = re.sub(r'/+', '/', prefix).lstrip('/')
+    if prefix and not prefix.endswith('/'):
+        prefix += '/'
+    return bucket, prefix
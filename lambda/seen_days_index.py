@@ -0,0 +1,107 @@
+import base64
+import datetime
+import zlib
+
+from json_store import make_json_store
+
+# Days each location has already delivered, kept between runs so re-runs and
+# overlapping backfills never send the same (latitude, longitude, time) twice
+# Keys are watermark_store.location_key(location)
+# One bit per day since EPOCH: 85 years of history is ~4 KB before compression,
+# and a run of delivered days compresses to a few bytes
+
+# Open-Meteo's historical archive starts in 1940; earlier days are never recorded
+EPOCH = datetime.date(1940, 1, 1)
+
+
+class SeenDays:
+    """
+    Set of ISO days stored as a bitmap
+    """
+
+    def __init__(self, bitmap=b''):
+        self.bitmap = bytearray(bitmap)
+
+    def _bit(self, day):
+        return (datetime.date.fromisoformat(day[:10]) - EPOCH).days
+
+    def __contains__(self, day):
+        bit = self._bit(day)
+        return 0 <= bit < len(self.bitmap) * 8 and bool(self.bitmap[bit // 8] & (1 << (bit % 8)))
+
+    def add(self, day):
+        bit = self._bit(day)
+        if bit < 0:
+            return
+        if bit // 8 >= len(self.bitmap):
+            self.bitmap.extend(bytes(bit // 8 + 1 - len(self.bitmap)))
+        self.bitmap[bit // 8] |= 1 << (bit % 8)
+
+    def __len__(self):
+        return sum(bin(byte).count('1') for byte in self.bitmap)
+
+    def to_dict(self):
+        return {
+            'epoch': EPOCH.isoformat(),
+            'days': len(self),
+            'bitmap': base64.b64encode(zlib.compress(bytes(self.bitmap))).decode('ascii'),
+            'updated_at': datetime.datetime.now(datetime.timezone.utc).isoformat()
+        }
+
+    @classmethod
+    def from_dict(cls, entry):
+        if entry.get('epoch', EPOCH.isoformat()) != EPOCH.isoformat():
+            raise ValueError(f"Seen-days bitmap starts at {entry['epoch']}, expected {EPOCH.isoformat()}")
+        return cls(zlib.decompress(base64.b64decode(entry['bitmap'])))
+
+
+class SeenDaysIndex:
+    """
+    Every location's bitmap, one document per key of a JSON store
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    def get(self, key):
+        entry = self.store.get(key)
+        return SeenDays.from_dict(entry) if entry else SeenDays()
+
+    def put(self, key, seen):
+        self.store.put(key, seen.to_dict())
+
+
+def make_seen_days_index(uri, s3_client=None):
+    """
+    Build an index from a URI: s3://bucket/prefix or a local file path
+    Returns None when no URI is configured, which sends every fetched day
+    """
+    store = make_json_store(uri, s3_client)
+    return SeenDaysIndex(store) if store is not None else None
+
+
+def drop_seen_days(r_dict, seen):
+    """
+    Remove the days already delivered from a response's daily arrays
+    Returns the trimmed response and how many days were dropped
+    """
+    daily = r_dict['daily']
+    keep = [i for i, day in enumerate(daily['time']) if day not in seen]
+    if len(keep) == len(daily['time']):
+        return r_dict, 0
+    trimmed = {
+        name: [values[i] for i in keep] if isinstance(values, list) else values
+        for name, values in daily.items()
+    }
+    return dict(r_dict, daily=trimmed), len(daily['time']) - len(keep)
+
+
+def record_delivered_days(r_dict, seen):
+    """
+    Mark a delivered response's days as seen
+    Days the API had no value for yet are left out, so they are sent again once it has one
+    """
+    daily = r_dict['daily']
+    for day, temp in zip(daily['time'], daily['temperature_2m_max']):
+        if temp is not None:
+            seen.add(day)
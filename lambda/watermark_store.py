@@ -0,0 +1,75 @@
+import datetime
+
+from json_store import make_json_store
+
+
+def location_key(location):
+    """
+    Stable key for a location's watermark, independent of its display name
+    """
+    return f"{float(location['latitude']):.4f}_{float(location['longitude']):.4f}"
+
+
+def next_day(day):
+    """
+    The ISO date after the given ISO date string
+    """
+    return (datetime.date.fromisoformat(day) + datetime.timedelta(days=1)).isoformat()
+
+
+class WatermarkStore:
+    """
+    Last delivered day per location, one document per key of a JSON store
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    def get(self, key):
+        entry = self.store.get(key)
+        return entry['last_delivered_day'] if entry else None
+
+    def set(self, key, day):
+        self.store.put(key, {'last_delivered_day': day, 'updated_at': datetime.datetime.now(datetime.timezone.utc).isoformat()})
+
+
+def make_watermark_store(uri, s3_client=None):
+    """
+    Build a store from a URI: s3://bucket/prefix or a local file path
+    Returns None when no URI is configured, which keeps fixed date ranges
+    """
+    store = make_json_store(uri, s3_client)
+    return WatermarkStore(store) if store is not None else None
+
+
+def plan_incremental_ranges(locations, store, default_start, end_date):
+    """
+    Give each location its own start_date just after its watermark
+    Locations that are already up to date are returned separately
+    """
+    planned = []
+    up_to_date = []
+    for location in locations:
+        watermark = store.get(location_key(location))
+        start = next_day(watermark) if watermark else default_start
+        if start > end_date:
+            up_to_date.append(location)
+            continue
+        planned.append(dict(location, start_date=start, end_date=end_date))
+    return planned, up_to_date
+
+
+def trim_incomplete_days(r_dict):
+    """
+    Drop trailing days the API has no value for yet, so they are fetched
+    again on the next run instead of being delivered as 0.0
+    Returns the trimmed response and the last day it contains (or None)
+    """
+    daily = r_dict['daily']
+    times = daily['time']
+    temps = daily['temperature_2m_max']
+    end = len(times)
+    while end and temps[end - 1] is None:
+        end -= 1
+    trimmed = dict(r_dict, daily=dict(daily, time=times[:end], temperature_2m_max=temps[:end]))
+    return trimmed, (times[end - 1] if end else None)
@@ -1,40 +1,103 @@
 import json
-import boto3
 import logging
 from datetime import datetime
 import re
+import time
 import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import lambda_runtime
+import metadata_log
+from parquet_footer import FooterCache, collect_footer_stats, merge_stats
+from instrumentation import Metrics
+from optional_deps import pyarrow_available
+from inventory_index import entry_inventory, index_entry, make_inventory_index, relist_reason
+from s3_inventory import InventoryAggregate, ReservoirSample, TableInventory, aggregate_prefix
+from s3_uri import split_s3_uri
 
 # Configure logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-# Initialize AWS clients
-s3_client = boto3.client('s3')
-glue_client = boto3.client('glue')
+# Per-run metrics document (s3://bucket/prefix or a local directory, empty to only log them)
+metrics = Metrics('weather_data_metadata_extractor', os.environ.get("METRICS_LOCATION"))
+
+# AWS clients, created on first use and kept for warm invocations
+s3_client = lambda_runtime.lazy_client('s3', metrics)
+glue_client = lambda_runtime.lazy_client('glue', metrics)
+
+# Configuration, read once per container - override with environment variables
+SOURCE_DATABASE = os.environ.get("SOURCE_DATABASE", "weather-database-04142025")
+RESULTS_BUCKET = os.environ.get("RESULTS_BUCKET", "query-results-location-de-proj-04152025")
+# used only until the publish job has written its latest-version manifest
+FALLBACK_TABLE_NAME = os.environ.get(
+    "FALLBACK_TABLE_NAME", "open_meteo_weather_data_parquet_tbl_prod_2025_04_17_02_58_16_622979"
+)
+FALLBACK_TABLE_BUCKET = os.environ.get("FALLBACK_TABLE_BUCKET", "open-meteo-weather-data-parquet-bucket-04142025")
+
+# Pointer written by the publish job to the newest PROD table version
+PROD_BUCKET = "parquet-weather-table-prod-04142025"
+LATEST_MANIFEST_KEY = "_latest/manifest.json"
+
+# Number of partitions listed in parallel
+LISTING_MAX_WORKERS = int(os.environ.get("LISTING_MAX_WORKERS", "16"))
+
+# Objects kept as a sample in the detailed metadata
+SAMPLE_SIZE = 5
+
+# Persisted per-partition inventory (s3://bucket/key.json or a local path); empty lists everything every run
+INVENTORY_INDEX = os.environ.get("INVENTORY_INDEX", "")
+# Row counts, column ranges and the schema from Parquet footers (needs pyarrow in the deployment package)
+FOOTER_STATS = os.environ.get("FOOTER_STATS", "true").lower() == "true"
+FOOTER_MAX_WORKERS = int(os.environ.get("FOOTER_MAX_WORKERS", "16"))
+
+# Closed partitions are re-listed anyway once their index entry is this old, to catch late rewrites
+INVENTORY_INDEX_MAX_AGE_HOURS = float(os.environ.get("INVENTORY_INDEX_MAX_AGE_HOURS", "168"))
+
+# Date-partitioned Parquet log of every snapshot (s3://bucket/prefix or a local directory, needs pyarrow)
+METADATA_LOG_LOCATION = os.environ.get("METADATA_LOG_LOCATION", f"s3://{RESULTS_BUCKET}/weather_metadata_log/")
+# A day's log partition is compacted to one file once it holds this many
+METADATA_LOG_COMPACT_AT = int(os.environ.get("METADATA_LOG_COMPACT_AT", str(metadata_log.COMPACT_AT)))
+# Also write the per-run flat and detailed JSON objects of the old layout
+METADATA_JSON_OUTPUT = os.environ.get("METADATA_JSON_OUTPUT", "false").lower() == "true"
+
+# Built on first use and kept for warm invocations
+_metadata_log = None
 
 def lambda_handler(event, context):
     """
     Lambda function to extract metadata from weather data tables
     and save it to S3 in JSON format optimized for Athena querying
     """
+    with metrics.run():
+        return extract_metadata(event)
+
+def extract_metadata(event):
     try:
-        # Configurations - update these values
-        source_database_name = "weather-database-04142025"
-        results_bucket = "query-results-location-de-proj-04152025"
-        table_name = "open_meteo_weather_data_parquet_tbl_prod_2025_04_17_02_58_16_622979"
-        s3_location = f"s3://open-meteo-weather-data-parquet-bucket-04142025/{table_name}/"
+        source_database_name = SOURCE_DATABASE
+        results_bucket = RESULTS_BUCKET
+        table_name = FALLBACK_TABLE_NAME
+        s3_location = f"s3://{FALLBACK_TABLE_BUCKET}/{table_name}/"
+
+        # Follow the publish job's latest-version pointer instead of a hard-coded table
+        with metrics.stage("manifest"):
+            latest_manifest = get_latest_manifest()
+        if latest_manifest:
+            table_name = latest_manifest["table_name"]
+            logger.info(f"Using latest PROD version from manifest: {table_name}")
 
         # Try to get actual table information from Glue
+        # Descriptors are cached across warm invocations (GLUE_TABLE_TTL_SECONDS); a new
+        # PROD version has a new table name, so it is always looked up fresh
+        glue_table = None
         try:
-            table_response = glue_client.get_table(
-                DatabaseName=source_database_name,
-                Name=table_name
-            )
+            with metrics.stage("glue_table"):
+                glue_table = lambda_runtime.glue_table(source_database_name, table_name, glue_client)
             
             # Extract accurate S3 location from Glue
-            if 'Table' in table_response and 'StorageDescriptor' in table_response['Table']:
-                glue_s3_location = table_response['Table']['StorageDescriptor'].get('Location')
+            if 'StorageDescriptor' in glue_table:
+                glue_s3_location = glue_table['StorageDescriptor'].get('Location')
                 if glue_s3_location:
                     # Make sure the S3 location ends with a slash and doesn't have double slashes
                     s3_location = glue_s3_location
@@ -66,6 +129,17 @@ def lambda_handler(event, context):
             ],
             "s3_location": s3_location
         }
+        if glue_table and glue_table.get("StorageDescriptor", {}).get("Columns"):
+            # the catalog's schema, when it has one; the Parquet footers below have the last word
+            table_info["partition_keys"] = [
+                {"name": key["Name"], "type": key["Type"]} for key in glue_table.get("PartitionKeys", [])
+            ]
+            table_info["columns"] = [
+                {"name": col["Name"], "type": col["Type"], "is_partition": False}
+                for col in glue_table["StorageDescriptor"]["Columns"]
+            ] + [
+                {"name": key["name"], "type": key["type"], "is_partition": True} for key in table_info["partition_keys"]
+            ]
         
         # Create metadata record
         current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -85,59 +159,68 @@ def lambda_handler(event, context):
                 logger.info(f"Parsed S3 location - Bucket: {s3_bucket}, Prefix: {s3_prefix}")
         
         # Try to get S3 metadata if possible
-        s3_objects = []
-        s3_objects_count = 0
-        s3_total_size_bytes = 0
-        s3_latest_modification = None
+        # Listing pages are folded into running aggregates, so memory does not grow with the table
+        inventory = TableInventory(SAMPLE_SIZE)
+        index_stats = {"relisted": 0, "reused": 0, "reasons": {}, "errors": {}}
+        footer_stats = {}
         
         if s3_bucket and s3_prefix is not None:
             try:
-                # Try to list objects at the root prefix
-                try:
-                    root_objects = get_s3_metadata(s3_bucket, s3_prefix)
-                    s3_objects.extend(root_objects)
-                    if root_objects:
-                        logger.info(f"Found {len(root_objects)} objects at the root prefix")
-                except Exception as e:
-                    logger.warning(f"Error listing objects at root prefix: {str(e)}")
-                
-                # Check for partitions
-                # Define all possible partitions to check (for the current year and previous year)
-                current_year = datetime.now().year
-                
-                # Try a different partition format - directly under the table folder
-                for partition_value in [f"{year}_{str(month).zfill(2)}" for year in range(current_year-1, current_year+1) for month in range(1, 13)]:
-                    # Format 1: yr_mo_partition=YYYY_MM/
-                    partition_prefix_1 = f"{s3_prefix}yr_mo_partition={partition_value}/"
-                    # Format 2: YYYY_MM/ (direct partition)
-                    partition_prefix_2 = f"{s3_prefix}{partition_value}/"
-                    
-                    for prefix in [partition_prefix_1, partition_prefix_2]:
-                        try:
-                            partition_objects = get_s3_metadata(s3_bucket, prefix)
-                            if partition_objects:
-                                logger.info(f"Found {len(partition_objects)} objects in partition prefix {prefix}")
-                                s3_objects.extend(partition_objects)
-                        except Exception as e:
-                            logger.debug(f"No objects found in partition prefix {prefix}: {str(e)}")
+                # One delimiter listing returns every partition prefix plus the files
+                # sitting at the table root - no guessing, and nothing is counted twice
+                with metrics.stage("discover"):
+                    partition_prefixes, root_aggregate, root_sample = discover_partitions(s3_bucket, s3_prefix)
+                if root_aggregate.count:
+                    inventory.add_partition("", root_aggregate, root_sample)
+                    logger.info(f"Found {root_aggregate.count} objects at the root prefix")
+                logger.info(f"Discovered {len(partition_prefixes)} partition prefixes under s3://{s3_bucket}/{s3_prefix}")
+
+                # A delta-published version shares unchanged partitions with earlier versions,
+                # so its manifest, not the table prefix, says where every partition lives
+                fingerprints = {}
+                if latest_manifest and latest_manifest.get("partitions"):
+                    partition_locations = []
+                    for entry in latest_manifest["partitions"].values():
+                        location = split_s3_uri(entry["location"])
+                        partition_locations.append(location)
+                        fingerprints[partition_name(location[1])] = entry.get("fingerprint")
+                    logger.info(f"Using {len(partition_locations)} partition locations from the manifest")
+                else:
+                    partition_locations = [(s3_bucket, prefix) for prefix in partition_prefixes]
+
+                # Reuse indexed aggregates for closed, unchanged partitions; list the rest
+                with metrics.stage("collect_partitions"):
+                    index_stats, footer_stats = collect_partitions(inventory, partition_locations, fingerprints)
             except Exception as e:
                 logger.warning(f"Error in S3 metadata collection: {str(e)}")
         else:
             logger.warning(f"Could not parse S3 location: {s3_location}")
         
         # Update metadata with S3 information
-        if s3_objects:
-            s3_objects_count = len(s3_objects)
-            s3_total_size_bytes = sum(obj.get("size", 0) for obj in s3_objects)
-            latest_mod_objects = [obj for obj in s3_objects if obj.get("last_modified")]
-            if latest_mod_objects:
-                s3_latest_modification = max(obj.get("last_modified") for obj in latest_mod_objects)
-                if isinstance(s3_latest_modification, datetime):
-                    s3_latest_modification = s3_latest_modification.isoformat()
-                
-            logger.info(f"Updated metadata with {len(s3_objects)} objects")
+        s3_objects_count = inventory.total.count
+        s3_total_size_bytes = inventory.total.total_bytes
+        s3_latest_modification = inventory.total.max_last_modified
+        if isinstance(s3_latest_modification, datetime):
+            s3_latest_modification = s3_latest_modification.isoformat()
+        metrics.count("objects", s3_objects_count)
+        metrics.count("object_bytes", s3_total_size_bytes)
+        metrics.count("partitions", len(inventory.partitions))
+        metrics.count("partitions_relisted", index_stats["relisted"])
+        metrics.count("partitions_from_index", index_stats["reused"])
+        if s3_objects_count:
+            logger.info(f"Updated metadata with {s3_objects_count} objects")
         else:
             logger.warning("No S3 objects found")
+
+        # Row counts, value ranges and the real schema from the Parquet footers
+        table_footer = merge_stats(footer_stats.values())
+        row_count = table_footer["rows"] if footer_stats else None
+        if table_footer["schema"]:
+            table_info["columns"] = [
+                {"name": col["name"], "type": col["type"], "is_partition": False} for col in table_footer["schema"]
+            ] + [
+                {"name": key["name"], "type": key["type"], "is_partition": True} for key in table_info["partition_keys"]
+            ]
         
         # Create a flattened metadata record for better Athena compatibility
         # Note: We're converting complex nested structures to strings
@@ -149,73 +232,100 @@ def lambda_handler(event, context):
             "s3_location": s3_location,
             "s3_objects_count": s3_objects_count,
             "s3_total_size_bytes": s3_total_size_bytes,
-            "s3_latest_modification": s3_latest_modification
+            "s3_latest_modification": s3_latest_modification,
+            "partition_count": len(inventory.partitions),
+            "row_count": row_count,
+            "partitions_relisted": index_stats["relisted"],
+            "partitions_from_index": index_stats["reused"]
         }
         
-        # Save flattened metadata to S3
-        metadata_str = json.dumps(flattened_metadata)
-        current_date = datetime.now().strftime("%Y-%m-%d")
-        metadata_folder = f"weather_metadata_flat/{table_name}/date={current_date}/"
-        metadata_file_key = f"{metadata_folder}{current_time.replace(' ', '_').replace(':', '-')}.json"
+        # The full nested structure, kept in the log's detail_json column
+        detailed_metadata = {
+            "table_name": table_name,
+            "source_database": source_database_name,
+            "extraction_time": current_time,
+            "column_count": len(table_info["columns"]),
+            "columns": table_info["columns"],
+            "partition_keys": table_info["partition_keys"],
+            "s3_location": s3_location,
+            "s3_objects_count": s3_objects_count,
+            "s3_total_size_bytes": s3_total_size_bytes,
+            "s3_latest_modification": s3_latest_modification,
+            "s3_storage_classes": inventory.total.storage_classes,
+            "s3_earliest_modification": inventory.total.to_dict()["min_last_modified"],
+            "partition_count": len(inventory.partitions),
+            "partitions": inventory.partition_summaries(),
+            "inventory_index": index_stats,
+            "row_count": row_count,
+            "column_stats": table_footer["columns"],
+            "partition_footer_stats": {
+                name: {"files": stats["files"], "rows": stats["rows"], "columns": stats["columns"]}
+                for name, stats in sorted(footer_stats.items())
+            },
+            "s3_objects_sample": inventory.sample_entries()
+        }
+        
+        current_date = current_time[:10]
+        file_stamp = current_time.replace(' ', '_').replace(':', '-')
+        manifest_key = f"weather_metadata_manifests/{table_name}/manifest.json"
+        locations = {}
         
         try:
-            # Create a subfolder in results bucket
-            s3_client.put_object(
-                Bucket=results_bucket,
-                Key=metadata_folder,
-                Body=''
-            )
+            # Append the snapshot to the Parquet metadata log - one file per run, compacted per day
+            log = get_metadata_log()
+            if log is not None:
+                with metrics.stage("metadata_log"):
+                    record = log.append(flattened_metadata, detailed_metadata)
+                    written = log.flush()
+                    compacted = log.maintain()
+                metrics.count("metadata_log_files_compacted", sum(compacted.values()))
+                locations["metadata_log_location"] = log.location
+                locations["metadata_log_partition"] = f"{log.location}extraction_date={current_date}/"
+                logger.info(f"Appended metadata snapshot to {written[current_date]}")
+                if compacted:
+                    logger.info(f"Compacted metadata log partitions: {compacted}")
             
-            # Save metadata file
-            s3_client.put_object(
-                Bucket=results_bucket,
-                Key=metadata_file_key,
-                Body=metadata_str,
-                ContentType='application/json'
-            )
-            logger.info(f"Saved flattened metadata to S3: s3://{results_bucket}/{metadata_file_key}")
+            # The per-run JSON files, for readers of the old layout (or when pyarrow is missing)
+            if METADATA_JSON_OUTPUT or log is None:
+                metadata_file_key = f"weather_metadata_flat/{table_name}/date={current_date}/{file_stamp}.json"
+                s3_client.put_object(
+                    Bucket=results_bucket,
+                    Key=metadata_file_key,
+                    Body=json.dumps(flattened_metadata),
+                    ContentType='application/json'
+                )
+                logger.info(f"Saved flattened metadata to S3: s3://{results_bucket}/{metadata_file_key}")
+                
+                detailed_file_key = f"weather_metadata_detailed/{table_name}/{file_stamp}.json"
+                s3_client.put_object(
+                    Bucket=results_bucket,
+                    Key=detailed_file_key,
+                    Body=json.dumps(detailed_metadata, default=str),
+                    ContentType='application/json'
+                )
+                logger.info(f"Saved detailed metadata to S3: s3://{results_bucket}/{detailed_file_key}")
+                locations["flattened_metadata_location"] = f"s3://{results_bucket}/{metadata_file_key}"
+                locations["detailed_metadata_location"] = f"s3://{results_bucket}/{detailed_file_key}"
             
-            # Create a manifest file in a separate folder
-            manifest_content = json.dumps({
-                "latest_metadata": f"s3://{results_bucket}/{metadata_file_key}",
+            # The manifest stays a small pointer to the latest snapshot
+            manifest = {
+                "latest_metadata": locations.get("metadata_log_partition", locations.get("flattened_metadata_location")),
                 "last_updated": current_time,
                 "table_name": table_name
-            })
-            
-            s3_client.put_object(
-                Bucket=results_bucket,
-                Key=f"weather_metadata_manifests/{table_name}/manifest.json",
-                Body=manifest_content,
-                ContentType='application/json'
-            )
-            
-            # Save the detailed metadata separately (optional)
-            # This version contains the full nested structure
-            detailed_metadata = {
-                "table_name": table_name,
-                "source_database": source_database_name,
-                "extraction_time": current_time,
-                "column_count": len(table_info["columns"]),
-                "columns": table_info["columns"],
-                "partition_keys": table_info["partition_keys"],
-                "s3_location": s3_location,
-                "s3_objects_count": s3_objects_count,
-                "s3_total_size_bytes": s3_total_size_bytes,
-                "s3_latest_modification": s3_latest_modification,
-                "s3_objects_sample": s3_objects[:5] if s3_objects else []
             }
-            
-            detailed_file_key = f"weather_metadata_detailed/{table_name}/{current_time.replace(' ', '_').replace(':', '-')}.json"
-            
+            if log is not None:
+                manifest.update({
+                    "metadata_log": log.location,
+                    "extraction_date": current_date,
+                    "run_id": record["run_id"]
+                })
             s3_client.put_object(
                 Bucket=results_bucket,
-                Key=detailed_file_key,
-                Body=json.dumps(detailed_metadata, default=str),
+                Key=manifest_key,
+                Body=json.dumps(manifest),
                 ContentType='application/json'
             )
             
-            logger.info(f"Saved detailed metadata to S3: s3://{results_bucket}/{detailed_file_key}")
-            
         except Exception as e:
             logger.error(f"Could not save metadata to S3: {str(e)}")
             raise
@@ -225,22 +335,23 @@ def lambda_handler(event, context):
             "statusCode": 200,
             "body": json.dumps({
                 "message": "Successfully saved weather data metadata",
-                "flattened_metadata_location": f"s3://{results_bucket}/{metadata_file_key}",
-                "detailed_metadata_location": f"s3://{results_bucket}/{detailed_file_key}",
-                "manifest_location": f"s3://{results_bucket}/weather_metadata_manifests/{table_name}/manifest.json",
+                **locations,
+                "manifest_location": f"s3://{results_bucket}/{manifest_key}",
                 "metadata_summary": {
                     "objects_count": s3_objects_count,
                     "total_size_bytes": s3_total_size_bytes
                 },
-                "crawler_instructions": """
-To create a table from the flattened metadata, run a Glue crawler with:
-Target path: s3://{results_bucket}/weather_metadata_flat/
-Exclude patterns: **/manifest.json
-                """.format(results_bucket=results_bucket)
+                "table_instructions": (
+                    "Create the metadata log table once with grafana/create_metadata_log_table.sql; "
+                    "partition projection finds new days without a crawler"
+                    if log is not None else
+                    f"Run a Glue crawler on s3://{results_bucket}/weather_metadata_flat/ (exclude **/manifest.json)"
+                )
             })
         }
     except Exception as e:
         logger.error(f"Error processing weather data metadata: {str(e)}")
+        metrics.fail(e)
         return {
             "statusCode": 500,
             "body": json.dumps({
@@ -250,38 +361,203 @@ Exclude patterns: **/manifest.json
 
 def get_s3_metadata(bucket_name, prefix):
     """
-    Retrieve metadata for objects in the S3 bucket
+    Stream the objects under a prefix into (aggregate, reservoir sample, files, error)
+    files holds Bucket, Key, ETag and Size of each object for footer scanning
+    (empty unless footer stats are on) - one entry per file, a few per partition
+    When the listing fails, aggregate and sample are None and error says why, so an
+    errored partition is never mistaken for an empty one
     """
+    # Clean up the prefix - remove any leading slashes
+    if prefix.startswith('/'):
+        prefix = prefix[1:]
+
+    # Log the exact bucket and prefix we're using
+    logger.debug(f"Listing objects in bucket '{bucket_name}' with prefix '{prefix}'")
+
     try:
-        s3_objects = []
-        paginator = s3_client.get_paginator('list_objects_v2')
-        
-        # Clean up the prefix - remove any leading slashes
-        if prefix.startswith('/'):
-            prefix = prefix[1:]
-        
-        # Log the exact bucket and prefix we're using
-        logger.debug(f"Listing objects in bucket '{bucket_name}' with prefix '{prefix}'")
-        
-        page_iterator = paginator.paginate(
-            Bucket=bucket_name, 
-            Prefix=prefix,
-            PaginationConfig={'MaxItems': 10000}
-        )
-        
-        for page in page_iterator:
-            if 'Contents' in page:
-                for obj in page['Contents']:
-                    s3_objects.append({
-                        "key": obj.get('Key'),
-                        "size": obj.get('Size'),
-                        "last_modified": obj.get('LastModified'),
-                        "storage_class": obj.get('StorageClass'),
-                        "etag": obj.get('ETag')
-                    })
-        
-        logger.info(f"Retrieved {len(s3_objects)} objects from s3://{bucket_name}/{prefix}")
-        return s3_objects
+        files = []
+        on_object = None
+        if FOOTER_STATS:
+            on_object = lambda obj: files.append(
+                {'Bucket': bucket_name, 'Key': obj['Key'], 'ETag': obj['ETag'], 'Size': obj['Size']})
+        aggregate, sample = aggregate_prefix(s3_client, bucket_name, prefix, SAMPLE_SIZE, on_object)
+        logger.info(f"Retrieved {aggregate.count} objects from s3://{bucket_name}/{prefix}")
+        return aggregate, sample, files, None
+    except Exception as e:
+        logger.warning(f"Error retrieving S3 metadata for s3://{bucket_name}/{prefix}: {str(e)}")
+        return None, None, [], str(e)
+
+def partition_name(prefix):
+    """
+    Last path segment of a partition prefix, e.g. yr_mo_partition=2025-01
+    """
+    return prefix.rstrip("/").rsplit("/", 1)[-1]
+
+def discover_partitions(bucket_name, prefix):
+    """
+    List one level below the prefix with Delimiter='/'
+    Returns (partition prefixes from CommonPrefixes, aggregate and sample of the objects directly under the prefix)
+    """
+    if prefix.startswith('/'):
+        prefix = prefix[1:]
+
+    partition_prefixes = []
+    root_aggregate = InventoryAggregate()
+    root_sample = ReservoirSample(SAMPLE_SIZE)
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix, Delimiter='/'):
+        for common_prefix in page.get('CommonPrefixes', []):
+            partition_prefixes.append(common_prefix['Prefix'])
+        for obj in page.get('Contents', []):
+            # skip folder markers
+            if obj.get('Key', '').endswith('/'):
+                continue
+            root_aggregate.add(obj)
+            root_sample.add(obj)
+    return partition_prefixes, root_aggregate, root_sample
+
+def list_partitions_concurrently(partition_locations):
+    """
+    Aggregate every (bucket, prefix) in parallel
+    Returns (prefix, aggregate, sample, files, error) in input order
+    """
+    if not partition_locations:
+        return []
+    workers = max(1, min(LISTING_MAX_WORKERS, len(partition_locations)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(lambda location: get_s3_metadata(*location), partition_locations)
+        return [(prefix,) + result for (_, prefix), result in zip(partition_locations, results)]
+
+def collect_partitions(inventory, partition_locations, fingerprints):
+    """
+    Fold every partition into the inventory, listing only those the index cannot vouch for
+    The index is rewritten with exactly the current partitions, so dropped ones fall out
+    A partition whose listing fails keeps its previous index entry (and is reported
+    from it) and is listed again next run; index stats name it under "errors"
+    Returns (index stats, {partition: footer stats})
+    """
+    index = make_inventory_index(INVENTORY_INDEX, s3_client)
+    indexed = index.load() if index else {}
+    max_age = timedelta(hours=INVENTORY_INDEX_MAX_AGE_HOURS)
+    # without pyarrow no entry can ever get footers, so their absence is no reason to re-list
+    footers_enabled = FOOTER_STATS and pyarrow_available()
+
+    updated = {}
+    to_list = []
+    reasons = {}
+    for bucket, prefix in partition_locations:
+        name = partition_name(prefix)
+        location = f"s3://{bucket}/{prefix}"
+        entry = indexed.get(name)
+        reason = relist_reason(name, location, entry, fingerprints.get(name), max_age)
+        if reason is None and footers_enabled and ("footers" not in entry or entry.get("footer_errors")):
+            # indexed before footer stats were collected, or some footers could not be read
+            reason = "no_footers"
+        if reason is None:
+            aggregate, sample = entry_inventory(entry, SAMPLE_SIZE)
+            inventory.add_partition(name, aggregate, sample)
+            updated[name] = entry
+        else:
+            reasons[reason] = reasons.get(reason, 0) + 1
+            to_list.append((bucket, prefix))
+
+    reused = len(updated)
+    logger.info(f"Inventory index: {reused} partition(s) reused, {len(to_list)} to list {reasons}")
+
+    # List the remaining partitions concurrently
+    partition_files = {}
+    errors = {}
+    for (bucket, prefix), (_, aggregate, sample, files, error) in zip(to_list, list_partitions_concurrently(to_list)):
+        name = partition_name(prefix)
+        if error is not None:
+            errors[name] = error
+            if name in indexed:
+                # unchanged in the index, so the same reason lists it again next run
+                aggregate, sample = entry_inventory(indexed[name], SAMPLE_SIZE)
+                inventory.add_partition(name, aggregate, sample)
+                updated[name] = indexed[name]
+            continue
+        if aggregate.count:
+            logger.info(f"Found {aggregate.count} objects in partition prefix {prefix}")
+            inventory.add_partition(name, aggregate, sample)
+            updated[name] = index_entry(f"s3://{bucket}/{prefix}", aggregate, sample, fingerprints.get(name))
+            partition_files[name] = files
+
+    footer_stats = {}
+    if footers_enabled:
+        footer_stats = collect_partition_footers(updated, indexed, partition_files, index is not None)
+    elif FOOTER_STATS:
+        logger.warning("pyarrow is not available - skipping Parquet footer stats")
+
+    if errors:
+        logger.warning(f"Listing failed for {len(errors)} partition(s): {sorted(errors)}")
+    metrics.count("listing_errors", len(errors))
+
+    if index:
+        index.save(updated)
+    return {"relisted": len(to_list), "reused": reused, "reasons": reasons, "errors": errors}, footer_stats
+
+def collect_partition_footers(updated, indexed, partition_files, persisted=True):
+    """
+    Footer stats per partition, read only for files whose ETag has not been seen before
+    Per-file stats are stored in the index entries, which makes the index the footer cache;
+    without an index they are kept for warm invocations of the container instead
+    """
+    all_files = [obj for files in partition_files.values() for obj in files]
+    if persisted:
+        # every file stat we already know about, keyed by ETag
+        cache = FooterCache({
+            etag: stats
+            for entry in indexed.values()
+            for etag, stats in entry.get("footers", {}).items()
+        })
+    else:
+        cache = FooterCache(lambda_runtime.shared("footer_stats", dict))
+    started = time.perf_counter()
+    file_stats, errors = collect_footer_stats(s3_client, all_files, cache, FOOTER_MAX_WORKERS)
+    if not persisted:
+        # keep only the current files, so replaced files do not pile up in a long-lived container
+        cache.retain({obj["ETag"] for obj in all_files})
+    logger.info(f"Footer stats: {len(file_stats)} file(s), {cache.misses} footer(s) read, "
+                f"{cache.hits} from cache, {len(errors)} unreadable in {time.perf_counter() - started:.2f}s")
+    metrics.count("footers_read", cache.misses)
+    metrics.count("footers_cached", cache.hits)
+    metrics.count("footer_errors", len(errors))
+    for obj, error in errors[:10]:
+        logger.warning(f"Skipping the footer of s3://{obj['Bucket']}/{obj['Key']}: {error}")
+
+    failed = {obj["ETag"] for obj, _ in errors}
+    for name, files in partition_files.items():
+        updated[name]["footers"] = {obj["ETag"]: file_stats[obj["ETag"]] for obj in files if obj["ETag"] in file_stats}
+        missing = sum(1 for obj in files if obj["ETag"] in failed)
+        if missing:
+            # the partition is listed again next run, which retries these footers
+            updated[name]["footer_errors"] = missing
+    return {
+        name: merge_stats(entry["footers"].values())
+        for name, entry in updated.items()
+        if entry.get("footers")
+    }
+
+def get_metadata_log():
+    """
+    The metadata log writer, or None when it is switched off or pyarrow is missing
+    """
+    global _metadata_log
+    if _metadata_log is None and METADATA_LOG_LOCATION:
+        if not pyarrow_available():
+            logger.warning("pyarrow is not available - writing the metadata as JSON objects instead")
+            return None
+        _metadata_log = metadata_log.make_metadata_log(METADATA_LOG_LOCATION, s3_client, METADATA_LOG_COMPACT_AT)
+    return _metadata_log
+
+def get_latest_manifest():
+    """
+    Read the publish job's latest-version manifest, or None if it is not there yet
+    """
+    try:
+        obj = s3_client.get_object(Bucket=PROD_BUCKET, Key=LATEST_MANIFEST_KEY)
+        return json.loads(obj["Body"].read())
     except Exception as e:
-        logger.debug(f"Error retrieving S3 metadata for s3://{bucket_name}/{prefix}: {str(e)}")
-        return []
\ No newline at end of file
+        logger.warning(f"Could not read latest manifest s3://{PROD_BUCKET}/{LATEST_MANIFEST_KEY}: {str(e)}")
+        return None
@@ -0,0 +1,422 @@
+import io
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+
+import duckdb
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.json as pa_json
+import pyarrow.parquet as pq
+
+# the s3:// parser is the one the Lambdas and Glue jobs use
+LAMBDA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lambda')
+if LAMBDA_DIR not in sys.path:
+    sys.path.append(LAMBDA_DIR)
+from s3_uri import split_s3_uri  # noqa: E402
+
+# Athena stand-in for local pipeline runs
+# Implements the boto3 Athena calls AthenaQueryRunner makes, on top of an embedded
+# DuckDB, and covers the statements the Glue jobs issue:
+#   CTAS (WITH external_location / partitioned_by), INSERT INTO, DROP TABLE,
+#   CREATE EXTERNAL TABLE (optionally with partition projection) + ALTER TABLE ADD PARTITION ... LOCATION,
+#   ALTER TABLE ... PARTITION (...) SET LOCATION,
+#   CREATE OR REPLACE VIEW and plain SELECTs, including "$file_modified_time"
+# Table data lives in (moto) S3 exactly where Athena would put it, and tables are
+# registered in the (moto) Glue catalog, so jobs that read S3 or Glue directly
+# see the same state they would on AWS
+
+PSEUDO_COLUMNS = ('"$path"', '"$file_modified_time"')
+
+# Arrow types to the names Athena / Glue use
+ATHENA_TYPES = {
+    'double': 'double',
+    'float': 'float',
+    'int64': 'bigint',
+    'int32': 'int',
+    'bool': 'boolean',
+    'string': 'string',
+    'large_string': 'string',
+    'date32[day]': 'date'
+}
+
+# Athena / Glue type names to Arrow, for tables registered by DDL
+ARROW_TYPES = {
+    'double': pa.float64(),
+    'float': pa.float32(),
+    'bigint': pa.int64(),
+    'int': pa.int32(),
+    'boolean': pa.bool_(),
+    'string': pa.string(),
+    'date': pa.date32()
+}
+
+
+class LocalAthenaError(Exception):
+    pass
+
+
+def athena_type(arrow_type):
+    if pa.types.is_timestamp(arrow_type):
+        return 'timestamp'
+    if pa.types.is_decimal(arrow_type):
+        return 'double'
+    return ATHENA_TYPES.get(str(arrow_type), 'string')
+
+
+def _name(identifier):
+    """
+    Bare lower-case table name from `name`, "db"."name" or db.name
+    """
+    return identifier.replace('"', '').replace('`', '').split('.')[-1].lower()
+
+
+class _ResultsPaginator:
+    def __init__(self, athena):
+        self.athena = athena
+
+    def paginate(self, QueryExecutionId):
+        yield {'ResultSet': {'Rows': self.athena.executions[QueryExecutionId]['rows']}}
+
+
+class LocalAthena:
+    """
+    Synchronous Athena: start_query_execution runs the statement to completion,
+    so every later poll sees a terminal state
+    """
+
+    def __init__(self, s3_client, glue_client, database):
+        self.s3_client = s3_client
+        self.glue_client = glue_client
+        self.database = database
+        self.tables = {}
+        self.views = {}
+        self.executions = {}
+        self._lock = threading.Lock()
+        self._con = duckdb.connect()
+        self._con.execute("CREATE MACRO from_iso8601_timestamp(x) AS CAST(x AS TIMESTAMPTZ)")
+
+    # boto3 Athena client surface used by AthenaQueryRunner
+
+    def start_query_execution(self, QueryString, QueryExecutionContext=None, ResultConfiguration=None, WorkGroup=None):
+        execution_id = str(uuid.uuid4())
+        started = time.perf_counter()
+        status = {'State': 'SUCCEEDED'}
+        rows = []
+        scanned = 0
+        try:
+            with self._lock:
+                header, values, scanned = self.execute(QueryString)
+            if header:
+                rows = [{'Data': [{'VarCharValue': name} for name in header]}]
+                rows.extend(
+                    {'Data': [{} if value is None else {'VarCharValue': str(value)} for value in row]}
+                    for row in values
+                )
+        except Exception as e:
+            status = {'State': 'FAILED', 'StateChangeReason': str(e)}
+        elapsed_ms = int((time.perf_counter() - started) * 1000)
+        self.executions[execution_id] = {
+            'execution': {
+                'QueryExecutionId': execution_id,
+                'Query': QueryString,
+                'Status': status,
+                'Statistics': {
+                    'EngineExecutionTimeInMillis': elapsed_ms,
+                    'TotalExecutionTimeInMillis': elapsed_ms,
+                    'QueryQueueTimeInMillis': 0,
+                    'QueryPlanningTimeInMillis': 0,
+                    'DataScannedInBytes': scanned
+                },
+                'ResultConfiguration': {
+                    'OutputLocation': f"{(ResultConfiguration or {}).get('OutputLocation', '')}{execution_id}.csv"
+                }
+            },
+            'rows': rows
+        }
+        return {'QueryExecutionId': execution_id}
+
+    def get_query_execution(self, QueryExecutionId):
+        return {'QueryExecution': self.executions[QueryExecutionId]['execution']}
+
+    def batch_get_query_execution(self, QueryExecutionIds):
+        return {'QueryExecutions': [self.executions[qid]['execution'] for qid in QueryExecutionIds]}
+
+    def stop_query_execution(self, QueryExecutionId):
+        return {}
+
+    def get_paginator(self, operation):
+        if operation != 'get_query_results':
+            raise LocalAthenaError(f"Unsupported paginator: {operation}")
+        return _ResultsPaginator(self)
+
+    # awswrangler.athena.read_sql_query stand-in
+
+    def read_sql_query(self, sql, database=None, **kwargs):
+        with self._lock:
+            table, _ = self._select(sql)
+        return table.to_pandas()
+
+    # catalog
+
+    def register_table(self, name, location, columns, partition_column=None, data_format='parquet',
+                       partitions=None):
+        """
+        Add a table to the catalog and to Glue
+        columns: [(name, athena type)], without the partition column
+        partitions: {value: location} for tables whose partitions are added by DDL;
+        None discovers `<partition_column>=<value>/` prefixes under the location
+        """
+        name = name.lower()
+        self.tables[name] = {
+            'location': location if location.endswith('/') else location + '/',
+            'columns': [(col.lower(), col_type) for col, col_type in columns],
+            'partition_column': partition_column,
+            'format': data_format,
+            'partitions': partitions
+        }
+        table_input = {
+            'Name': name,
+            'StorageDescriptor': {
+                'Columns': [{'Name': col, 'Type': col_type} for col, col_type in self.tables[name]['columns']],
+                'Location': self.tables[name]['location']
+            },
+            'PartitionKeys': [{'Name': partition_column, 'Type': 'string'}] if partition_column else [],
+            'TableType': 'EXTERNAL_TABLE'
+        }
+        try:
+            self.glue_client.delete_table(DatabaseName=self.database, Name=name)
+        except self.glue_client.exceptions.EntityNotFoundException:
+            pass
+        self.glue_client.create_table(DatabaseName=self.database, TableInput=table_input)
+
+    def drop_table(self, name):
+        self.tables.pop(name, None)
+        self._con.execute(f'DROP VIEW IF EXISTS "{name}"')
+        try:
+            self.glue_client.delete_table(DatabaseName=self.database, Name=name)
+        except self.glue_client.exceptions.EntityNotFoundException:
+            pass
+
+    # statements
+
+    def execute(self, sql):
+        """
+        Run one statement; returns (header, rows, bytes scanned)
+        """
+        sql = self._strip_database(sql.strip().rstrip(';').strip())
+
+        match = re.match(r'DROP\s+TABLE\s+(IF\s+EXISTS\s+)?(\S+)$', sql, re.I)
+        if match:
+            name = _name(match.group(2))
+            if name not in self.tables and not match.group(1):
+                raise LocalAthenaError(f"Table {name} not found")
+            self.drop_table(name)
+            return None, [], 0
+
+        match = re.match(r'CREATE\s+TABLE\s+(\S+)\s+WITH\s*\((.*?)\)\s*AS\s+(.*)$', sql, re.I | re.S)
+        if match:
+            return self._ctas(_name(match.group(1)), match.group(2), match.group(3))
+
+        match = re.match(r'INSERT\s+INTO\s+(\S+)\s+(.*)$', sql, re.I | re.S)
+        if match:
+            return self._insert(_name(match.group(1)), match.group(2))
+
+        match = re.match(r'CREATE\s+EXTERNAL\s+TABLE\s+(IF\s+NOT\s+EXISTS\s+)?(\S+)\s*\((.*?)\)\s*PARTITIONED\s+BY\s*\((.*?)\).*?'
+                         r"LOCATION\s+'([^']+)'", sql, re.I | re.S)
+        if match:
+            name = _name(match.group(2))
+            if name in self.tables:
+                if match.group(1):
+                    return None, [], 0
+                raise LocalAthenaError(f"Table {name} already exists")
+            columns = re.findall(r'`?(\w+)`?\s+(\w+)', match.group(3))
+            partition_column = re.findall(r'`?(\w+)`?\s+\w+', match.group(4))[0]
+            # with partition projection every <column>=<value>/ prefix is readable without DDL
+            projected = re.search(r"'projection\.enabled'\s*=\s*'true'", sql, re.I) is not None
+            self.register_table(name, match.group(5), columns, partition_column, partitions=None if projected else {})
+            return None, [], 0
+
+        match = re.match(r"ALTER\s+TABLE\s+(\S+)\s+PARTITION\s*\(\s*\w+\s*=\s*'([^']*)'\s*\)\s*SET\s+LOCATION\s+'([^']*)'$",
+                         sql, re.I | re.S)
+        if match:
+            entry = self.tables[_name(match.group(1))]
+            if entry['partitions'] is not None:
+                entry['partitions'][match.group(2)] = match.group(3)
+            else:
+                entry.setdefault('locations', {})[match.group(2)] = match.group(3)
+            return None, [], 0
+
+        match = re.match(r'ALTER\s+TABLE\s+(\S+)\s+ADD\s+(IF\s+NOT\s+EXISTS\s+)?(.*)$', sql, re.I | re.S)
+        if match:
+            name = _name(match.group(1))
+            specs = re.findall(r"PARTITION\s*\(\s*\w+\s*=\s*'([^']*)'\s*\)\s*LOCATION\s*'([^']*)'", match.group(3), re.I)
+            # tables with discovered partitions (CTAS) already see every <column>=<value>/ prefix
+            if self.tables[name]['partitions'] is not None:
+                self.tables[name]['partitions'].update(dict(specs))
+            return None, [], 0
+
+        match = re.match(r'CREATE\s+OR\s+REPLACE\s+VIEW\s+(\S+)\s+AS\s+(.*)$', sql, re.I | re.S)
+        if match:
+            name = _name(match.group(1))
+            self.views[name] = match.group(2)
+            self._refresh()
+            return None, [], 0
+
+        table, scanned = self._select(sql)
+        rows = list(zip(*(column.to_pylist() for column in table.columns)))
+        return table.column_names, rows, scanned
+
+    def _strip_database(self, sql):
+        # every table lives in DuckDB's default schema
+        return re.sub(rf'"{re.escape(self.database)}"\.|(?<![\w"]){re.escape(self.database)}\.', '', sql)
+
+    def _select(self, sql):
+        sql = self._strip_database(sql)
+        scanned = self._refresh()
+        if '"$file_modified_time"' in sql or '"$path"' in sql:
+            # pseudo columns only exist on the file-level relation of each table
+            for name in self.tables:
+                sql = re.sub(rf'(?<![\w$"]){name}(?![\w$])|"{name}"', f'"{name}$files"', sql, flags=re.I)
+        result = self._con.execute(sql).arrow()
+        if hasattr(result, 'read_all'):
+            result = result.read_all()
+        # Athena lower-cases column names, and its SUM / COUNT are bigint and double, not DuckDB's HUGEINT / DECIMAL
+        columns = []
+        for column in result.columns:
+            if pa.types.is_decimal(column.type):
+                column = column.cast(pa.int64() if column.type.scale == 0 else pa.float64())
+            columns.append(column)
+        return pa.table(columns, names=[col.lower() for col in result.column_names]), scanned
+
+    def _ctas(self, name, properties, select):
+        if name in self.tables:
+            raise LocalAthenaError(f"Table {name} already exists")
+        props = dict(re.findall(r"(\w+)\s*=\s*'([^']*)'", properties))
+        partitioned = re.search(r"partitioned_by\s*=\s*ARRAY\s*\[\s*'(\w+)'\s*\]", properties, re.I)
+        location = props['external_location']
+        if not location.endswith('/'):
+            location += '/'
+        bucket, prefix = split_s3_uri(location)
+        if self.s3_client.list_objects_v2(Bucket=bucket, Prefix=prefix, MaxKeys=1).get('KeyCount', 0):
+            raise LocalAthenaError(f"HIVE_PATH_ALREADY_EXISTS: Target directory for table '{name}' already exists: {location}")
+
+        table, scanned = self._select(select)
+        partition_column = partitioned.group(1).lower() if partitioned else None
+        columns = [(field.name, athena_type(field.type)) for field in table.schema if field.name != partition_column]
+        self.register_table(name, location, columns, partition_column)
+        self._write(self.tables[name], table)
+        return None, [], scanned
+
+    def _insert(self, name, select):
+        if name not in self.tables:
+            raise LocalAthenaError(f"Table {name} not found")
+        table, scanned = self._select(select)
+        self._write(self.tables[name], table)
+        return None, [], scanned
+
+    def _write(self, entry, table):
+        """
+        Write query output as Parquet files under the table location, one file per partition
+        """
+        bucket, prefix = split_s3_uri(entry['location'])
+        file_name = uuid.uuid4().hex
+        partition_column = entry['partition_column']
+        if partition_column is None:
+            groups = [('', table)] if table.num_rows else []
+        else:
+            values = table[partition_column]
+            groups = [
+                (f"{partition_column}={value}/", table.filter(pc.equal(values, value)).drop([partition_column]))
+                for value in pc.unique(values).to_pylist() if value is not None
+            ]
+        for path, part in groups:
+            buf = io.BytesIO()
+            pq.write_table(part, buf, compression='snappy')
+            self.s3_client.put_object(Bucket=bucket, Key=f"{prefix}{path}{file_name}", Body=buf.getvalue())
+
+    # loading table data from S3 into DuckDB
+
+    def _refresh(self):
+        """
+        (Re)load every table from S3 so each statement sees the current objects
+        Returns the bytes read, reported as DataScannedInBytes
+        """
+        scanned = 0
+        for name, entry in self.tables.items():
+            table, size = self._load(entry)
+            scanned += size
+            self._con.register(f"{name}$files", table)
+            columns = ", ".join(f'"{field.name}"' for field in table.schema if f'"{field.name}"' not in PSEUDO_COLUMNS)
+            self._con.execute(f'CREATE OR REPLACE VIEW "{name}" AS SELECT {columns} FROM "{name}$files"')
+        for name, select in self.views.items():
+            self._con.execute(f'CREATE OR REPLACE VIEW "{name}" AS {select}')
+        return scanned
+
+    def _partition_locations(self, entry):
+        if entry['partition_column'] is None:
+            return [(None, entry['location'])]
+        if entry['partitions'] is not None:
+            return sorted(entry['partitions'].items())
+        # discovered partitions, except those moved by ALTER TABLE ... SET LOCATION
+        moved = entry.get('locations', {})
+        bucket, prefix = split_s3_uri(entry['location'])
+        marker = f"{entry['partition_column']}="
+        found = []
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix, Delimiter='/'):
+            for common_prefix in page.get('CommonPrefixes', []):
+                segment = common_prefix['Prefix'][len(prefix):].rstrip('/')
+                if segment.startswith(marker):
+                    value = segment[len(marker):]
+                    found.append((value, moved.get(value, f"s3://{bucket}/{common_prefix['Prefix']}")))
+        return found
+
+    def _schema(self, entry):
+        fields = [pa.field(col, ARROW_TYPES.get(col_type, pa.string())) for col, col_type in entry['columns']]
+        if entry['partition_column']:
+            fields.append(pa.field(entry['partition_column'], pa.string()))
+        return pa.schema(fields + [pa.field('$path', pa.string()), pa.field('$file_modified_time', pa.timestamp('us', tz='UTC'))])
+
+    def _load(self, entry):
+        schema = self._schema(entry)
+        data_schema = pa.schema([field for field in schema if field.name in dict(entry['columns'])])
+        parts = []
+        scanned = 0
+        for value, location in self._partition_locations(entry):
+            bucket, prefix = split_s3_uri(location)
+            paginator = self.s3_client.get_paginator('list_objects_v2')
+            for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+                for obj in page.get('Contents', []):
+                    key = obj['Key']
+                    # Athena skips hidden files and folder markers
+                    if key.endswith('/') or key.rsplit('/', 1)[-1].startswith(('_', '.')):
+                        continue
+                    if entry['partition_column'] is None and '=' in key[len(prefix):]:
+                        continue
+                    body = self.s3_client.get_object(Bucket=bucket, Key=key)['Body'].read()
+                    scanned += len(body)
+                    if entry['format'] == 'json':
+                        part = pa_json.read_json(io.BytesIO(body), parse_options=pa_json.ParseOptions(
+                            explicit_schema=data_schema, unexpected_field_behavior='ignore'))
+                    elif body[-4:] == b'PAR1':
+                        part = pq.read_table(io.BytesIO(body))
+                    else:
+                        continue
+                    n = part.num_rows
+                    columns = {
+                        field.name: part[field.name].cast(field.type) if field.name in part.column_names
+                        else pa.nulls(n, field.type)
+                        for field in data_schema
+                    }
+                    if entry['partition_column']:
+                        columns[entry['partition_column']] = pa.array([value] * n, pa.string())
+                    columns['$path'] = pa.array([f"s3://{bucket}/{key}"] * n, pa.string())
+                    columns['$file_modified_time'] = pa.array([obj['LastModified']] * n, pa.timestamp('us', tz='UTC'))
+                    parts.append(pa.table(columns, schema=schema))
+        if not parts:
+            return schema.empty_table(), scanned
+        return pa.concat_tables(parts), scanned
@@ -0,0 +1,213 @@
+import json
+import math
+import os
+import sys
+import threading
+import types
+import urllib.parse
+import zlib
+from contextlib import contextmanager
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import boto3
+from moto import mock_aws
+
+from local_athena import LocalAthena
+
+# Local stand-ins for everything the pipeline talks to:
+#   S3, Firehose, Glue catalog - moto, in memory
+#   Athena                     - LocalAthena on DuckDB
+#   Open-Meteo API             - a small HTTP server returning deterministic daily (optionally hourly) temperatures
+# Nothing leaves the machine, and all state is gone when the stack closes
+
+REGION = 'us-east-1'
+ACCOUNT_ID = '123456789012'
+
+# Same names the Lambdas and Glue jobs hard-code
+DATABASE_NAME = 'weather-database-04142025'
+RAW_BUCKET = 'open-meteo-weather-data-parquet-bucket-04142025'
+PROD_BUCKET = 'parquet-weather-table-prod-04142025'
+QUERY_RESULTS_BUCKET = 'query-results-location-de-proj-04152025'
+FIREHOSE_NAME = 'PUT-S3-HToZ2'
+
+# Firehose writes raw JSON here; the crawler's table points at it
+# local_stack(raw_prefix='') puts it at the bucket root instead, next to transformed_data/ and sink_data/
+RAW_PREFIX = 'raw/'
+RAW_TABLE_NAME = 'weather_open_meteo_weather_data_parquet_bucket_04142025'
+RAW_COLUMNS = [
+    ('latitude', 'double'),
+    ('longitude', 'double'),
+    ('time', 'string'),
+    ('temp', 'double'),
+    ('row_ts', 'string')
+]
+
+
+def synthetic_temperature(latitude, longitude, day):
+    """
+    Seasonal daily maximum in Fahrenheit with a little per-location, per-day noise
+    """
+    season = math.sin(2 * math.pi * (day.timetuple().tm_yday - 105) / 365.0)
+    noise = (zlib.crc32(f"{latitude:.4f},{longitude:.4f},{day}".encode()) % 1000) / 100.0 - 5.0
+    return round(55.0 + 25.0 * season - (latitude - 40.0) * 1.2 + noise, 1)
+
+
+def synthetic_response(latitude, longitude, start, end, timezone='GMT', hourly_variables=()):
+    """
+    An Open-Meteo archive response for one location and date range
+    hourly_variables adds that many hourly series (24 values a day each), the way
+    a request for hourly data makes responses roughly 24x larger per variable
+    """
+    days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+    response = {
+        'latitude': latitude,
+        'longitude': longitude,
+        'timezone': timezone,
+        'daily_units': {'time': 'iso8601', 'temperature_2m_max': '°F'},
+        'daily': {
+            'time': [day.isoformat() for day in days],
+            'temperature_2m_max': [synthetic_temperature(latitude, longitude, day) for day in days]
+        }
+    }
+    if hourly_variables:
+        hourly = {'time': [f"{day.isoformat()}T{hour:02d}:00" for day in days for hour in range(24)]}
+        for index, variable in enumerate(hourly_variables):
+            hourly[variable] = [
+                round(synthetic_temperature(latitude, longitude, day) - 10.0 * math.cos(math.pi * hour / 12) + index, 1)
+                for day in days for hour in range(24)
+            ]
+        response['hourly'] = hourly
+    return response
+
+
+class _OpenMeteoHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        params = dict(urllib.parse.parse_qsl(urllib.parse.urlparse(self.path).query))
+        body = json.dumps(synthetic_response(
+            float(params['latitude']),
+            float(params['longitude']),
+            date.fromisoformat(params['start_date']),
+            date.fromisoformat(params['end_date']),
+            params.get('timezone', 'GMT'),
+            self.server.hourly_variables
+        )).encode('utf-8')
+        with self.server.lock:
+            self.server.api_calls += 1
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class LocalStack:
+    """
+    Handles to the running stand-ins
+    """
+
+    def __init__(self, athena, server, raw_prefix=RAW_PREFIX):
+        self.athena = athena
+        self.server = server
+        self.raw_prefix = raw_prefix
+        self.forecast_url = f"http://127.0.0.1:{server.server_address[1]}/v1/forecast"
+
+    @property
+    def api_calls(self):
+        """
+        Requests the Open-Meteo stand-in has served
+        """
+        return self.server.api_calls
+
+    def set_hourly_variables(self, variables):
+        self.server.hourly_variables = tuple(variables)
+
+    def register_raw_table(self):
+        """
+        What the Glue crawler does for the Firehose output
+        """
+        self.athena.register_table(RAW_TABLE_NAME, f"s3://{RAW_BUCKET}/{self.raw_prefix}", RAW_COLUMNS, data_format='json')
+
+
+def _awswrangler_standin(athena):
+    module = types.ModuleType('awswrangler')
+    module.athena = types.SimpleNamespace(read_sql_query=athena.read_sql_query)
+    return module
+
+
+@contextmanager
+def local_stack(lambda_dir, raw_prefix=RAW_PREFIX):
+    """
+    Start the stand-ins and route the pipeline's AWS and HTTP calls to them
+    """
+    saved_env = {key: os.environ.get(key) for key in
+                 ('AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY', 'AWS_SESSION_TOKEN', 'AWS_DEFAULT_REGION')}
+    os.environ.update({
+        'AWS_ACCESS_KEY_ID': 'testing',
+        'AWS_SECRET_ACCESS_KEY': 'testing',
+        'AWS_SESSION_TOKEN': 'testing',
+        'AWS_DEFAULT_REGION': REGION
+    })
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _OpenMeteoHandler)
+    server.hourly_variables = ()
+    server.api_calls = 0
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    original_client = boto3.client
+    saved_awswrangler = sys.modules.get('awswrangler')
+
+    with mock_aws():
+        s3_client = original_client('s3')
+        for bucket in (RAW_BUCKET, PROD_BUCKET, QUERY_RESULTS_BUCKET):
+            s3_client.create_bucket(Bucket=bucket)
+        glue_client = original_client('glue')
+        glue_client.create_database(DatabaseInput={'Name': DATABASE_NAME})
+        original_client('firehose').create_delivery_stream(
+            DeliveryStreamName=FIREHOSE_NAME,
+            DeliveryStreamType='DirectPut',
+            ExtendedS3DestinationConfiguration={
+                'BucketARN': f"arn:aws:s3:::{RAW_BUCKET}",
+                'RoleARN': f"arn:aws:iam::{ACCOUNT_ID}:role/firehose-delivery",
+                'Prefix': raw_prefix
+            }
+        )
+
+        athena = LocalAthena(s3_client, glue_client, DATABASE_NAME)
+
+        def client(service_name, *args, **kwargs):
+            if service_name == 'athena':
+                return athena
+            return original_client(service_name, *args, **kwargs)
+
+        boto3.client = client
+        sys.modules['awswrangler'] = _awswrangler_standin(athena)
+        sys.path.insert(0, lambda_dir)
+        import lambda_runtime
+        import open_meteo_fetcher
+        # clients and pools cached by the Lambdas must not outlive this stack
+        lambda_runtime.reset()
+        original_url = open_meteo_fetcher.OPEN_METEO_FORECAST_URL
+        stack = LocalStack(athena, server, raw_prefix)
+        open_meteo_fetcher.OPEN_METEO_FORECAST_URL = stack.forecast_url
+        try:
+            yield stack
+        finally:
+            lambda_runtime.reset()
+            open_meteo_fetcher.OPEN_METEO_FORECAST_URL = original_url
+            sys.path.remove(lambda_dir)
+            boto3.client = original_client
+            if saved_awswrangler is None:
+                sys.modules.pop('awswrangler', None)
+            else:
+                sys.modules['awswrangler'] = saved_awswrangler
+            server.shutdown()
+            for key, value in saved_env.items():
+                if value is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = value
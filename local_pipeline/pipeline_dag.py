@@ -0,0 +1,179 @@
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+
+# Minimal DAG runner for the pipeline stages
+# Every stage starts as soon as all of its dependencies have succeeded, so
+# independent stages (e.g. rollups and metadata extraction after publish) overlap.
+# Per-stage status and wall time are written to a JSON state file after every
+# stage, and a later run with resume=True skips the stages that already succeeded.
+
+
+class StageFailed(Exception):
+    pass
+
+
+class Stage:
+    """
+    One pipeline step: action(context) runs it and returns a JSON-serializable result
+    """
+
+    def __init__(self, name, action, depends_on=()):
+        self.name = name
+        self.action = action
+        self.depends_on = tuple(depends_on)
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def validate(stages):
+    """
+    Reject duplicate names, unknown dependencies and cycles
+    Returns the stages by name
+    """
+    by_name = {}
+    for stage in stages:
+        if stage.name in by_name:
+            raise ValueError(f"Duplicate stage name: {stage.name}")
+        by_name[stage.name] = stage
+    for stage in stages:
+        for dependency in stage.depends_on:
+            if dependency not in by_name:
+                raise ValueError(f"Stage {stage.name} depends on unknown stage {dependency}")
+
+    visiting, done = set(), set()
+
+    def visit(name, path):
+        if name in done:
+            return
+        if name in visiting:
+            raise ValueError(f"Dependency cycle: {' -> '.join(path + [name])}")
+        visiting.add(name)
+        for dependency in by_name[name].depends_on:
+            visit(dependency, path + [name])
+        visiting.discard(name)
+        done.add(name)
+
+    for stage in stages:
+        visit(stage.name, [])
+    return by_name
+
+
+def load_state(path):
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_state(path, state):
+    if not path:
+        return
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2, default=str)
+    os.replace(tmp_path, path)
+
+
+def run_pipeline(stages, context=None, state_path=None, resume=False, max_workers=4, log=print):
+    """
+    Run the stages as a DAG and return the run state
+    A failed stage does not stop independent branches; its dependents are marked skipped
+    """
+    by_name = validate(stages)
+    previous = load_state(state_path) if resume else None
+
+    state = {
+        'started_at': _now(),
+        'finished_at': None,
+        'resumed_from': previous.get('started_at') if previous else None,
+        'stages': {name: {'status': 'pending'} for name in by_name}
+    }
+    if previous:
+        for name, entry in previous.get('stages', {}).items():
+            if name in by_name and entry.get('status') == 'succeeded':
+                state['stages'][name] = dict(entry, reused=True)
+                log(f"[{name}] succeeded in a previous run, skipping")
+
+    started = time.perf_counter()
+    running = {}
+
+    def status(name):
+        return state['stages'][name]['status']
+
+    def run_stage(stage):
+        stage_started = time.perf_counter()
+        try:
+            result = stage.action(context)
+            return 'succeeded', result, None, time.perf_counter() - stage_started
+        except BaseException as e:
+            # Glue scripts report failure through sys.exit
+            if isinstance(e, SystemExit) and e.code in (None, 0):
+                return 'succeeded', None, None, time.perf_counter() - stage_started
+            if isinstance(e, KeyboardInterrupt):
+                raise
+            return 'failed', None, f"{type(e).__name__}: {e}", time.perf_counter() - stage_started
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while True:
+            # skip the dependents of failed stages, start every stage whose dependencies succeeded
+            for name, stage in by_name.items():
+                if status(name) != 'pending':
+                    continue
+                dependency_states = [status(dependency) for dependency in stage.depends_on]
+                if any(s in ('failed', 'skipped') for s in dependency_states):
+                    state['stages'][name] = {'status': 'skipped'}
+                    log(f"[{name}] skipped, a dependency did not succeed")
+                elif all(s == 'succeeded' for s in dependency_states):
+                    state['stages'][name] = {'status': 'running', 'started_at': _now()}
+                    log(f"[{name}] started")
+                    running[executor.submit(run_stage, stage)] = name
+
+            if not running:
+                if any(status(name) == 'pending' for name in by_name):
+                    continue
+                break
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                outcome, result, error, seconds = future.result()
+                state['stages'][name].update({
+                    'status': outcome,
+                    'finished_at': _now(),
+                    'wall_seconds': round(seconds, 3),
+                    'result': result,
+                    'error': error
+                })
+                log(f"[{name}] {outcome} in {seconds:.2f}s" + (f": {error}" if error else ""))
+            save_state(state_path, state)
+
+    state['finished_at'] = _now()
+    state['wall_seconds'] = round(time.perf_counter() - started, 3)
+    state['succeeded'] = all(entry['status'] == 'succeeded' for entry in state['stages'].values())
+    save_state(state_path, state)
+    return state
+
+
+def format_timings(state):
+    """
+    Per-stage wall time table; the sum of stage times against the run's wall time shows the overlap
+    """
+    lines = [f"{'stage':<12} {'status':<16} {'wall s':>8}"]
+    stage_total = 0.0
+    for name, entry in state['stages'].items():
+        seconds = entry.get('wall_seconds')
+        if seconds is not None and not entry.get('reused'):
+            stage_total += seconds
+        shown = '-' if seconds is None else f"{seconds:.2f}"
+        label = entry['status'] + (' (prev)' if entry.get('reused') else '')
+        lines.append(f"{name:<12} {label:<16} {shown:>8}")
+    lines.append(f"stages {stage_total:.2f}s, wall {state['wall_seconds']:.2f}s")
+    return "\n".join(lines)
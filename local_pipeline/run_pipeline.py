@@ -0,0 +1,169 @@
+import argparse
+import json
+import os
+import runpy
+import sys
+import time
+
+from pipeline_dag import Stage, StageFailed, format_timings, run_pipeline
+
+# Runs the pipeline's existing Lambda handlers and Glue scripts as a DAG, in-process:
+#
+#   ingest -> crawl -> [delete ->] create -> [compact ->] dq -> publish -> rollup
+#                                                                      \-> metadata
+#
+# rollup and metadata only depend on publish, so they run side by side.
+# --local runs everything against in-memory stand-ins (moto, DuckDB, a fake
+# Open-Meteo API); without it the scripts talk to the real AWS account.
+#
+#   python local_pipeline/run_pipeline.py --local
+#   python local_pipeline/run_pipeline.py --state run_state.json --resume
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAMBDA_DIR = os.path.join(REPO_DIR, 'lambda')
+GLUE_DIR = os.path.join(REPO_DIR, 'glue_jobs')
+
+sys.path.insert(0, GLUE_DIR)
+sys.path.insert(0, LAMBDA_DIR)
+
+from job_args import job_arguments  # noqa: E402
+
+
+def glue_job(script, *args):
+    """
+    Stage action running a Glue script as __main__ with its job arguments
+    """
+    def action(context):
+        with job_arguments([script, *args]):
+            runpy.run_path(os.path.join(GLUE_DIR, script), run_name='__main__')
+    return action
+
+
+def ingest(context):
+    handler = runpy.run_path(os.path.join(LAMBDA_DIR, 'historical_weather_data_lambda_put_record_batch.py'))
+    event = {
+        'start_date': context['start_date'],
+        'end_date': context['end_date'],
+        'locations_config': context['locations_config']
+    }
+    if context.get('seen_index'):
+        event['seen_index'] = context['seen_index']
+    if context.get('sink'):
+        event['sink'] = context['sink']
+    if context.get('backfill_window_days'):
+        event.update(backfill=True, window_days=context['backfill_window_days'])
+        if context.get('backfill_checkpoints'):
+            event['checkpoints'] = context['backfill_checkpoints']
+    return handler['lambda_handler'](event, None)
+
+
+def crawl(context):
+    if context['stack'] is not None:
+        context['stack'].register_raw_table()
+        return {'raw_table': 'registered'}
+    if not context['crawler']:
+        return {'raw_table': 'crawler not given, assuming it is scheduled'}
+
+    import boto3
+    glue_client = boto3.client('glue')
+    glue_client.start_crawler(Name=context['crawler'])
+    while glue_client.get_crawler(Name=context['crawler'])['Crawler']['State'] != 'READY':
+        time.sleep(10)
+    last_crawl = glue_client.get_crawler(Name=context['crawler'])['Crawler'].get('LastCrawl', {})
+    if last_crawl.get('Status') != 'SUCCEEDED':
+        raise StageFailed(f"Crawler {context['crawler']} ended {last_crawl.get('Status')}: {last_crawl.get('ErrorMessage')}")
+    return {'raw_table': 'crawled'}
+
+
+def extract_metadata(context):
+    handler = runpy.run_path(os.path.join(LAMBDA_DIR, 'weather_data_metadata_extractor.py'))
+    response = handler['lambda_handler']({}, None)
+    body = json.loads(response['body'])
+    if response['statusCode'] != 200:
+        raise StageFailed(body.get('message'))
+    return body.get('metadata_summary')
+
+
+def build_stages(full_refresh=False, transform_backend=None, compact=False):
+    mode = ['--mode', 'full'] if full_refresh else []
+    backend = ['--transform-backend', transform_backend] if transform_backend else []
+    stages = [
+        Stage('ingest', ingest),
+        Stage('crawl', crawl, ['ingest'])
+    ]
+    if full_refresh:
+        # the delete job drops the transformed table, which only makes sense before a full rebuild
+        stages.append(Stage('delete', glue_job('delete_parquet_weather_table_s3_athena.py'), ['crawl']))
+    stages.append(Stage('create', glue_job('create_parquet_weather_table_glue_job.py', *mode, *backend),
+                        ['delete'] if full_refresh else ['crawl']))
+    if compact:
+        # merge small raw and Parquet files before anything downstream reads them
+        stages.append(Stage('compact', glue_job('compact_weather_files_glue_job.py'), ['create']))
+    stages += [
+        Stage('dq', glue_job('dq_checks_parquet_weather_table.py'), ['compact'] if compact else ['create']),
+        Stage('publish', glue_job('publish_prod_parquet_weather_table.py', *mode), ['dq']),
+        Stage('rollup', glue_job('rollup_weather_tables_glue_job.py', *mode), ['publish']),
+        Stage('metadata', extract_metadata, ['publish'])
+    ]
+    return stages
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the weather pipeline as a DAG")
+    parser.add_argument('--local', action='store_true', help="run against in-memory stand-ins instead of AWS")
+    parser.add_argument('--state', help="JSON file recording per-stage status and wall time")
+    parser.add_argument('--resume', action='store_true', help="skip stages that succeeded in the --state run")
+    parser.add_argument('--full-refresh', action='store_true', help="drop and rebuild instead of incremental runs")
+    parser.add_argument('--start-date', default='2025-01-01')
+    parser.add_argument('--end-date', default='2025-04-16')
+    parser.add_argument('--locations-config', default=os.path.join(LAMBDA_DIR, 'locations.example.json'))
+    parser.add_argument('--sink', choices=['firehose', 'parquet'], help="ingest sink (default: the Lambda's OUTPUT_SINK)")
+    parser.add_argument('--seen-index', help="file (or s3:// prefix) of days already ingested per location")
+    parser.add_argument('--backfill-window-days', type=int,
+                        help="ingest in backfill mode, streaming windows of this many days per location")
+    parser.add_argument('--backfill-checkpoints', help="file (or s3:// prefix) of per-window backfill checkpoints")
+    parser.add_argument('--crawler', help="Glue crawler to start after ingestion (AWS runs only)")
+    parser.add_argument('--transform-backend', choices=['auto', 'athena', 'local'],
+                        help="where the create job transforms the raw data (the job's own default is auto)")
+    parser.add_argument('--compact', action='store_true', help="run the compaction job between create and dq")
+    parser.add_argument('--raw-prefix', default='raw/',
+                        help="where the local Firehose writes raw data; '' for the bucket root (--local only)")
+    parser.add_argument('--max-workers', type=int, default=4, help="stages run concurrently at most")
+    args = parser.parse_args(argv)
+    if args.resume and not args.state:
+        parser.error("--resume needs --state")
+    if args.resume and args.local:
+        # the stand-ins keep their data in memory, so a new process starts from empty buckets
+        parser.error("--resume cannot be combined with --local: the local stand-ins do not outlive the process")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    context = {
+        'stack': None,
+        'start_date': args.start_date,
+        'end_date': args.end_date,
+        'locations_config': args.locations_config,
+        'crawler': args.crawler,
+        'seen_index': args.seen_index,
+        'sink': args.sink,
+        'backfill_window_days': args.backfill_window_days,
+        'backfill_checkpoints': args.backfill_checkpoints
+    }
+    stages = build_stages(args.full_refresh, args.transform_backend, args.compact)
+
+    if args.local:
+        from local_stack import local_stack
+        with local_stack(LAMBDA_DIR, args.raw_prefix) as stack:
+            context['stack'] = stack
+            state = run_pipeline(stages, context, args.state, max_workers=args.max_workers)
+    else:
+        state = run_pipeline(stages, context, args.state, resume=args.resume, max_workers=args.max_workers)
+
+    print(format_timings(state))
+    return 0 if state['succeeded'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())